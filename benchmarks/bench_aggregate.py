@@ -0,0 +1,28 @@
+# single-pass FleetAggregate throughput over classified results, and the cost of serializing and merging the
+# aggregates of many parts. "python bench_aggregate.py [count]", 1000000 results by default
+from __future__ import print_function
+import sys
+import json
+from itertools import cycle, islice
+from time import time
+
+
+def main():
+    from infi.winver.batch import classify
+    from infi.winver.aggregate import aggregate, FleetAggregate
+    from infi.winver.tests import _corpus
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    results = [classify(snapshot) for snapshot in _corpus()]
+    start = time()
+    fleet = aggregate(islice(cycle(results), count))
+    print("aggregating %d results %14.0f results/sec, %d groups" % (count, count / (time() - start), len(fleet)))
+    parts = [json.dumps(fleet.to_dict()) for _ in range(1000)]
+    start = time()
+    total = FleetAggregate()
+    for part in parts:
+        total.merge(FleetAggregate.from_dict(json.loads(part)))
+    print("merging %d serialized parts %14.0f parts/sec" % (len(parts), len(parts) / (time() - start)))
+
+
+if __name__ == '__main__':
+    main()
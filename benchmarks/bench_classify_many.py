@@ -0,0 +1,23 @@
+# classify_many throughput with 1, 2, 4 and 8 worker processes.
+# "python bench_classify_many.py [count]", a synthetic corpus of 1000000 snapshots by default
+from __future__ import print_function
+import sys
+from itertools import cycle, islice
+from time import time
+
+
+def main():
+    from infi.winver import classify_many
+    from infi.winver.tests import _corpus
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    corpus = _corpus()
+    print("classifying %d snapshots" % count)
+    for workers in (1, 2, 4, 8):
+        start = time()
+        for _ in classify_many(islice(cycle(corpus), count), workers=workers, chunksize=1024):
+            pass
+        print("  %d workers %14.0f snapshots/sec" % (workers, count / (time() - start)))
+
+
+if __name__ == '__main__':
+    main()
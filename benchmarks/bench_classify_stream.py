@@ -0,0 +1,25 @@
+# records/sec of the winver-classify pipeline (records.classify_stream), NDJSON in and out.
+# "python bench_classify_stream.py [count]", 200000 records by default
+from __future__ import print_function
+import os
+import sys
+import json
+from itertools import cycle, islice
+from time import time
+
+
+def main():
+    from infi.winver.records import classify_stream
+    from infi.winver.tests import _corpus
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = [json.dumps(snapshot) + '\n' for snapshot in _corpus()]
+    print("classifying %d NDJSON records" % count)
+    with open(os.devnull, 'w') as output:
+        for workers in (1, 2, 4, 8):
+            start = time()
+            classify_stream(islice(cycle(lines), count), output, workers=workers, chunksize=1024)
+            print("  -j %d %14.0f records/sec" % (workers, count / (time() - start)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+# classification throughput: the analyze_* methods one host at a time compared to the NumPy columnar engine.
+# "python bench_columnar.py [count]", 1000000 hosts by default
+from __future__ import print_function
+import sys
+from time import time
+
+
+def rate(name, count, func):
+    start = time()
+    func()
+    print("%-60s %14.0f hosts/sec" % (name, count / (time() - start)))
+
+
+def main():
+    import numpy
+    from infi.winver.columnar import classify_columns
+    from infi.winver.tests import _columnar_rows, _scalar_classify
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    sample = _columnar_rows(10000)
+    columns = [numpy.resize(numpy.array(column, dtype=numpy.int64), count) for column in zip(*sample)]
+    scalar_rows = sample
+    result = classify_columns(*columns)
+    hosts = [_scalar_classify(row) for row in scalar_rows]
+    print("%d hosts" % count)
+    rate("  analyze_* per host", len(scalar_rows), lambda: [_scalar_classify(row) for row in scalar_rows])
+    rate("  classify_columns", count, lambda: classify_columns(*columns))
+    rate("  greater_than('Windows Server 2016') per host", len(scalar_rows),
+         lambda: [windows.greater_than('Windows Server 2016') for windows in hosts])
+    rate("  columnar greater_than('Windows Server 2016')", count, lambda: result.greater_than('Windows Server 2016'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+# wall-clock time of Windows.analyze() with and without concurrent probes, on snapshots replayed with delayed probes
+from __future__ import print_function
+from time import time
+
+
+def main():
+    from infi.winver import Windows
+    from infi.winver.backends import ReplayBackend
+    from infi.winver.tests import SNAPSHOTS, DelayedBackend, SLOW_PROBES
+    print("probe delays: %s" % ", ".join("%s=%.2fs" % item for item in sorted(SLOW_PROBES.items())))
+    for record in SNAPSHOTS:
+        print(record['name'])
+        for concurrent in (False, True):
+            windows = Windows(backend=DelayedBackend(ReplayBackend(record['snapshot']), SLOW_PROBES))
+            start = time()
+            windows.analyze(concurrent=concurrent)
+            print("  %-12s %8.3f seconds" % ("concurrent" if concurrent else "serial", time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# the binary corpus format compared to the same snapshots as NDJSON: size, writing, scanning the structures,
+# random access and classification. "python bench_corpus.py [count]", 200000 snapshots by default
+from __future__ import print_function
+import os
+import sys
+import json
+import random
+from itertools import cycle, islice
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+
+def rate(name, count, func):
+    start = time()
+    func()
+    print("%-60s %14.0f records/sec" % (name, count / (time() - start)))
+
+
+def main():
+    from infi.winver.backends import ReplayBackend
+    from infi.winver.batch import classify, classify_backend
+    from infi.winver.corpus import write_corpus, CorpusReader
+    from infi.winver.tests import _corpus
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    snapshots = list(islice(cycle(_corpus()), count))
+    directory = mkdtemp()
+    try:
+        ndjson_path = os.path.join(directory, "corpus.ndjson")
+        corpus_path = os.path.join(directory, "corpus.bin")
+
+        def write_ndjson():
+            with open(ndjson_path, 'w') as fd:
+                for snapshot in snapshots:
+                    fd.write(json.dumps(snapshot) + '\n')
+        print("%d snapshots" % count)
+        rate("  write NDJSON", count, write_ndjson)
+        rate("  write corpus", count, lambda: write_corpus(corpus_path, snapshots))
+        print("  size: NDJSON %.1f MB, corpus %.1f MB" % (os.path.getsize(ndjson_path) / 1e6,
+                                                         os.path.getsize(corpus_path) / 1e6))
+
+        def scan_ndjson():
+            with open(ndjson_path) as fd:
+                for line in fd:
+                    backend = ReplayBackend(json.loads(line))
+                    backend.get_version_ex()
+                    backend.get_system_info()
+
+        def scan_corpus():
+            with CorpusReader(corpus_path) as reader:
+                for backend in reader:
+                    backend.get_version_ex()
+                    backend.get_system_info()
+        rate("  scan NDJSON to structures", count, scan_ndjson)
+        rate("  scan corpus to structures", count, scan_corpus)
+
+        numbers = [random.randrange(count) for _ in range(10000)]
+
+        def random_ndjson():
+            with open(ndjson_path) as fd:
+                lines = fd.readlines()
+            for number in numbers:
+                ReplayBackend(json.loads(lines[number])).get_version_ex()
+
+        def random_corpus():
+            with CorpusReader(corpus_path) as reader:
+                for number in numbers:
+                    reader[number].get_version_ex()
+        rate("  10000 random records from NDJSON (open + read)", len(numbers), random_ndjson)
+        rate("  10000 random records from corpus (open + read)", len(numbers), random_corpus)
+
+        def classify_ndjson():
+            with open(ndjson_path) as fd:
+                for line in fd:
+                    classify(json.loads(line))
+
+        def classify_corpus():
+            with CorpusReader(corpus_path) as reader:
+                for backend in reader:
+                    classify_backend(backend)
+        rate("  classify NDJSON", count, classify_ndjson)
+        rate("  classify corpus", count, classify_corpus)
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# load test of the detection daemon: requests/sec with 1 to 32 concurrent client processes, each with its own
+# DetectionClient, against a daemon serving a replayed snapshot. for comparison, a replayed detection in-process; a
+# live one also pays for the Win32 calls, the registry and possibly dism.
+# "python bench_daemon.py [requests per client]", 2000 by default
+from __future__ import print_function
+import os
+import sys
+from time import time
+from multiprocessing import Pool
+
+
+def _client(args):
+    from infi.winver.daemon import DetectionClient
+    address, count = args
+    with DetectionClient(address, fallback=False) as client:
+        client.get_result()
+        start = time()
+        for _ in range(count):
+            client.get_result()
+        return time() - start
+
+
+def main():
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    from infi.winver import Windows
+    from infi.winver.backends import ReplayBackend
+    from infi.winver.daemon import DetectionServer, DetectionClient
+    from infi.winver.tests import SNAPSHOTS
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    snapshot = SNAPSHOTS[0]['snapshot']
+    directory = mkdtemp()
+    address = os.path.join(directory, 'winver.sock')
+    try:
+        with DetectionServer(address, ReplayBackend(snapshot)).start():
+            start = time()
+            for _ in range(count):
+                Windows(backend=ReplayBackend(snapshot)).freeze()
+            print("in-process detection (replayed) %12.0f detections/sec" % (count / (time() - start)))
+            with DetectionClient(address, fallback=False) as client:
+                start = time()
+                for _ in range(count):
+                    client.check("Windows Server 2012+ and x64")
+                print("daemon requirement queries      %12.0f requests/sec" % (count / (time() - start)))
+            for clients in (1, 4, 16, 32):
+                pool = Pool(clients)
+                try:
+                    start = time()
+                    pool.map(_client, [(address, count)] * clients)
+                    elapsed = time() - start
+                finally:
+                    pool.close()
+                    pool.join()
+                print("  %2d clients %14.0f requests/sec" % (clients, clients * count / elapsed))
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
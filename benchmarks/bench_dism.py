@@ -0,0 +1,38 @@
+# time-to-answer of the streaming dism reader compared to waiting for dism to exit and scanning its whole output,
+# using a fake dism that prints a large table slowly
+from __future__ import print_function
+from time import time
+
+
+def wait_and_scan(command):
+    # what analyze_server_core_according_to_dism used to do
+    from infi.execute import execute
+    pid = execute(command)
+    return any("ServerCore-FullServer" in line and "Disabled" in line
+               for line in pid.get_stdout().decode().splitlines())
+
+
+def stream(command):
+    from infi.winver.dism import read_features, is_server_core
+    return is_server_core(read_features(command, timeout=60))
+
+
+def main():
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    from infi.winver.tests import fake_dism_command
+    directory = mkdtemp()
+    try:
+        for lines, feature_at, delay in ((2000, 100, 0.001), (2000, 1000, 0.001), (20000, 10, 0)):
+            command = fake_dism_command(directory, lines, feature_at, delay)
+            print("%d lines, ServerCore-FullServer at line %d, %.3f seconds per line" % (lines, feature_at, delay))
+            for name, func in (("wait and scan", wait_and_scan), ("stream", stream)):
+                start = time()
+                assert func(command)
+                print("  %-20s %8.3f seconds" % (name, time() - start))
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# "import infi.winver" time, from -X importtime of a new interpreter with cached bytecode (python 3.8 or later),
+# compared to importing pkg_resources, which the infi namespace package only uses when it is already imported
+from __future__ import print_function
+
+
+def import_times(statement="import infi.winver"):
+    # runs "statement" with -X importtime in a new interpreter, and returns the cumulative import time of every module
+    # it imported, in microseconds. the bytecode is written to a temporary directory by a first run, so the times do
+    # not include compiling
+    import os
+    import sys
+    import subprocess
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    directory = mkdtemp()
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    try:
+        for _ in range(2):
+            process = subprocess.Popen([sys.executable, '-X', 'importtime', '-X', 'pycache_prefix=' + directory,
+                                        '-c', statement], stderr=subprocess.PIPE, env=env)
+            _, stderr = process.communicate()
+    finally:
+        rmtree(directory)
+    times = {}
+    for line in stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    runs = [import_times() for _ in range(5)]
+    best = min(times['infi.winver'] for times in runs)
+    print("import infi.winver %10d us" % best)
+    times = min(runs, key=lambda times: times['infi.winver'])
+    for name, cumulative in sorted(times.items(), key=lambda item: -item[1]):
+        if not name.startswith('infi'):
+            continue
+        print("  %-40s %10d us" % (name, cumulative))
+    pkg_resources = min(import_times("import pkg_resources").get('pkg_resources', 0) for _ in range(3))
+    print("import pkg_resources %8d us" % pkg_resources)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# the cost of the instrumentation hooks: a replayed detection with no hook registered, compared to the same
+# detection with the probes called directly (the code before the hooks), and with a hook that records the events
+from __future__ import print_function
+from common import measure
+
+
+def main():
+    from infi.winver import Windows
+    from infi.winver import instrumentation
+    from infi.winver.backends import ReplayBackend
+    from infi.winver.tests import SNAPSHOTS
+    backends = [ReplayBackend(record['snapshot']) for record in SNAPSHOTS]
+
+    def detect():
+        for backend in backends:
+            Windows(backend=backend).freeze()
+
+    run_probe = instrumentation.run_probe
+    print("detecting %d replayed hosts" % len(backends))
+    instrumentation.run_probe = lambda probe, function, *args: function(*args)
+    try:
+        direct = measure("  probes called directly", detect)
+    finally:
+        instrumentation.run_probe = run_probe
+    disabled = measure("  no hooks registered", detect)
+    with instrumentation.record_events():
+        enabled = measure("  recording events", detect)
+    print("  overhead with no hooks %.1f%%, with a recorder %.1f%%" % (100.0 * (direct / disabled - 1),
+                                                                      100.0 * (direct / enabled - 1)))
+    measure("  run_probe with no hooks (one call)", lambda: run_probe('version_ex', int))
+    measure("  direct call (one call)", lambda: int())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# classify_many with and without the memo, on a fleet where most hosts share a snapshot: hosts are drawn from the
+# test corpus with Zipf-like weights and a random UBR, and about 2% of them have a build of their own.
+# "python bench_memo.py [count]", 200000 snapshots by default
+from __future__ import print_function
+import sys
+import random
+from time import time
+
+
+def fleet(count, seed=0):
+    from infi.winver.backends import CURRENT_VERSION_KEY
+    from infi.winver.tests import _corpus
+    corpus = _corpus()
+    weights = [1.0 / rank for rank in range(1, len(corpus) + 1)]
+    rng = random.Random(seed)
+    snapshots = []
+    for snapshot in rng.choices(corpus, weights, k=count):
+        if CURRENT_VERSION_KEY in snapshot['registry']:
+            values = dict(snapshot['registry'][CURRENT_VERSION_KEY]['values'], UBR=rng.randrange(5000))
+            if rng.random() < 0.02:
+                values['CurrentBuildNumber'] = str(rng.randrange(10240, 30000))
+            snapshot = dict(snapshot, registry=dict(snapshot['registry'], **{CURRENT_VERSION_KEY: dict(values=values)}))
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def main():
+    from infi.winver import classify_many
+    from infi.winver.memo import get_memo
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    snapshots = fleet(count)
+    print("classifying %d snapshots" % count)
+    rates = {}
+    for memo in (False, True):
+        start = time()
+        for _ in classify_many(snapshots, chunksize=1024, memo=memo):
+            pass
+        rates[memo] = count / (time() - start)
+        print("  memo=%-5s %14.0f snapshots/sec" % (memo, rates[memo]))
+    stats = get_memo().get_stats()
+    print("  hit ratio %.1f%%, %d results kept, speedup %.1fx" % (
+        100.0 * stats['hits'] / (stats['hits'] + stats['misses']), stats['size'], rates[True] / rates[False]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# product type classification: the if/elif chain over the PRODUCT_SUITE_* lists compared to the product table
+from common import measure
+
+
+def main():
+    from infi.winver.products import classify_product
+    from infi.winver.tests import _branch_windows6_edition, _product_constants
+    product_types = [product_type for _, product_type in _product_constants()]
+
+    def branches():
+        for product_type in product_types:
+            _branch_windows6_edition(product_type)
+
+    def table():
+        for product_type in product_types:
+            classify_product(product_type)
+    print("classifying all %d product types" % len(product_types))
+    measure("  if/elif chain", branches)
+    measure("  product table", table)
+
+
+if __name__ == '__main__':
+    main()
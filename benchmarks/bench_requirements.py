@@ -0,0 +1,60 @@
+# requirement expressions: compiling thousands of rules, and evaluating them against recorded hosts
+from __future__ import print_function
+from itertools import product
+from common import measure
+
+VERSIONS = ('Windows 7', 'Windows Server 2008 R2', 'Windows Server 2012 R2', 'Windows 10', 'Windows Server 2016',
+            'Windows Server 2019', 'Windows 11', 'Windows Server 2022')
+FLAGS = ('x64', 'not x86', 'not server_core', 'hyper_v', 'cluster_aware', 'edition == Datacenter',
+         'service_pack >= 1')
+
+
+def get_rules():
+    rules = []
+    for version, flag, other in product(VERSIONS, FLAGS, VERSIONS):
+        rules.append("{}+ and {} or {}".format(version, flag, other))
+        rules.append("({} or < {}) and {}".format(version, other, flag))
+        rules.append("Windows 10 >= {} and {} or {}".format(1507 + len(rules) % 500, flag, other))
+    return rules
+
+
+def main():
+    from infi.winver import requirement
+    from infi.winver.requirements import compile_requirement
+    from infi.winver.tests import _recorded_hosts, _chained_rule, RequirementTestCase
+    hosts = _recorded_hosts()
+    rules = get_rules()
+    compiled = [requirement(rule) for rule in rules]
+
+    def compile_all():
+        for rule in rules:
+            compile_requirement(rule)
+
+    def cached():
+        for rule in rules:
+            requirement(rule)
+
+    def evaluate():
+        for rule in compiled:
+            for windows in hosts:
+                rule(windows)
+    rule = requirement(RequirementTestCase.RULE)
+
+    def chained():
+        for windows in hosts:
+            _chained_rule(windows)
+
+    def one_rule():
+        for windows in hosts:
+            rule(windows)
+    print("%d rules, %d recorded hosts" % (len(rules), len(hosts)))
+    measure("  compile all rules", compile_all, repeat=3)
+    measure("  requirement() of all rules (cached)", cached)
+    measure("  evaluate all rules on all hosts", evaluate, repeat=3)
+    print("one rule on all hosts")
+    measure("  is_* / greater_than calls", chained)
+    measure("  compiled requirement", one_rule)
+
+
+if __name__ == '__main__':
+    main()
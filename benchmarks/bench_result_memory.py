@@ -0,0 +1,37 @@
+# memory of analyzed Windows instances compared to DetectionResult, measured with tracemalloc.
+# "python bench_result_memory.py [count]", 1000000 hosts by default (this takes a while, tracemalloc is slow)
+from __future__ import print_function
+import sys
+import tracemalloc
+
+
+def allocate(factory, count):
+    tracemalloc.start()
+    objects = [factory(index) for index in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objects, size
+
+
+def main():
+    from infi.winver import Windows
+    from infi.winver.backends import ReplayBackend
+    from infi.winver.result import DetectionResult
+    from infi.winver.tests import SNAPSHOTS, _release_snapshots
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    snapshots = [record['snapshot'] for record in SNAPSHOTS] + _release_snapshots()
+    backends = [ReplayBackend(snapshot) for snapshot in snapshots]
+
+    def windows(index):
+        return Windows(backend=backends[index % len(backends)]).freeze()
+
+    def result(index):
+        return DetectionResult.from_windows(windows(index))
+    for name, factory in (("Windows", windows), ("DetectionResult", result)):
+        objects, size = allocate(factory, count)
+        print("%-20s %10d hosts %14.1f MB %8.0f bytes/host" % (name, count, size / 1e6, float(size) / count))
+        del objects
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# parse throughput of the ctypes structures compared to the infi.instruct ones they replace
+from common import measure
+
+
+def main():
+    from infi.winver.structures import OSVersionEx, SystemInfo, OSVersionExStructure, SystemInfoStructure
+    from infi.winver.structures import from_buffer, to_bytes
+    from infi.winver.tests import EXAMPLES
+    version_ex_bytes = EXAMPLES[0]['OSVersionEx'].encode('latin-1')
+    system_info_bytes = EXAMPLES[0]['SystemInfo'].encode('latin-1')
+    version_ex_buffer = bytearray(version_ex_bytes)
+    system_info_buffer = bytearray(system_info_bytes)
+
+    print("OSVersionEx")
+    measure("  infi.instruct create_from_string",
+            lambda: OSVersionEx.create_from_string(version_ex_bytes).major_version)
+    measure("  infi.instruct round trip (old get_version_ex)",
+            lambda: OSVersionEx.create_from_string(OSVersionEx.write_to_string(
+                OSVersionEx.create_from_string(version_ex_bytes))).major_version)
+    measure("  ctypes from_buffer (bytearray, zero-copy)",
+            lambda: from_buffer(OSVersionExStructure, version_ex_buffer).major_version)
+    measure("  ctypes from_buffer (bytes, one copy)",
+            lambda: from_buffer(OSVersionExStructure, version_ex_bytes).major_version)
+    measure("  ctypes to_bytes", lambda: to_bytes(from_buffer(OSVersionExStructure, version_ex_buffer)))
+
+    print("SystemInfo")
+    measure("  infi.instruct create_from_string",
+            lambda: SystemInfo.create_from_string(system_info_bytes).processor_architecture)
+    measure("  ctypes from_buffer (bytearray, zero-copy)",
+            lambda: from_buffer(SystemInfoStructure, system_info_buffer).processor_architecture)
+    measure("  ctypes from_buffer (bytes, one copy)",
+            lambda: from_buffer(SystemInfoStructure, system_info_bytes).processor_architecture)
+
+
+if __name__ == '__main__':
+    main()
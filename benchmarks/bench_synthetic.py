@@ -0,0 +1,24 @@
+# synthetic snapshot generation rate, and the differential harness comparing Windows.analyze to DetectionResult
+# classification with and without the memo. "python bench_synthetic.py [count]", 20000 snapshots by default
+from __future__ import print_function
+import sys
+from time import time
+
+
+def main():
+    from infi.winver.batch import classify
+    from infi.winver.differential import compare
+    from infi.winver.memo import ClassificationMemo
+    from infi.winver.synthetic import generate_snapshots
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    start = time()
+    snapshots = list(generate_snapshots(count))
+    print("generating %d snapshots %14.0f snapshots/minute" % (count, 60 * count / (time() - start)))
+    print("Windows.analyze vs classify:")
+    print(compare(classify, snapshots))
+    print("Windows.analyze vs the memo:")
+    print(compare(ClassificationMemo().classify, snapshots))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# version comparison: greater_than over name_to_version tuples compared to WindowsVersion
+from common import measure
+
+
+def main():
+    from infi.winver import name_to_version
+    from infi.winver.version import WindowsVersion
+    from infi.winver.tests import _hosts, _tuple_greater_than
+    hosts = list(_hosts())
+    names = sorted(name_to_version)
+    versions = [WindowsVersion(name) for name in names]
+    for windows in hosts:
+        windows.version_info  # pylint: disable-msg=W0104
+
+    def tuples():
+        for windows in hosts:
+            for name in names:
+                _tuple_greater_than(windows, name)
+
+    def by_name():
+        for windows in hosts:
+            for name in names:
+                windows.greater_than(name)
+
+    def by_version():
+        for windows in hosts:
+            info = windows.version_info
+            for version in versions:
+                info > version  # pylint: disable-msg=W0104
+    print("comparing %d hosts to %d versions" % (len(hosts), len(names)))
+    measure("  greater_than, name_to_version tuples", tuples)
+    measure("  greater_than, name -> WindowsVersion", by_name)
+    measure("  WindowsVersion comparison", by_version)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# helpers shared by the benchmark scripts in this directory. run a benchmark with "python benchmarks/bench_<name>.py"
+from __future__ import print_function
+import timeit
+
+
+def measure(name, func, number=None, repeat=5):
+    # returns the best ops/sec out of "repeat" runs of "number" calls
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    print("%-60s %14.0f ops/sec" % (name, 1.0 / best))
+    return 1.0 / best
+
+
+def measure_allocations(func):
+    # returns (peak, retained): the bytes allocated by one call of "func" at its peak, and the bytes still allocated
+    # after it returned, as traced by tracemalloc (python 3)
+    import gc
+    import tracemalloc
+    gc.collect()
+    # tracing starts over so the peak is only this call's; tracemalloc.reset_peak is python 3.9 or later
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before, current - before
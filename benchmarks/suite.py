@@ -0,0 +1,251 @@
+# the benchmark suite of the detection hot paths: Windows() construction and detection, structure parsing, edition
+# classification, greater_than and the is_* predicates. everything runs on replayed snapshots, so the suite runs on
+# any platform; the snapshots cover every version in version_to_name and every Windows 10 / Server 2016 and later
+# release id, including the semi-annual Server releases 1903 - 20H2.
+# every case reports ops/sec (one op is one snapshot, host or comparison) and the bytes allocated per op (the peak of
+# one pass over its inputs, divided by the number of ops), and is compared to a JSON baseline:
+#   python benchmarks/suite.py                      compare to benchmarks/baseline.json
+#   python benchmarks/suite.py --save               run and write the baseline
+#   python benchmarks/suite.py --threshold 0.1 -k greater
+# the exit code is 1 if a case is slower, or allocates more, than the baseline by more than the threshold.
+# ops/sec depend on the machine, so every run also measures a reference workload that does not use the package, and
+# the speed of a case is compared relative to it: a baseline saved on another machine only gives approximate
+# results (the ratios shift with the CPU and the Python version), so save one per machine and Python for exact ones
+# the suite runs on python 3.8 (the interpreter buildout pins) and later
+from __future__ import print_function
+import os
+import sys
+import json
+import timeit
+from binascii import hexlify
+from collections import OrderedDict
+from common import measure_allocations
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+
+# allocation differences below this many bytes per op are noise
+ALLOCATION_SLACK = 16
+
+# semi-annual Server releases between Server 2019 and 2022: (release id, build)
+SERVER_SEMI_ANNUAL_RELEASES = ((1903, 18362), (1909, 18363), (2004, 19041), (2009, 19042))
+
+# ops in a pass of the reference workload
+REFERENCE_OPS = 1000
+
+
+def _version_ex_hex(*args, **kwargs):
+    from infi.winver.synthetic import pack_version_ex
+    return hexlify(pack_version_ex(*args, **kwargs)).decode('ascii')
+
+
+def _snapshot(version_ex, product_info, registry, processor_architecture=9):
+    from infi.winver.synthetic import pack_system_info
+    return dict(format=1, version_ex=version_ex, system_info=hexlify(pack_system_info(processor_architecture)).decode(
+        'ascii'), product_info=product_info, registry=registry)
+
+
+def _release_snapshots():
+    # a Windows 10 / Server 2016 and later host for every release in releases.json
+    from infi.winver.backends import CURRENT_VERSION_KEY
+    from infi.winver.constants import VER_NT_WORKSTATION, VER_NT_SERVER, PRODUCT_PROFESSIONAL
+    from infi.winver.constants import PRODUCT_DATACENTER_SERVER
+    from infi.winver.releases import get_release_table
+    snapshots = []
+    for version, release_id, first_build in get_release_table().get_releases():
+        server = 'Server' in version
+        build_number = max(first_build, 14393 if server else 10240)
+        values = dict(CurrentMajorVersionNumber=10, CurrentMinorVersionNumber=0, CurrentVersion='6.3',
+                      CurrentBuildNumber=str(build_number), ReleaseId=str(release_id))
+        snapshots.append(_snapshot(_version_ex_hex(6, 2, 9200, VER_NT_SERVER if server else VER_NT_WORKSTATION),
+                                   PRODUCT_DATACENTER_SERVER if server else PRODUCT_PROFESSIONAL,
+                                   {CURRENT_VERSION_KEY: dict(values=values)}))
+    return snapshots
+
+
+def get_snapshots():
+    # a snapshot of every version in version_to_name, every release in releases.json and every Server release id
+    from infi.winver import version_to_name
+    from infi.winver.backends import CURRENT_VERSION_KEY, SERVER_LEVELS_KEY
+    from infi.winver.constants import VER_NT_WORKSTATION, VER_NT_SERVER, PRODUCT_DATACENTER_SERVER
+    from infi.winver.constants import PRODUCT_ENTERPRISE, PRODUCT_STANDARD_SERVER_CORE
+    builds = {(5, 0): 2195, (5, 1): 2600, (5, 2): 3790, (6, 0): 6002, (6, 1): 7601, (6, 2): 9200, (6, 3): 9600}
+    snapshots = []
+    for version in sorted(version_to_name):
+        major_version, minor_version = version[:2]
+        if major_version >= 10:
+            continue
+        product_type = version[2] if len(version) > 2 else VER_NT_SERVER
+        build_number = builds[version[:2]]
+        server = product_type != VER_NT_WORKSTATION
+        registry = {}
+        if version[:2] >= (6, 2):
+            # applications without a manifest see 6.2, the registry has the real version
+            version_ex = _version_ex_hex(6, 2, 9200, product_type)
+            registry[CURRENT_VERSION_KEY] = dict(values=dict(CurrentVersion='{}.{}'.format(*version[:2]),
+                                                             CurrentBuildNumber=str(build_number)))
+            registry[SERVER_LEVELS_KEY] = dict(values=dict(ServerCore=1)) if server else dict(error='missing')
+        else:
+            version_ex = _version_ex_hex(major_version, minor_version, build_number, product_type,
+                                         service_pack_major=1 if version[:2] >= (6, 0) else 2)
+        product_info = None if major_version < 6 else PRODUCT_DATACENTER_SERVER if server else PRODUCT_ENTERPRISE
+        snapshots.append(_snapshot(version_ex, product_info, registry, processor_architecture=0 if
+                                   version[:2] < (6, 1) else 9))
+    snapshots.extend(_release_snapshots())
+    for release_id, build_number in SERVER_SEMI_ANNUAL_RELEASES:
+        values = dict(CurrentMajorVersionNumber=10, CurrentMinorVersionNumber=0, CurrentVersion='6.3',
+                      CurrentBuildNumber=str(build_number), ReleaseId=str(release_id))
+        snapshots.append(_snapshot(_version_ex_hex(6, 2, 9200, VER_NT_SERVER), PRODUCT_STANDARD_SERVER_CORE,
+                                   {CURRENT_VERSION_KEY: dict(values=values)}))
+    return snapshots
+
+
+def _check_coverage(hosts):
+    from infi.winver import version_to_name
+    missing = set(version_to_name.values()) - set(windows.version for windows in hosts)
+    if missing:
+        raise AssertionError("the snapshots do not cover {}".format(", ".join(sorted(missing))))
+
+
+def get_cases():
+    # case name -> (function running one pass, number of ops in a pass)
+    from binascii import unhexlify
+    from infi.winver import Windows, name_to_version
+    from infi.winver import constants
+    from infi.winver.backends import ReplayBackend
+    from infi.winver.structures import OSVersionExStructure, SystemInfoStructure, from_buffer
+    snapshots = get_snapshots()
+    backends = [ReplayBackend(snapshot) for snapshot in snapshots]
+    hosts = [Windows(backend=backend).freeze() for backend in backends]
+    _check_coverage(hosts)
+    names = sorted(name_to_version)
+    checks = [getattr(windows, name) for windows in hosts for name in dir(windows) if name.startswith('is_')]
+    version_exs = [bytearray(unhexlify(snapshot['version_ex'])) for snapshot in snapshots]
+    system_infos = [bytearray(unhexlify(snapshot['system_info'])) for snapshot in snapshots]
+    products = sorted(set(value for name, value in vars(constants).items()
+                          if name.startswith('PRODUCT_') and isinstance(value, int)))
+    edition_host = Windows(backend=backends[-1])
+
+    def construct():
+        for backend in backends:
+            Windows(backend=backend)
+
+    def detect():
+        for snapshot in snapshots:
+            Windows(backend=ReplayBackend(snapshot)).freeze()
+
+    def parse_version_ex():
+        for buffer in version_exs:
+            from_buffer(OSVersionExStructure, buffer)
+
+    def parse_system_info():
+        for buffer in system_infos:
+            from_buffer(SystemInfoStructure, buffer)
+
+    def windows6_edition():
+        for product in products:
+            edition_host._edition = product  # pylint: disable-msg=W0212,W0201
+            edition_host.analyze_windows6_edition()
+
+    def greater_than():
+        for windows in hosts:
+            for name in names:
+                windows.greater_than(name)
+
+    def predicates():
+        for check in checks:
+            check()
+    return OrderedDict([
+        ('construct', (construct, len(backends))),
+        ('detect', (detect, len(snapshots))),
+        ('parse_version_ex', (parse_version_ex, len(version_exs))),
+        ('parse_system_info', (parse_system_info, len(system_infos))),
+        ('windows6_edition', (windows6_edition, len(products))),
+        ('greater_than', (greater_than, len(hosts) * len(names))),
+        ('is_predicates', (predicates, len(checks))),
+    ])
+
+
+def reference():
+    # the reference workload: dict and string operations of the kind detection does, without the package
+    values = {}
+    for number in range(REFERENCE_OPS):
+        values[number & 63] = '{:08}'.format(number)
+
+
+def run_case(func, ops, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    peak, _ = measure_allocations(func)
+    return dict(ops_per_sec=ops / best, alloc_bytes_per_op=float(peak) / ops)
+
+
+def compare(name, result, baseline, threshold, scale=1.0):
+    # returns a list of regressions of "result" compared to "baseline". "scale" is how much faster this run's
+    # reference workload is than the baseline's
+    regressions = []
+    expected = baseline['ops_per_sec'] * scale
+    if result['ops_per_sec'] < expected * (1 - threshold):
+        regressions.append("{}: {:.0f} ops/sec, baseline {:.0f} on this machine".format(name, result['ops_per_sec'],
+                                                                                       expected))
+    if result['alloc_bytes_per_op'] > baseline['alloc_bytes_per_op'] * (1 + threshold) + ALLOCATION_SLACK:
+        regressions.append("{}: {:.0f} bytes/op, baseline {:.0f}".format(name, result['alloc_bytes_per_op'],
+                                                                        baseline['alloc_bytes_per_op']))
+    return regressions
+
+
+def main(argv=None):
+    import platform
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="benchmark the detection hot paths against a baseline")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--save", action="store_true", help="write the results to the baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown / allocation growth as a fraction (default: %(default)s)")
+    parser.add_argument("-k", dest="filter", default="", help="run only the cases with this in their name")
+    args = parser.parse_args(argv)
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as fd:
+            saved = json.load(fd)
+        baseline = saved['cases']
+    results = OrderedDict()
+    regressions = []
+    print("%-20s %14s %12s %10s" % ("case", "ops/sec", "bytes/op", "vs base"))
+    # every comparison depends on it, so it gets more repeats to keep the noise down
+    results['reference'] = run_case(reference, REFERENCE_OPS, repeat=15)
+    scale = 1.0
+    if baseline:
+        if 'reference' in saved:
+            scale = results['reference']['ops_per_sec'] / saved['reference']['ops_per_sec']
+        else:
+            print("the baseline has no reference, comparing absolute ops/sec")
+    print("%-20s %14.0f %12.1f %10s" % ('reference', results['reference']['ops_per_sec'],
+                                        results['reference']['alloc_bytes_per_op'], "%.2fx" % scale))
+    for name, (func, ops) in get_cases().items():
+        if args.filter not in name:
+            continue
+        results[name] = result = run_case(func, ops)
+        change = ""
+        if name in baseline:
+            change = "%+.1f%%" % (100.0 * (result['ops_per_sec'] / (baseline[name]['ops_per_sec'] * scale) - 1))
+            regressions.extend(compare(name, result, baseline[name], args.threshold, scale))
+        print("%-20s %14.0f %12.1f %10s" % (name, result['ops_per_sec'], result['alloc_bytes_per_op'], change))
+    if args.save:
+        reference_result = results.pop('reference')
+        with open(args.baseline, 'w') as fd:
+            json.dump(dict(python=platform.python_version(), platform=platform.platform(), reference=reference_result,
+                           cases=results), fd, indent=2, sort_keys=True)
+            fd.write('\n')
+        print("saved %s" % args.baseline)
+        return 0
+    if not baseline:
+        print("no baseline at %s, run with --save to create it" % args.baseline)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
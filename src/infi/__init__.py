@@ -1 +1,7 @@
-__import__("pkg_resources").declare_namespace(__name__)
+# the infi namespace package, shared with the other infi.* distributions. pkgutil.extend_path adds their infi
+# directories on sys.path to ours without importing pkg_resources, which takes tens of milliseconds and scans every
+# installed distribution. when pkg_resources is already imported, the namespace is also declared with it, for the
+# infi.* packages (eggs included) that it manages
+__path__ = __import__('pkgutil').extend_path(__path__, __name__)
+if 'pkg_resources' in __import__('sys').modules:
+    __import__('pkg_resources').declare_namespace(__name__)
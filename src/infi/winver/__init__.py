@@ -1,4 +1,4 @@
-__import__("pkg_resources").declare_namespace(__name__)
+import threading
 
 # version numbers in Windows are very tricky and there are several places we have to look at
 # * "GetVersionEx" API will return major and minor versions that identify Windows versions lower than
@@ -36,6 +36,8 @@ version_to_name = {
     (10, 0, 1607): 'Windows Server 2016',
     (10, 0, 1809): 'Windows Server 2019',
 }
+# the naming of Windows 10 / Server 2016 and later releases is in releases.json, see releases.py.
+# the following are kept for backwards compatibility
 win10_release_id_to_update = {
     1507: 'Gold',
     1511: 'November Update',
@@ -70,29 +72,273 @@ LAST_RELEASE_ID = 2009
 
 FIRST_WIN_2022_SRVER_BUILD_NUMBER = 20285
 
-class Windows(object):  # pylint: disable-msg=R0902,R0904
-    def __init__(self):
-        from .interface import get_version_ex
-        self.hyper_v = False
-        self.architecture = ""
-        self.service_pack = ""
-        self.server_core = False
-        self.edition = ""
-        self.version = ""
-        self._version_ex = get_version_ex()
-        self.analyze()
+# every attribute of Windows is computed lazily, on first access, by the analyzer that is responsible for it.
+# the analyzers set the attribute on the instance, so the next access no longer goes through __getattr__.
+# the raw data the probes return (the underscored attributes on top) is kept the same way, so each probe runs at
+# most once per instance
+FIELD_ANALYZERS = {
+    '_version_ex': 'analyze_version_ex',
+    '_system_info': 'analyze_system_info',
+    '_product_info': 'analyze_product_info',
+    '_dism_output': 'analyze_dism_output',
+    '_major_version': 'analyze_major_minor_versions',
+    '_minor_version': 'analyze_major_minor_versions',
+    '_product_type': 'analyze_major_minor_versions',
+    '_build_number': 'analyze_major_minor_versions',
+    '_release_id': 'analyze_release_id',
+    'version': 'analyze_version',
+    'win10_update': 'analyze_version',
+    'edition': 'analyze_windows_edition',
+    'server_core': 'analyze_windows_edition',
+    'hyper_v': 'analyze_windows_edition',
+    'service_pack': 'analyze_windows_service_pack',
+    'architecture': 'analyze_windows_architecture',
+    'version_info': 'analyze_version_info',
+}
+
+FIELDS = ('version', 'win10_update', 'edition', 'server_core', 'hyper_v', 'service_pack', 'architecture')
+
+
+class WindowsChecks(object):  # pylint: disable-msg=R0904
+    # the is_* / comparison API, shared by Windows and DetectionResult (see result.py). works on the public fields
+    # and version_info
+    __slots__ = ()
+
+    def __str__(self):
+        return "%s %s Service Pack %s" % (self.version, self.edition, self.service_pack)
+
+    def is_windows_2000(self):
+        return self.version == 'Windows 2000'
+
+    def is_windows_xp(self):
+        return self.version == 'Windows XP'
+
+    def is_windows_2003(self):
+        return self.version == 'Windows Server 2003'
+
+    def is_windows_2008(self):
+        return self.version == 'Windows Server 2008'
+
+    def is_windows_2008_r2(self):
+        return self.version == 'Windows Server 2008 R2'
+
+    def is_windows_vista(self):
+        return self.version == 'Windows Vista'
+
+    def is_windows_7(self):
+        return self.version == 'Windows 7'
+
+    def is_windows_8(self):
+        return self.version == 'Windows 8'
+
+    def is_windows_10(self):
+        return self.version == 'Windows 10'
+
+    def is_windows_11(self):
+        return self.version == 'Windows 11'
+
+    def is_windows_2012(self):
+        return self.version == 'Windows Server 2012'
+
+    def is_windows_2012_r2(self):
+        return self.version == 'Windows Server 2012 R2'
+
+    def is_windows_2016(self):
+        return self.version == 'Windows Server 2016'
+
+    def is_windows_2019(self):
+        return self.version == 'Windows Server 2019'
+
+    def is_windows_2022(self):
+        return self.version == 'Windows Server 2022'
+
+    def is_windows_2025(self):
+        return self.version == 'Windows Server 2025'
+
+    def is_x86(self):
+        return self.architecture == 'x86'
+
+    def is_x64(self):
+        return self.architecture == 'x64'
 
-    def analyze(self):
+    def is_ia64(self):
+        return self.architecture == 'ia64'
+
+    def is_server_core(self):
+        return self.server_core
+
+    def is_hyper_v(self):
+        return self.hyper_v
+
+    def is_cluster_aware(self):
+        if self.edition == 'Enterprise':
+            return True
+        if self.edition == 'Datacenter':
+            return True
+        return False
+
+    def greater_than(self, os_name):
+        # "os_name" is a name from name_to_version or releases.json, or a WindowsVersion
+        from .version import WindowsVersion
+        if not isinstance(os_name, WindowsVersion):
+            os_name = WindowsVersion(os_name)
+        return self.version_info > os_name
+
+    def less_than(self, os_name):
+        from .version import WindowsVersion
+        if not isinstance(os_name, WindowsVersion):
+            os_name = WindowsVersion(os_name)
+        return self.version_info < os_name
+
+
+class Windows(WindowsChecks):  # pylint: disable-msg=R0902,R0904
+    def __init__(self, fields=None, backend=None):
+        # by default nothing is probed until an attribute is read. if "fields" is given, only the probes
+        # these fields need are run right away.
+        # "backend" is where the probes get their data from, the local machine by default (see backends.py)
+        from .backends import LiveBackend
+        self._backend = LiveBackend() if backend is None else backend
+        self._registry = {}
+        # errors of the probes run by analyze(concurrent=True), by field, see get_probe_graph
+        self._probe_errors = {}
+        if fields is None:
+            return
+        for field in fields:
+            if field not in FIELDS:
+                raise ValueError("Unknown field {}".format(field))
+        for field in fields:
+            self._analyze_field(field)
+
+    def __getattr__(self, name):
+        # called only for attributes that were not analyzed yet. a frozen instance analyzed everything already, so
+        # a missing attribute (e.g. win10_update before Windows 10) stays missing
+        if name not in FIELD_ANALYZERS or self.__dict__.get('_frozen'):
+            raise AttributeError(name)
+        self._analyze_field(name)
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            # e.g. win10_update on versions older than Windows 10
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError("Windows instance is frozen, cannot set {}".format(name))
+        super(Windows, self).__setattr__(name, value)
+
+    def freeze(self):
+        # analyze everything that was not analyzed yet and make the instance read-only,
+        # so it can be shared between threads
+        for field in FIELDS + ('version_info',):
+            self._analyze_field(field)
+        self._frozen = True
+        return self
+
+    def _analyze_field(self, name):
+        if name not in self.__dict__:
+            if name in self._probe_errors:
+                raise self._probe_errors[name]
+            getattr(self, FIELD_ANALYZERS[name])()
+
+    def analyze(self, concurrent=False, max_workers=4):
+        # analyzes all the fields. with concurrent=True, the independent probes are run in parallel first (see
+        # get_probe_graph) and the analysis then runs on their results, which gives the same result as the serial path
+        if concurrent:
+            from .scheduler import run_graph
+            run_graph(self.get_probe_graph(), max_workers)
+        self._analyze_field('_version_ex')
         self.analyze_major_minor_versions()
+        self.analyze_version()
+        self.analyze_windows_edition()
+        self.analyze_windows_service_pack()
+        self.analyze_windows_architecture()
+
+    def get_probe_graph(self):
+        # probe name -> (names of the probes it depends on, function). a function may decide that its probe is not
+        # needed after all. errors are not raised here: a failed probe keeps its error (like get_registry_values
+        # does), and the analysis raises it where the serial path would, without running the probe again
+        from .backends import CURRENT_VERSION_KEY, SERVER_LEVELS_KEY
+
+        def quietly(function):
+            def probe():
+                try:
+                    function()
+                except Exception:  # pylint: disable-msg=W0703
+                    pass
+            return probe
+
+        def probe_field(name):
+            try:
+                self._analyze_field(name)
+            except Exception as error:  # pylint: disable-msg=W0703
+                self._probe_errors.setdefault(name, error)
+                raise
+
+        def version_ex():
+            probe_field('_version_ex')
+
+        def system_info():
+            probe_field('_system_info')
+
+        def product_info():
+            # GetProductInfo does not exist before Vista
+            if self._version_ex.major_version >= 6:
+                probe_field('_product_info')
+
+        def registry(key):
+            def probe():
+                # GetVersionEx is "stuck" at 6.2 from Windows 2012 / 8, see the documentation above
+                if (self._version_ex.major_version, self._version_ex.minor_version) == (6, 2):
+                    self.get_registry_values(key)
+            return probe
+
+        def dism():
+            from infi.registry.errors import AccessDeniedException
+            self._analyze_field('_major_version')
+            if self._major_version != 6 or self._minor_version < 2:
+                return
+            try:
+                self.get_registry_values(SERVER_LEVELS_KEY)
+            except AccessDeniedException:
+                probe_field('_dism_output')
+
+        return {
+            'version_ex': ((), quietly(version_ex)),
+            'system_info': ((), quietly(system_info)),
+            'product_info': (('version_ex',), quietly(product_info)),
+            'current_version': (('version_ex',), quietly(registry(CURRENT_VERSION_KEY))),
+            'server_levels': (('version_ex',), quietly(registry(SERVER_LEVELS_KEY))),
+            'dism': (('current_version', 'server_levels'), quietly(dism)),
+        }
+
+    # the probes go through run_probe, which reports them to the instrumentation hooks (see instrumentation.py)
+    def analyze_version_ex(self):
+        from .instrumentation import run_probe
+        self._version_ex = run_probe('version_ex', self._backend.get_version_ex)
+
+    def analyze_system_info(self):
+        from .instrumentation import run_probe
+        self._system_info = run_probe('system_info', self._backend.get_system_info)
+
+    def analyze_product_info(self):
+        from .instrumentation import run_probe
+        self._product_info = run_probe('product_info', self._backend.get_product_info,
+                                       self._version_ex.major_version, self._version_ex.minor_version,
+                                       self._version_ex.service_pack_major, self._version_ex.service_pack_minor)
+
+    def analyze_dism_output(self):
+        from .instrumentation import run_probe
+        self._dism_output = run_probe('dism', self._backend.get_dism_features)
+
+    def analyze_version(self):
         if self._major_version == 10:
-            self._release_id = self.get_release_id_from_registry()
             self.analyze_windows10_version()
             self.analyze_windows10_update()
         else:
             self.analyze_windows_version()
-        self.analyze_windows_edition()
-        self.analyze_windows_service_pack()
-        self.analyze_windows_architecture()
+
+    def analyze_release_id(self):
+        self._release_id = self.get_release_id_from_registry()
 
     def analyze_major_minor_versions(self):
         self._major_version = self._version_ex.major_version
@@ -103,33 +349,27 @@ class Windows(object):  # pylint: disable-msg=R0902,R0904
             # GetVersionEx will return 6.2 for Windows 2012 and up. See documentation above.
             self._major_version, self._minor_version, self._build_number = self.get_version_from_registry()
 
+    def analyze_version_info(self):
+        # a comparable WindowsVersion, see version.py
+        from .version import WindowsVersion, get_windows10_version
+        if self._major_version == 10:
+            self.version_info = get_windows10_version(self._product_type, self._release_id, self._build_number)
+        else:
+            self.version_info = WindowsVersion((self._major_version, self._minor_version))
+
     def analyze_windows_version(self):
         version = (self._major_version, self._minor_version, self._product_type)
         self.version = version_to_name.get(version, version_to_name.get(version[:2], 'Unknown'))
 
     def analyze_windows10_version(self):
-        from .constants import VER_NT_WORKSTATION
-        # Windows 10 and on, and Windows Server 2016 and on, use only "release id" to differentiate different releases
-        # product_type still determines whether this is Windows 10 or Windows Server
-        if self._product_type == VER_NT_WORKSTATION:
-            self.version = "Windows 10"
-        if self._release_id >= LAST_RELEASE_ID:
-            if self._build_number >= FIRST_WIN_2022_SRVER_BUILD_NUMBER:
-                self.version = "Windows Server 2022"
-            else:
-                self.version = "Windows Server 2019"
-        elif self._release_id < FIRST_WIN_SERVER_2019_RELEASE_ID:
-            self.version = "Windows Server 2016"
-        else:
-            self.version = "Windows Server 2019"
+        # Windows 10 and on, and Windows Server 2016 and on, are told apart by the product type, release id and
+        # build number. see releases.py
+        from .releases import get_release_table
+        self.version, _ = get_release_table().lookup(self._product_type, self._release_id, self._build_number)
 
     def analyze_windows10_update(self):
-        from .constants import VER_NT_WORKSTATION
-        if self._product_type == VER_NT_WORKSTATION:
-            release_id_to_update = win10_release_id_to_update
-        else:
-            release_id_to_update = win10_server_release_id_to_update
-        self.win10_update = release_id_to_update.get(self._release_id, 'Unknown')
+        from .releases import get_release_table
+        _, self.win10_update = get_release_table().lookup(self._product_type, self._release_id, self._build_number)
 
     def analyze_windows_edition(self):
         self.server_core = False
@@ -153,7 +393,7 @@ class Windows(object):  # pylint: disable-msg=R0902,R0904
     def analyze_windows5_edition(self):
         from .constants import VER_SUITE_BACKOFFICE, VER_SUITE_COMPUTE_SERVER, VER_SUITE_DATACENTER
         from .constants import VER_SUITE_ENTERPRISE, VER_SUITE_STORAGE_SERVER, VER_SUITE_WH_SERVER
-        (_, mask) = (self._version_ex.suite_mask, self._version_ex.product_type)
+        mask = self._version_ex.suite_mask
         if mask & VER_SUITE_BACKOFFICE:
             self.edition = 'BackOffice'
         elif mask & VER_SUITE_COMPUTE_SERVER:
@@ -170,29 +410,38 @@ class Windows(object):  # pylint: disable-msg=R0902,R0904
             self.edition = 'Standard'
 
     def get_windows6_edition(self):
-        from .interface import get_product_info
-        return get_product_info(self._version_ex.major_version,
-                                self._version_ex.minor_version,
-                                self._version_ex.service_pack_major,
-                                self._version_ex.service_pack_minor)
+        return self._product_info
 
     def analyze_server_core_according_to_dism(self):
-        # http://stackoverflow.com/questions/13065479/how-to-detect-windows-2012-core-edition-c
-        from os import environ, path
-        from infi.execute import execute
-        dism = path.join(environ.get("SYSTEMROOT"), "System32", "dism.exe")
-        pid = execute([dism, "/online", "/get-features", "/format:table"])
-        self.server_core = any("ServerCore-FullServer" in line and "Disabled" in line for
-                               line in pid.get_stdout().decode().splitlines())
+        from .dism import is_server_core
+        output = self._dism_output
+        # None means that dism did not answer in time, so we can't tell
+        self.server_core = None if output is None else is_server_core(output)
+
+    def get_registry_values(self, key):
+        # returns an immutable dict of the values listed in REGISTRY_VALUES for the key. the key is read only once
+        # per detection; if it is missing or cannot be opened, the same exception is raised on every call
+        from .backends import REGISTRY_VALUES, REGISTRY_PROBES
+        from .instrumentation import run_probe
+        from ._compat import frozen_dict
+        if key not in self._registry:
+            try:
+                values = run_probe(REGISTRY_PROBES[key], self._backend.get_registry_values, key, REGISTRY_VALUES[key])
+                self._registry[key] = (frozen_dict(values), None)
+            except Exception as error:  # pylint: disable-msg=W0703
+                self._registry[key] = (None, error)
+        values, error = self._registry[key]
+        if error is not None:
+            raise error
+        return values
 
     def analyze_server_core_according_to_registry(self):
         # http://msdn.microsoft.com/en-us/library/windows/desktop/hh846315%28v=vs.85%29.aspx
-        from infi.registry import LocalComputer
         from infi.registry.errors import AccessDeniedException
-        KEY = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Server\ServerLevels"
+        from .backends import SERVER_LEVELS_KEY
         FEATURES = ("ServerCore", "Server-Gui-Mgmt", "Server-Gui-Shell")
         try:
-            store = LocalComputer().local_machine[KEY].values_store
+            store = self.get_registry_values(SERVER_LEVELS_KEY)
         except KeyError:
             return
         except AccessDeniedException:
@@ -201,49 +450,31 @@ class Windows(object):  # pylint: disable-msg=R0902,R0904
         self.server_core = all(item in store for item in FEATURES)
 
     def get_release_id_from_registry(self):
-        from infi.registry import LocalComputer
-        local_machine = LocalComputer().local_machine
-        reg_folder = local_machine[r'Software\Microsoft\Windows NT\CurrentVersion']
-        release_id = int(reg_folder.values_store['ReleaseId'].to_python_object())
-        return release_id
+        from .backends import CURRENT_VERSION_KEY
+        values = self.get_registry_values(CURRENT_VERSION_KEY)
+        return int(values['ReleaseId'])
 
     def get_version_from_registry(self):
         # see documentation about reading the major/minor versions from the registry at the top of the file
-        from infi.registry import LocalComputer
-        local_machine = LocalComputer().local_machine
-        reg_folder = local_machine[r'Software\Microsoft\Windows NT\CurrentVersion']
-        major_version = reg_folder.values_store.get('CurrentMajorVersionNumber')
-        minor_version = reg_folder.values_store.get('CurrentMinorVersionNumber')
-        build_number = reg_folder.values_store.get('CurrentBuildNumber').to_python_object()
-        if major_version and minor_version:
+        from .backends import CURRENT_VERSION_KEY
+        values = self.get_registry_values(CURRENT_VERSION_KEY)
+        major_version = values.get('CurrentMajorVersionNumber')
+        minor_version = values.get('CurrentMinorVersionNumber')
+        build_number = int(values['CurrentBuildNumber'])
+        if major_version is not None and minor_version is not None:
             # should be 10.0
-            return major_version.to_python_object(), minor_version.to_python_object(), build_number
+            return major_version, minor_version, build_number
         # 6.2 or 6.3
-        major_version, minor_version = reg_folder.values_store['CurrentVersion'].to_python_object().split('.')
+        major_version, minor_version = values['CurrentVersion'].split('.')
         return int(major_version), int(minor_version), build_number
 
     def analyze_windows6_edition(self):
-        from .constants import PRODUCT_SUITE_CLUSTER, PRODUCT_SUITE_DATACENTER
-        from .constants import PRODUCT_SUITE_ENTERPRISE, PRODUCT_SUITE_STORAGE, PRODUCT_SUITE_STANDARD
-        from .constants import PRODUCT_SUITE_SMALL_BUSINESS
-        from .constants import SERVER_CORE, HYPER_V
-        if self._edition in PRODUCT_SUITE_CLUSTER:
-            self.edition = 'Compute Cluster'
-        if self._edition in PRODUCT_SUITE_DATACENTER:
-            self.edition = 'Datacenter'
-        elif self._edition in PRODUCT_SUITE_ENTERPRISE:
-            self.edition = 'Enterprise'
-        elif self._edition in PRODUCT_SUITE_STORAGE:
-            self.edition = 'Storage'
-        elif self._edition in PRODUCT_SUITE_STANDARD:
-            self.edition = 'Standard'
-        elif self._edition in PRODUCT_SUITE_SMALL_BUSINESS:
-            self.edition = 'Small Business'
-        else:
-            self.edition = 'Client'
-        if self._edition in SERVER_CORE:
+        from .products import classify_product
+        product = classify_product(self._edition)
+        self.edition = product.edition
+        if product.server_core:
             self.server_core = True
-        if self._edition in HYPER_V:
+        if product.hyper_v:
             self.hyper_v = True
 
     def analyze_windows_service_pack(self):
@@ -251,9 +482,7 @@ class Windows(object):  # pylint: disable-msg=R0902,R0904
 
     def analyze_windows_architecture(self):
         from .constants import PROCESSOR_ARCHITECTURE_AMD64, PROCESSOR_ARCHITECTURE_IA64, PROCESSOR_ARCHITECTURE_INTEL
-        from .interface import get_system_info
-        system_info = get_system_info()
-        processor = system_info.processor_architecture
+        processor = self._system_info.processor_architecture
         if processor == PROCESSOR_ARCHITECTURE_AMD64:
             self.architecture = 'x64'
         elif processor == PROCESSOR_ARCHITECTURE_IA64:
@@ -263,83 +492,53 @@ class Windows(object):  # pylint: disable-msg=R0902,R0904
         else:
             self.architecture = 'unknown'
 
-    def __str__(self):
-        return "%s %s Service Pack %s" % (self.version, self.edition, self.service_pack)
 
-    def is_windows_2000(self):
-        return self.version == 'Windows 2000'
+_shared_windows = None
+_shared_windows_lock = threading.Lock()
 
-    def is_windows_xp(self):
-        return self.version == 'Windows XP'
 
-    def is_windows_2003(self):
-        return self.version == 'Windows Server 2003'
+def get_windows():
+    # returns a frozen Windows instance shared by the whole process. detection runs once, by the first caller;
+    # concurrent callers wait on the lock for its result
+    global _shared_windows
+    windows = _shared_windows
+    if windows is not None:
+        return windows
+    with _shared_windows_lock:
+        if _shared_windows is None:
+            _shared_windows = Windows().freeze()
+        return _shared_windows
 
-    def is_windows_2008(self):
-        return self.version == 'Windows Server 2008'
 
-    def is_windows_2008_r2(self):
-        return self.version == 'Windows Server 2008 R2'
+def _share_windows(windows):
+    # makes "windows" the instance returned by get_windows, unless another detection got there first
+    global _shared_windows
+    with _shared_windows_lock:
+        if _shared_windows is None:
+            _shared_windows = windows
+        return _shared_windows
 
-    def is_windows_vista(self):
-        return self.version == 'Windows Vista'
 
-    def is_windows_7(self):
-        return self.version == 'Windows 7'
+def detect_windows(backend=None):
+    # the asyncio version of get_windows, see aio.py
+    from .aio import detect_windows as _detect_windows
+    return _detect_windows(backend)
 
-    def is_windows_8(self):
-        return self.version == 'Windows 8'
 
-    def is_windows_10(self):
-        return self.version == 'Windows 10'
-
-    def is_windows_2012(self):
-        return self.version == 'Windows Server 2012'
-
-    def is_windows_2012_r2(self):
-        return self.version == 'Windows Server 2012 R2'
-
-    def is_windows_2016(self):
-        return self.version == 'Windows Server 2016'
-
-    def is_windows_2019(self):
-        return self.version == 'Windows Server 2019'
-
-    def is_windows_2022(self):
-        return self.version == 'Windows Server 2022'
-
-    def is_x86(self):
-        return self.architecture == 'x86'
+def requirement(text):
+    # compiles a requirement expression into a predicate over Windows instances, see requirements.py
+    from .requirements import requirement as _requirement
+    return _requirement(text)
 
-    def is_x64(self):
-        return self.architecture == 'x64'
-
-    def is_ia64(self):
-        return self.architecture == 'ia64'
 
-    def is_server_core(self):
-        return self.server_core
+def classify_many(snapshots, workers=1, chunksize=256, ordered=True, memo=False):
+    # classifies recorded snapshots into DetectionResults, see batch.py
+    from .batch import classify_many as _classify_many
+    return _classify_many(snapshots, workers=workers, chunksize=chunksize, ordered=ordered, memo=memo)
 
-    def is_hyper_v(self):
-        return self.hyper_v
 
-    def is_cluster_aware(self):
-        if self.edition == 'Enterprise':
-            return True
-        if self.edition == 'Datacenter':
-            return True
-        return False
-
-    def greater_than(self, os_name):
-        if os_name not in name_to_version:
-            raise Exception("Could not find OS name {}".format(os_name))
-        if self._major_version == 10:
-            actual_version = (self._major_version, self._minor_version, self._release_id)
-        else:
-            actual_version = (self._major_version, self._minor_version)
-        compared_version = name_to_version[os_name]
-        if compared_version[0] < 10:
-            # in name_to_version, values of Windows 10 have the release id in position 2
-            # other values may have product id which needs to be stripped
-            compared_version = compared_version[:2]
-        return actual_version > compared_version
+def invalidate():
+    # drops the instance returned by get_windows, so the next call runs detection again
+    global _shared_windows
+    with _shared_windows_lock:
+        _shared_windows = None
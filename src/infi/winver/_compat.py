@@ -0,0 +1,16 @@
+
+def frozen_dict(values):
+    # a read-only view of a copy of "values"
+    try:
+        from types import MappingProxyType
+    except ImportError:
+        # python 2
+        return dict(values)
+    return MappingProxyType(dict(values))
+
+
+try:
+    from time import monotonic
+except ImportError:
+    # python 2
+    from time import time as monotonic
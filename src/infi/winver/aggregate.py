@@ -0,0 +1,165 @@
+# streaming counts of detection results over a fleet, for reports such as "hosts by version and edition".
+# a FleetAggregate counts results by the values of its fields (by default AGGREGATE_FIELDS), keeping one counter per
+# distinct combination of values, so its memory depends on how varied the fleet is and not on its size.
+# aggregates of parts of a fleet (of chunks in worker processes, or of the hosts collected on different machines)
+# merge into the aggregate of the whole fleet; merging is associative and commutative, and to_dict() / from_dict()
+# move an aggregate between processes and machines as JSON
+from collections import defaultdict
+from operator import attrgetter
+
+AGGREGATE_FIELDS = ('version', 'win10_update', 'edition', 'architecture', 'server_core', 'hyper_v')
+
+AGGREGATE_FORMAT_VERSION = 1
+
+
+class FleetAggregate(object):
+    def __init__(self, fields=AGGREGATE_FIELDS):
+        from .result import RESULT_FIELDS, DetectionResult
+        fields = tuple(fields)
+        unknown = [name for name in fields if name not in RESULT_FIELDS or name == 'version_info']
+        if unknown or not fields:
+            raise ValueError("Cannot aggregate by {}".format(", ".join(unknown) if unknown else "no fields"))
+        self.fields = fields
+        self.total = 0
+        # values of the fields, in order -> number of results
+        self._counts = defaultdict(int)
+        getter = attrgetter(*fields)
+        get_values = getter if len(fields) > 1 else lambda result: (getter(result),)
+
+        def get_key(result):
+            # anything else (e.g. a Windows, which has no win10_update before Windows 10) is read through a
+            # DetectionResult, so it is counted the same way
+            if type(result) is not DetectionResult:  # pylint: disable-msg=C0123
+                result = DetectionResult.from_windows(result)
+            return get_values(result)
+        self._get_key = get_key
+
+    def add(self, result, count=1):
+        # "result" is a DetectionResult, or a Windows instance
+        self._counts[self._get_key(result)] += count
+        self.total += count
+
+    def update(self, results):
+        # adds every result in "results" in a single pass; returns self
+        counts, get_key = self._counts, self._get_key
+        added = 0
+        for result in results:
+            counts[get_key(result)] += 1
+            added += 1
+        self.total += added
+        return self
+
+    def merge(self, other):
+        # adds the counts of "other" to this aggregate; returns self
+        if other.fields != self.fields:
+            raise ValueError("Cannot merge an aggregate by {} into one by {}".format(other.fields, self.fields))
+        counts = self._counts
+        for key, count in other._counts.items():  # pylint: disable-msg=W0212
+            counts[key] += count
+        self.total += other.total
+        return self
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def copy(self):
+        aggregate = FleetAggregate(self.fields)
+        return aggregate.merge(self)
+
+    def __len__(self):
+        # number of distinct groups
+        return len(self._counts)
+
+    def __eq__(self, other):
+        if not isinstance(other, FleetAggregate):
+            return NotImplemented
+        # pylint: disable-msg=W0212
+        return self.fields == other.fields and self.total == other.total and self._counts == other._counts
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<FleetAggregate of {} results in {} groups>".format(self.total, len(self))
+
+    def _positions(self, fields):
+        if not fields:
+            return list(range(len(self.fields)))
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown:
+            raise ValueError("Not aggregated by {}".format(", ".join(unknown)))
+        return [self.fields.index(name) for name in fields]
+
+    def group_by(self, *fields):
+        # returns a dict of the values of "fields" to their number of results, e.g. group_by('version') ->
+        # {'Windows Server 2019': 10, ...}. keys are tuples when grouping by more than one field, and by all the
+        # fields of the aggregate when none are given
+        positions = self._positions(fields)
+        groups = defaultdict(int)
+        if len(positions) == 1:
+            position, = positions
+            for key, count in self._counts.items():
+                groups[key[position]] += count
+        else:
+            for key, count in self._counts.items():
+                groups[tuple(key[position] for position in positions)] += count
+        return dict(groups)
+
+    def top_k(self, k, *fields):
+        # returns the "k" most common groups of group_by(*fields) as a list of (values, count), most common first.
+        # ties are ordered by their values, so the result does not depend on the order results were counted in
+        from heapq import nsmallest
+        return nsmallest(k, self.group_by(*fields).items(), key=lambda item: (-item[1], repr(item[0])))
+
+    def to_dict(self):
+        # a JSON-serializable dict; the groups are sorted, so equal aggregates serialize the same
+        return dict(format=AGGREGATE_FORMAT_VERSION, fields=list(self.fields), total=self.total,
+                    counts=sorted((list(key) + [count] for key, count in self._counts.items()), key=repr))
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('format') != AGGREGATE_FORMAT_VERSION:
+            raise ValueError("Unsupported aggregate format {!r}".format(data.get('format')))
+        aggregate = cls(data['fields'])
+        width = len(aggregate.fields)
+        for row in data['counts']:
+            if len(row) != width + 1:
+                raise ValueError("Invalid aggregate row {!r}".format(row))
+            aggregate._counts[tuple(row[:width])] += row[width]  # pylint: disable-msg=W0212
+        aggregate.total = data['total']
+        if aggregate.total != sum(aggregate._counts.values()):  # pylint: disable-msg=W0212
+            raise ValueError("Aggregate total does not match its counts")
+        return aggregate
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        aggregate = FleetAggregate.from_dict(state)
+        self.__dict__.update(aggregate.__dict__)
+
+
+def aggregate(results, fields=AGGREGATE_FIELDS):
+    # returns the FleetAggregate of "results", counted in a single pass
+    return FleetAggregate(fields).update(results)
+
+
+def aggregate_chunk(snapshots, fields=AGGREGATE_FIELDS, memo=False):
+    # the classifier aggregate_many runs on a chunk of snapshots: returns their aggregate (as a list of one)
+    from .batch import classify_chunk
+    return [aggregate(classify_chunk(snapshots, memo=memo), fields)]
+
+
+def aggregate_many(snapshots, workers=1, chunksize=1024, fields=AGGREGATE_FIELDS, memo=False):
+    # classifies and aggregates recorded snapshots, see classify_many. with workers > 1 every worker aggregates its
+    # chunks and only the aggregates are sent back and merged
+    from functools import partial
+    from .batch import classify_many
+    total = FleetAggregate(fields)
+    for partial_aggregate in classify_many(snapshots, workers=workers, chunksize=chunksize, ordered=False,
+                                           classifier=partial(aggregate_chunk, fields=tuple(fields)), memo=memo):
+        total.merge(partial_aggregate)
+    return total
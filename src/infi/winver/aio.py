@@ -0,0 +1,124 @@
+# asyncio support (python 3 only): "await detect_windows()" returns the same frozen instance as get_windows(),
+# without blocking the event loop. the Win32 API and registry probes run in the loop's default executor, and dism is
+# run with asyncio.create_subprocess_exec. concurrent awaiters share a single detection
+import asyncio
+from subprocess import DEVNULL, PIPE
+
+# event loop -> the task running the detection for it
+_detections = {}
+
+
+async def detect_windows(backend=None):
+    # with no backend, or a LiveBackend, "backend" is used only if a detection has to run; see get_windows.
+    # other backends (e.g. ReplayBackend) do not describe the local machine, so they get a detection of their own
+    # that is not shared
+    from . import _shared_windows
+    if not _is_live(backend):
+        return await _detect(backend)
+    if _shared_windows is not None:
+        return _shared_windows
+    loop = asyncio.get_running_loop()
+    task = _detections.get(loop)
+    if task is None:
+        task = loop.create_task(_detect(backend))
+        _detections[loop] = task
+        task.add_done_callback(lambda _: _detections.pop(loop, None))
+    # one awaiter being cancelled must not cancel the detection the others are waiting for
+    return await asyncio.shield(task)
+
+
+def _is_live(backend):
+    from .backends import LiveBackend
+    return backend is None or isinstance(backend, LiveBackend)
+
+
+async def _detect(backend):
+    from . import Windows, _share_windows
+    from .backends import LiveBackend
+    loop = asyncio.get_running_loop()
+    windows = Windows(backend=backend)
+    if await loop.run_in_executor(None, _needs_dism, windows):
+        if isinstance(windows._backend, LiveBackend):  # pylint: disable-msg=W0212
+            windows._dism_output = await _run_dism_probe(windows._backend)  # pylint: disable-msg=W0212
+        else:
+            await loop.run_in_executor(None, windows._analyze_field, '_dism_output')  # pylint: disable-msg=W0212
+    await loop.run_in_executor(None, windows.freeze)
+    return _share_windows(windows) if _is_live(backend) else windows
+
+
+async def _run_dism_probe(backend):
+    # instrumentation.run_probe for the asyncio dism probe
+    from .instrumentation import is_enabled, report_probe
+    from ._compat import monotonic
+    if not is_enabled():
+        return await get_dism_features(backend)
+    start = monotonic()
+    try:
+        output = await get_dism_features(backend)
+    except Exception as error:
+        report_probe('dism', start, error=error)
+        raise
+    report_probe('dism', start, output)
+    return output
+
+
+def _needs_dism(windows):
+    # the same condition under which Windows.analyze_windows_edition ends up running dism
+    from infi.registry.errors import AccessDeniedException
+    from .backends import SERVER_LEVELS_KEY
+    if windows._major_version != 6 or windows._minor_version < 2:  # pylint: disable-msg=W0212
+        return False
+    try:
+        windows.get_registry_values(SERVER_LEVELS_KEY)
+    except AccessDeniedException:
+        return True
+    except KeyError:
+        pass
+    return False
+
+
+async def get_dism_features(backend):
+    # LiveBackend.get_dism_features, with the subprocess run by asyncio
+    from .dism import load_cached_features, save_cached_features
+    loop = asyncio.get_running_loop()
+    cache_path = backend.get_dism_cache_path()
+    boot_time = None
+    if cache_path is not None:
+        boot_time = await loop.run_in_executor(None, backend.get_boot_time)
+        output = await loop.run_in_executor(None, load_cached_features, cache_path, boot_time)
+        if output is not None:
+            return output
+    output = await read_features(backend.get_dism_command(), backend.get_dism_timeout())
+    await loop.run_in_executor(None, save_cached_features, cache_path, boot_time, output)
+    return output
+
+
+async def read_features(command, timeout):
+    # see dism.read_features
+    from .dism import SERVER_CORE_FEATURE
+    from .instrumentation import count
+    count('subprocess_spawns')
+    process = await asyncio.create_subprocess_exec(*command, stdout=PIPE, stderr=DEVNULL)
+    output = []
+
+    async def read():
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                return
+            line = line.decode(errors='replace')
+            output.append(line)
+            if SERVER_CORE_FEATURE in line:
+                return
+    try:
+        await asyncio.wait_for(read(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+    return ''.join(output)
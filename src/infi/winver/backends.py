@@ -0,0 +1,219 @@
+# probe backends: everything Windows needs from the operating system goes through a backend object.
+# * LiveBackend queries the local machine (Win32 API, registry, dism.exe)
+# * RecordingBackend wraps another backend and keeps everything it returned, so it can be saved to a snapshot file
+# * ReplayBackend answers from a snapshot file, so the whole analysis can run on any platform
+import json
+from binascii import hexlify, unhexlify
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+CURRENT_VERSION_KEY = r'Software\Microsoft\Windows NT\CurrentVersion'
+SERVER_LEVELS_KEY = r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Server\ServerLevels'
+
+# all the values Windows reads, by key. each key is opened once per detection and all of its values are read at once
+REGISTRY_VALUES = {
+    CURRENT_VERSION_KEY: ('ReleaseId', 'CurrentMajorVersionNumber', 'CurrentMinorVersionNumber', 'CurrentBuildNumber',
+                          'CurrentVersion', 'UBR', 'DisplayVersion'),
+    SERVER_LEVELS_KEY: ('ServerCore', 'Server-Gui-Mgmt', 'Server-Gui-Shell'),
+}
+
+# the names of the registry probes, see instrumentation.py
+REGISTRY_PROBES = {
+    CURRENT_VERSION_KEY: 'current_version',
+    SERVER_LEVELS_KEY: 'server_levels',
+}
+
+
+class ProbeBackend(object):
+    def get_version_ex(self):
+        # returns an OSVersionExStructure
+        raise NotImplementedError()
+
+    def get_system_info(self):
+        # returns a SystemInfoStructure
+        raise NotImplementedError()
+
+    def get_product_info(self, major_version, minor_version, service_pack_major, service_pack_minor):
+        # returns the product type (one of the PRODUCT_* constants)
+        raise NotImplementedError()
+
+    def get_registry_values(self, key, names):
+        # returns a dict of the values (as python objects) out of "names" that exist under HKLM\<key>.
+        # raises KeyError if the key does not exist and AccessDeniedException if it cannot be opened
+        raise NotImplementedError()
+
+    def get_dism_features(self):
+        # returns the output of "dism.exe /online /get-features /format:table", at least up to the
+        # ServerCore-FullServer line, or None if dism did not get there in time
+        raise NotImplementedError()
+
+    def get_boot_time(self):
+        # returns the time the system was started, in seconds since the epoch
+        raise NotImplementedError()
+
+
+class LiveBackend(ProbeBackend):
+    def __init__(self, dism_timeout=None, dism_cache_path=None, dism_command=None):
+        # see dism.py for the defaults
+        from . import dism
+        self._dism_timeout = dism.DEFAULT_TIMEOUT if dism_timeout is None else dism_timeout
+        # the per-boot cache is only used when a path is given
+        self._dism_cache_path = dism.DEFAULT_CACHE_PATH if dism_cache_path is None else dism_cache_path
+        self._dism_command = dism_command
+
+    def get_version_ex(self):
+        from .interface import get_version_ex
+        return get_version_ex()
+
+    def get_system_info(self):
+        from .interface import get_system_info
+        return get_system_info()
+
+    def get_product_info(self, major_version, minor_version, service_pack_major, service_pack_minor):
+        from .interface import get_product_info
+        return get_product_info(major_version, minor_version, service_pack_major, service_pack_minor)
+
+    def get_registry_values(self, key, names):
+        from infi.registry import LocalComputer
+        from .instrumentation import count
+        count('registry_opens')
+        values_store = LocalComputer().local_machine[key].values_store
+        result = {}
+        for name in names:
+            value = values_store.get(name)
+            if value is not None:
+                result[name] = value.to_python_object()
+        return result
+
+    def get_dism_features(self):
+        from .dism import get_features
+        cache_path = self.get_dism_cache_path()
+        boot_time = None if cache_path is None else self.get_boot_time()
+        return get_features(self.get_dism_command(), self._dism_timeout, cache_path, boot_time)
+
+    def get_dism_command(self):
+        from .dism import get_command
+        return get_command() if self._dism_command is None else self._dism_command
+
+    def get_dism_timeout(self):
+        return self._dism_timeout
+
+    def get_dism_cache_path(self):
+        # no (or an empty) cache path disables the per-boot cache
+        return self._dism_cache_path or None
+
+    def get_boot_time(self):
+        from .interface import get_boot_time
+        return get_boot_time()
+
+
+class RecordingBackend(ProbeBackend):
+    def __init__(self, backend):
+        self._backend = backend
+        self._snapshot = dict(format=SNAPSHOT_FORMAT_VERSION, registry={})
+
+    def get_version_ex(self):
+        from .structures import to_bytes
+        version_ex = self._backend.get_version_ex()
+        self._snapshot['version_ex'] = _to_hex(to_bytes(version_ex))
+        return version_ex
+
+    def get_system_info(self):
+        from .structures import to_bytes
+        system_info = self._backend.get_system_info()
+        self._snapshot['system_info'] = _to_hex(to_bytes(system_info))
+        return system_info
+
+    def get_product_info(self, major_version, minor_version, service_pack_major, service_pack_minor):
+        product_info = self._backend.get_product_info(major_version, minor_version,
+                                                      service_pack_major, service_pack_minor)
+        self._snapshot['product_info'] = product_info
+        return product_info
+
+    def get_registry_values(self, key, names):
+        from infi.registry.errors import AccessDeniedException
+        registry = self._snapshot['registry']
+        try:
+            values = self._backend.get_registry_values(key, names)
+        except KeyError:
+            registry[key] = dict(error='missing')
+            raise
+        except AccessDeniedException:
+            registry[key] = dict(error='access_denied')
+            raise
+        registry.setdefault(key, dict(values={}))['values'].update(values)
+        return values
+
+    def get_dism_features(self):
+        self._snapshot['dism'] = self._backend.get_dism_features()
+        return self._snapshot['dism']
+
+    def get_boot_time(self):
+        self._snapshot['boot_time'] = self._backend.get_boot_time()
+        return self._snapshot['boot_time']
+
+    def get_snapshot(self):
+        return self._snapshot
+
+    def save(self, path):
+        with open(path, 'w') as fd:
+            json.dump(self._snapshot, fd, indent=4, sort_keys=True)
+
+
+class ReplayBackend(ProbeBackend):
+    def __init__(self, snapshot):
+        if snapshot.get('format') != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError("Unsupported snapshot format {!r}".format(snapshot.get('format')))
+        self._snapshot = snapshot
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fd:
+            return cls(json.load(fd))
+
+    def _get(self, name):
+        if name not in self._snapshot:
+            raise ValueError("Snapshot does not contain {}".format(name))
+        return self._snapshot[name]
+
+    def get_version_ex(self):
+        from .structures import OSVersionExStructure, from_buffer
+        return from_buffer(OSVersionExStructure, bytearray(unhexlify(self._get('version_ex'))))
+
+    def get_system_info(self):
+        from .structures import get_system_info_structure, from_buffer
+        data = bytearray(unhexlify(self._get('system_info')))
+        return from_buffer(get_system_info_structure(len(data)), data)
+
+    def get_product_info(self, major_version, minor_version, service_pack_major, service_pack_minor):
+        return self._get('product_info')
+
+    def get_registry_values(self, key, names):
+        from infi.registry.errors import AccessDeniedException
+        # keys that were not recorded are treated as missing
+        recorded = self._snapshot.get('registry', {}).get(key, dict(error='missing'))
+        if recorded.get('error') == 'missing':
+            raise KeyError(key)
+        if recorded.get('error') == 'access_denied':
+            raise AccessDeniedException(key)
+        values = recorded['values']
+        return {name: values[name] for name in names if name in values}
+
+    def get_dism_features(self):
+        return self._get('dism')
+
+    def get_boot_time(self):
+        return self._get('boot_time')
+
+
+def _to_hex(data):
+    return hexlify(data).decode('ascii')
+
+
+def record(path, backend=None):
+    # runs a full detection and saves everything it needed into a snapshot file
+    from . import Windows
+    recorder = RecordingBackend(LiveBackend() if backend is None else backend)
+    Windows(backend=recorder).analyze()
+    recorder.save(path)
+    return recorder.get_snapshot()
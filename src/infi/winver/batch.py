@@ -0,0 +1,78 @@
+# classification of many recorded snapshots (see backends.py for the format) at once, for collecting the detection
+# results of a whole fleet centrally. every snapshot is analyzed by Windows, replaying the snapshot, into a
+# DetectionResult. with workers > 1 the snapshots are sent in chunks to a pool of worker processes.
+# the input is read lazily and only a few chunks per worker are in flight at any time, so memory stays bounded no
+# matter how many snapshots there are
+from collections import deque
+from itertools import islice
+
+DEFAULT_CHUNKSIZE = 256
+
+# chunks in flight per worker
+CHUNKS_PER_WORKER = 2
+
+
+def classify(snapshot):
+    # returns the DetectionResult of a single snapshot
+    from .backends import ReplayBackend
+    return classify_backend(ReplayBackend(snapshot))
+
+
+def classify_backend(backend):
+    from . import Windows
+    from .result import DetectionResult
+    return DetectionResult.from_windows(Windows(backend=backend))
+
+
+def classify_chunk(snapshots, memo=False):
+    # with memo=True, results come from the memo of the process (see memo.py)
+    if memo:
+        from .memo import get_memo
+        return [get_memo().classify(snapshot) for snapshot in snapshots]
+    return [classify(snapshot) for snapshot in snapshots]
+
+
+def _chunks(iterable, chunksize):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def classify_many(snapshots, workers=1, chunksize=DEFAULT_CHUNKSIZE, ordered=True, classifier=classify_chunk,
+                  memo=False):
+    # yields a DetectionResult for each snapshot. with ordered=False, the results of a chunk are yielded as soon as
+    # it is done, so they may come out of order (the results within a chunk are always in order).
+    # "classifier" is called with a list of snapshots and returns a list of results; in a worker process it must be
+    # picklable (a module level function). errors raised while classifying a snapshot are raised here.
+    # with memo=True, "classifier" is called with memo=True, and each process classifies through its own memo
+    if chunksize < 1:
+        raise ValueError("chunksize must be positive")
+    if memo:
+        from functools import partial
+        classifier = partial(classifier, memo=True)
+    if workers is None or workers <= 1:
+        for chunk in _chunks(snapshots, chunksize):
+            for result in classifier(chunk):
+                yield result
+        return
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    chunks = _chunks(snapshots, chunksize)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = deque(executor.submit(classifier, chunk)
+                        for chunk in islice(chunks, workers * CHUNKS_PER_WORKER))
+        while running:
+            if ordered:
+                done = [running.popleft()]
+            else:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                done = [future for future in running if future in finished]
+                for future in done:
+                    running.remove(future)
+            for future in done:
+                for chunk in islice(chunks, 1):
+                    running.append(executor.submit(classifier, chunk))
+                for result in future.result():
+                    yield result
@@ -0,0 +1,122 @@
+# an opt-in, on-disk cache of the detection result, for short-lived processes that don't want to pay for the
+# whole detection (which may include running dism.exe) on every run.
+# the cached result is trusted as long as a cheap fingerprint of the system did not change: the build number and
+# UBR (update build revision) are read from the registry with one key open, and the boot time is derived from
+# GetTickCount64. an update of the OS changes the build/UBR, and changes of edition or features require a reboot.
+import os
+import json
+
+CACHE_FORMAT_VERSION = 2
+
+# the boot time is derived from the current time and the uptime, so it jitters a bit between calls
+BOOT_TIME_RESOLUTION = 60
+
+# the public fields and the private attributes that greater_than needs
+CACHED_ATTRIBUTES = ('version', 'win10_update', 'edition', 'server_core', 'hyper_v', 'service_pack',
+                     'architecture', '_major_version', '_minor_version', '_product_type', '_build_number',
+                     '_release_id')
+
+
+def get_fingerprint(backend):
+    from .backends import CURRENT_VERSION_KEY
+    values = backend.get_registry_values(CURRENT_VERSION_KEY, ('CurrentBuildNumber', 'UBR'))
+    # UBR does not exist before Windows 10
+    return [values.get('CurrentBuildNumber'), values.get('UBR'),
+            int(backend.get_boot_time() // BOOT_TIME_RESOLUTION)]
+
+
+def load(path, fingerprint, backend=None):
+    # returns a frozen Windows instance, or None if the cache file is missing, untrusted, corrupt, outdated or
+    # belongs to another version of this module
+    from . import Windows, FIELDS
+    if not is_trusted(path):
+        return None
+    try:
+        with open(path) as fd:
+            data = json.load(fd)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('format') != CACHE_FORMAT_VERSION:
+        return None
+    if data.get('fingerprint') != list(fingerprint):
+        return None
+    attributes = data.get('attributes')
+    if not isinstance(attributes, dict) or not set(attributes).issubset(CACHED_ATTRIBUTES):
+        return None
+    if any(field not in attributes for field in FIELDS if field != 'win10_update'):
+        return None
+    windows = Windows(backend=backend)
+    windows.__dict__.update(attributes)
+    return windows.freeze()
+
+
+def save(path, fingerprint, windows):
+    attributes = {name: windows.__dict__[name] for name in CACHED_ATTRIBUTES if name in windows.__dict__}
+    data = dict(format=CACHE_FORMAT_VERSION, fingerprint=list(fingerprint), attributes=attributes)
+    return write_json_atomically(path, data)
+
+
+def is_trusted(path):
+    # on posix, a cache file that belongs to someone else, or that others can write to, is ignored.
+    # on Windows the directory's ACL has to keep others out
+    if not hasattr(os, 'geteuid'):
+        return True
+    import stat
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return info.st_uid == os.geteuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def write_json_atomically(path, data):
+    # the file is written to a temporary file and then renamed over the destination, so readers never see a
+    # partially written file
+    from tempfile import mkstemp
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd, temp_path = mkstemp(dir=directory, prefix='.winver-', suffix='.tmp')
+    except (IOError, OSError):
+        return False
+    try:
+        with os.fdopen(fd, 'w') as temp_file:
+            json.dump(data, temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        _replace(temp_path, path)
+    except (IOError, OSError):
+        # caching is best-effort, e.g. another process may be holding the file open on Windows
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def _replace(source, destination):
+    try:
+        os.replace(source, destination)
+    except AttributeError:
+        # python 2
+        if os.name == 'nt' and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+def get_cached_windows(path, backend=None):
+    # returns a frozen Windows instance, loaded from the cache file if the system fingerprint still matches,
+    # otherwise detected from scratch and saved to the cache file
+    from . import Windows
+    from .backends import LiveBackend
+    backend = LiveBackend() if backend is None else backend
+    try:
+        fingerprint = get_fingerprint(backend)
+    except Exception:  # pylint: disable-msg=W0703
+        # no fingerprint, no way to trust the cache
+        return Windows(backend=backend).freeze()
+    windows = load(path, fingerprint, backend)
+    if windows is None:
+        windows = Windows(backend=backend).freeze()
+        if windows.server_core is not None:
+            # an unknown server core state (dism timed out) is not worth keeping until the next boot
+            save(path, fingerprint, windows)
+    return windows
@@ -0,0 +1,189 @@
+# columnar classification with NumPy (optional, numpy is not a dependency of this package), for analytics over the
+# detection data of many hosts at once. the input is one array per probe value, a row per host:
+#   major, minor, build     the version after the registry fix-ups of analyze_major_minor_versions
+#   product_type            OSVERSIONINFOEX.wProductType (VER_NT_*)
+#   release_id              the ReleaseId registry value, anything for versions before Windows 10
+#   product_info            GetProductInfo (PRODUCT_*), anything for versions before Vista
+#   processor_architecture  SYSTEM_INFO.wProcessorArchitecture
+#   suite_mask              OSVERSIONINFOEX.wSuiteMask
+# classify_columns makes the same decisions as analyze_windows_version, analyze_windows10_version/update,
+# analyze_windows5_edition, analyze_windows6_edition and analyze_windows_architecture, with lookups in sorted arrays
+# (searchsorted) instead of branches. the names come back as small integer codes into the name tuples of the result.
+# server core detection from the ServerLevels registry key or dism (Windows Server 2012 and later) is not part of
+# it: server_core reflects the product type only
+from collections import namedtuple
+
+# positions of the parts of the integers the keys are packed into, see _pack and _pack_version
+_MAJOR_SHIFT = 48
+_PRODUCT_SHIFT = 48
+_MINOR_SHIFT = 40
+_RELEASE_SHIFT = 24
+
+Tables = namedtuple('Tables', ('release_table', 'versions', 'updates', 'editions', 'architectures', 'version_keys',
+                               'version_codes', 'release_keys', 'release_versions', 'release_updates',
+                               'release_first_builds', 'product_keys', 'product_editions', 'product_server_core',
+                               'product_hyper_v'))
+
+_tables = None
+
+
+def _pack(product, release_id, build_number):
+    # a release table key as a single integer, products ordered as in the table ('server' < 'workstation')
+    return ((1 if product == 'workstation' else 0) << _PRODUCT_SHIFT) | (release_id << _RELEASE_SHIFT) | build_number
+
+
+def _pack_version(major, minor, release_id, build_number):
+    return (major << _MAJOR_SHIFT) | (minor << _MINOR_SHIFT) | (release_id << _RELEASE_SHIFT) | build_number
+
+
+def _get_tables():
+    # the lookup arrays, built from version_to_name, the release table and the product table
+    global _tables
+    import numpy
+    from . import version_to_name
+    from .products import get_product_table
+    from .result import get_names
+    name_tables = get_names()
+    release_table = name_tables.release_table
+    if _tables is not None and _tables.release_table is release_table:
+        return _tables
+    entries = release_table.get_entries()
+    products = sorted(get_product_table().items())
+    # the same codes as DetectionResult.get_codes
+    versions, updates, editions = name_tables.versions, name_tables.updates, name_tables.editions
+    # version_to_name keys: (major, minor, product_type) is packed with product_type + 1, (major, minor) with 0
+    names = sorted((_pack_version(key[0], key[1], key[2] + 1 if len(key) > 2 else 0, 0), name)
+                   for key, name in version_to_name.items() if key[0] < 10)
+    _tables = Tables(
+        release_table=release_table,
+        versions=versions,
+        updates=updates,
+        editions=editions,
+        architectures=name_tables.architectures,
+        version_keys=numpy.array([key for key, _ in names], dtype=numpy.int64),
+        version_codes=numpy.array([versions.index(name) for _, name in names], dtype=numpy.int16),
+        release_keys=numpy.array([_pack(*key) for key, _ in entries], dtype=numpy.int64),
+        release_versions=numpy.array([versions.index(value[0]) for _, value in entries], dtype=numpy.int16),
+        release_updates=numpy.array([updates.index(value[1] or 'Unknown') for _, value in entries],
+                                    dtype=numpy.int16),
+        release_first_builds=numpy.array([key[2] for key, _ in entries], dtype=numpy.int64),
+        product_keys=numpy.array([product_type for product_type, _ in products], dtype=numpy.int64),
+        product_editions=numpy.array([editions.index(product.edition) for _, product in products],
+                                     dtype=numpy.int16),
+        product_server_core=numpy.array([product.server_core for _, product in products], dtype=bool),
+        product_hyper_v=numpy.array([product.hyper_v for _, product in products], dtype=bool))
+    return _tables
+
+
+def _find(sorted_keys, keys):
+    # returns (index of each key in sorted_keys, whether it was found)
+    import numpy
+    index = numpy.searchsorted(sorted_keys, keys)
+    index = numpy.minimum(index, len(sorted_keys) - 1)
+    return index, sorted_keys[index] == keys
+
+
+class ColumnarClassification(object):
+    # the classification of a set of hosts: arrays of codes into the name tuples, and boolean masks
+    def __init__(self, tables, version, win10_update, edition, server_core, hyper_v, architecture, version_key):
+        # pylint: disable-msg=R0913
+        self.versions = tables.versions
+        self.updates = tables.updates
+        self.editions = tables.editions
+        self.architectures = tables.architectures
+        self.version = version
+        self.win10_update = win10_update
+        self.edition = edition
+        self.server_core = server_core
+        self.hyper_v = hyper_v
+        self.architecture = architecture
+        # the WindowsVersion of each host, packed into an integer that orders the same way
+        self.version_key = version_key
+
+    def __len__(self):
+        return len(self.version)
+
+    def decode(self, field):
+        # e.g. decode('edition') returns the list of edition names
+        names = dict(version=self.versions, win10_update=self.updates, edition=self.editions,
+                     architecture=self.architectures)[field]
+        return [names[code] for code in getattr(self, field).tolist()]
+
+    def version_code(self, name):
+        return self.versions.index(name)
+
+    def _compared_key(self, os_name):
+        from .version import WindowsVersion
+        if not isinstance(os_name, WindowsVersion):
+            os_name = WindowsVersion(os_name)
+        return _pack_version(os_name.major, os_name.minor, os_name.release_id, os_name.build)
+
+    def greater_than(self, os_name):
+        # Windows.greater_than of every host, as a boolean array
+        return self.version_key > self._compared_key(os_name)
+
+    def less_than(self, os_name):
+        return self.version_key < self._compared_key(os_name)
+
+
+def classify_columns(major, minor, build, product_type, release_id, product_info, processor_architecture,
+                     suite_mask):
+    # pylint: disable-msg=R0913,R0914
+    import numpy
+    from .constants import VER_NT_WORKSTATION, PROCESSOR_ARCHITECTURE_AMD64, PROCESSOR_ARCHITECTURE_IA64
+    from .constants import PROCESSOR_ARCHITECTURE_INTEL, VER_SUITE_BACKOFFICE, VER_SUITE_COMPUTE_SERVER
+    from .constants import VER_SUITE_DATACENTER, VER_SUITE_ENTERPRISE, VER_SUITE_STORAGE_SERVER, VER_SUITE_WH_SERVER
+    tables = _get_tables()
+    major, minor, build, product_type, release_id, product_info, processor_architecture, suite_mask = \
+        [numpy.asarray(column, dtype=numpy.int64) for column in (major, minor, build, product_type, release_id,
+                                                                  product_info, processor_architecture, suite_mask)]
+    unknown_version = len(tables.versions) - 1
+    windows10 = major == 10
+    release_id = numpy.where(windows10, release_id, 0)
+
+    # analyze_windows_version: (major, minor, product_type) first, then (major, minor)
+    index, found = _find(tables.version_keys, _pack_version(major, minor, product_type + 1, 0))
+    version = numpy.where(found, tables.version_codes[index], unknown_version)
+    index, found = _find(tables.version_keys, _pack_version(major, minor, 0, 0))
+    version = numpy.where(version == unknown_version, numpy.where(found, tables.version_codes[index], version),
+                          version)
+
+    # analyze_windows10_version / update: the last release table entry at or before the host
+    workstation = numpy.where(product_type == VER_NT_WORKSTATION, 1, 0)
+    keys = (workstation << _PRODUCT_SHIFT) | (release_id << _RELEASE_SHIFT) | build
+    index = numpy.searchsorted(tables.release_keys, keys, side='right') - 1
+    clipped = numpy.maximum(index, 0)
+    entry_keys = tables.release_keys[clipped]
+    listed = (index >= 0) & ((entry_keys >> _PRODUCT_SHIFT) == workstation)
+    same_release = listed & (((entry_keys >> _RELEASE_SHIFT) & 0xffffff) == release_id)
+    version = numpy.where(windows10, numpy.where(listed, tables.release_versions[clipped], unknown_version), version)
+    unknown_update = tables.updates.index('Unknown')
+    win10_update = numpy.where(windows10, numpy.where(same_release, tables.release_updates[clipped], unknown_update),
+                               tables.updates.index(None))
+
+    # analyze_windows_edition: suite mask for 5.x, product type for 6.x and 10
+    editions = tables.editions
+    edition5 = numpy.select([suite_mask & mask != 0 for mask in (VER_SUITE_BACKOFFICE, VER_SUITE_COMPUTE_SERVER,
+                                                                 VER_SUITE_DATACENTER, VER_SUITE_ENTERPRISE,
+                                                                 VER_SUITE_STORAGE_SERVER, VER_SUITE_WH_SERVER)],
+                            [editions.index(name) for name in ('BackOffice', 'Compute Cluster', 'Datacenter',
+                                                               'Enterprise', 'Storage', 'Home')],
+                            editions.index('Standard'))
+    index, found = _find(tables.product_keys, product_info)
+    edition6 = numpy.where(found, tables.product_editions[index], editions.index('Client'))
+    windows6 = (major == 6) | windows10
+    edition = numpy.select([major == 5, windows6], [edition5, edition6], editions.index('Unknown'))
+    server_core = windows6 & found & tables.product_server_core[index]
+    hyper_v = windows6 & found & tables.product_hyper_v[index]
+
+    architecture = numpy.select([processor_architecture == PROCESSOR_ARCHITECTURE_AMD64,
+                                 processor_architecture == PROCESSOR_ARCHITECTURE_IA64,
+                                 processor_architecture == PROCESSOR_ARCHITECTURE_INTEL], [1, 2, 0], 3)
+
+    # version_info, see version.get_windows10_version
+    first_build = numpy.where(same_release, tables.release_first_builds[clipped], 0)
+    version_key = numpy.where(windows10, _pack_version(major, minor, release_id, first_build),
+                              _pack_version(major, minor, 0, 0))
+    return ColumnarClassification(tables, version.astype(numpy.int16), win10_update.astype(numpy.int16),
+                                  edition.astype(numpy.int16), server_core, hyper_v, architecture.astype(numpy.int8),
+                                  version_key)
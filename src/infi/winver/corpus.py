@@ -0,0 +1,402 @@
+# a compact binary file of many snapshots (see backends.py), for fleet-sized collections that are slow to parse as
+# JSON. the file is
+#   header      magic, format, record size and count, where the index starts, and CRC32s of the index and header
+#   records     fixed-width records, one per snapshot (RECORD_SIZE bytes each)
+#   index       the CRC32 of every record, for corruption checks
+# a record is the raw SYSTEM_INFO bytes (padded to the native 64-bit size), the raw OSVERSIONINFOEX bytes and a tail
+# (TAIL) with the product info and the registry values Windows reads. registry values are stored in fixed-width
+# fields, so only values with the usual types fit (e.g. a numeric ReleaseId); dism output is stored as its answer only.
+# the reader maps the file into memory (copy-on-write, it is never written) and the structures are ctypes structures
+# over memoryview slices of the mapping, so reading a record copies nothing. records are read by number, so workers
+# can each scan their own range of the same file, and the page cache holds one copy of it for all of them
+import os
+import mmap
+import struct
+from array import array
+from zlib import crc32
+from .backends import ProbeBackend
+
+MAGIC = b'WINVERSC'
+CORPUS_FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sHHIQQII')
+
+SYSTEM_INFO_SIZE = 48
+VERSION_EX_SIZE = 156
+
+# product info, flags, dism, CurrentVersion state and values present, ServerLevels state and values present,
+# CurrentVersion as major and minor, ReleaseId, CurrentMajorVersionNumber, CurrentMinorVersionNumber,
+# CurrentBuildNumber, UBR, DisplayVersion, the three ServerLevels values
+TAIL = struct.Struct('<IBBBBBBBBIIIII8sIII')
+
+RECORD_SIZE = SYSTEM_INFO_SIZE + VERSION_EX_SIZE + TAIL.size
+
+# flags
+PRODUCT_INFO_RECORDED = 0x1
+PRODUCT_INFO_NONE = 0x2
+SYSTEM_INFO_32BIT = 0x4
+
+# registry key states
+KEY_MISSING = 0
+KEY_VALUES = 1
+KEY_ACCESS_DENIED = 2
+
+# dism states
+DISM_NOT_RECORDED = 0
+DISM_TIMED_OUT = 1
+DISM_SERVER_CORE = 2
+DISM_FULL_SERVER = 3
+
+# the integer values of CurrentVersion, in TAIL order, and which of them are strings in the registry
+CURRENT_VERSION_NUMBERS = ('ReleaseId', 'CurrentMajorVersionNumber', 'CurrentMinorVersionNumber',
+                           'CurrentBuildNumber', 'UBR')
+REGISTRY_STRINGS = ('ReleaseId', 'CurrentBuildNumber')
+SERVER_LEVELS_VALUES = ('ServerCore', 'Server-Gui-Mgmt', 'Server-Gui-Shell')
+# bit of each value in the "values present" mask
+CURRENT_VERSION_BITS = CURRENT_VERSION_NUMBERS + ('CurrentVersion', 'DisplayVersion')
+
+
+def _encode_key(recorded, names):
+    if recorded is None or recorded.get('error') == 'missing':
+        return KEY_MISSING, {}
+    if recorded.get('error') == 'access_denied':
+        return KEY_ACCESS_DENIED, {}
+    values = recorded['values']
+    unknown = [name for name in values if name not in names]
+    if unknown:
+        raise ValueError("Cannot store registry values {}".format(", ".join(unknown)))
+    return KEY_VALUES, values
+
+
+def _to_int(name, value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("Cannot store {} = {!r}".format(name, value))
+
+
+def encode_record(snapshot):
+    # returns the RECORD_SIZE bytes of a snapshot
+    from binascii import unhexlify
+    from .backends import SNAPSHOT_FORMAT_VERSION, CURRENT_VERSION_KEY, SERVER_LEVELS_KEY
+    from .dism import is_server_core
+    if snapshot.get('format') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError("Unsupported snapshot format {!r}".format(snapshot.get('format')))
+    version_ex = unhexlify(snapshot['version_ex'])
+    system_info = unhexlify(snapshot['system_info'])
+    if len(version_ex) != VERSION_EX_SIZE or len(system_info) > SYSTEM_INFO_SIZE:
+        raise ValueError("Unexpected structure sizes")
+    flags = 0 if len(system_info) == SYSTEM_INFO_SIZE else SYSTEM_INFO_32BIT
+    product_info = 0
+    if 'product_info' in snapshot:
+        flags |= PRODUCT_INFO_RECORDED
+        if snapshot['product_info'] is None:
+            flags |= PRODUCT_INFO_NONE
+        else:
+            product_info = snapshot['product_info']
+    if 'dism' not in snapshot:
+        dism = DISM_NOT_RECORDED
+    elif snapshot['dism'] is None:
+        dism = DISM_TIMED_OUT
+    else:
+        dism = DISM_SERVER_CORE if is_server_core(snapshot['dism']) else DISM_FULL_SERVER
+    registry = dict(snapshot.get('registry', {}))
+    current_state, current = _encode_key(registry.pop(CURRENT_VERSION_KEY, None), CURRENT_VERSION_BITS)
+    levels_state, levels = _encode_key(registry.pop(SERVER_LEVELS_KEY, None), SERVER_LEVELS_VALUES)
+    if registry:
+        raise ValueError("Cannot store registry keys {}".format(", ".join(registry)))
+    current_present = sum(1 << bit for bit, name in enumerate(CURRENT_VERSION_BITS) if name in current)
+    levels_present = sum(1 << bit for bit, name in enumerate(SERVER_LEVELS_VALUES) if name in levels)
+    version_major, version_minor = 0, 0
+    if 'CurrentVersion' in current:
+        version_major, version_minor = [_to_int('CurrentVersion', part)
+                                        for part in current['CurrentVersion'].split('.')]
+    display_version = current.get('DisplayVersion', '').encode('ascii')
+    if len(display_version) > 8:
+        raise ValueError("Cannot store DisplayVersion = {!r}".format(current['DisplayVersion']))
+    tail = TAIL.pack(product_info, flags, dism, current_state, current_present, levels_state, levels_present,
+                     version_major, version_minor,
+                     *([_to_int(name, current.get(name, 0)) for name in CURRENT_VERSION_NUMBERS] + [display_version] +
+                       [_to_int(name, levels.get(name, 0)) for name in SERVER_LEVELS_VALUES]))
+    return system_info.ljust(SYSTEM_INFO_SIZE, b'\0') + version_ex + tail
+
+
+class CorpusWriter(object):
+    # writes snapshots to a new corpus file. the records go to a temporary file next to it, which close() completes
+    # with the header and renames over "path". a file that is being replaced is never written to, so readers that
+    # mapped it keep reading the old records (truncating a mapped file crashes them with SIGBUS)
+    def __init__(self, path):
+        from tempfile import mkstemp
+        self.path = path
+        fd, self._temp_path = mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.winver-', suffix='.tmp')
+        self._fd = os.fdopen(fd, 'wb')
+        self._fd.write(b'\0' * HEADER.size)
+        self._crcs = array('I')
+
+    def write(self, snapshot):
+        record = encode_record(snapshot)
+        self._fd.write(record)
+        self._crcs.append(crc32(record) & 0xffffffff)
+
+    def close(self):
+        from .cache import _replace
+        if self._fd is None:
+            return
+        index = self._crcs.tobytes() if hasattr(self._crcs, 'tobytes') else self._crcs.tostring()
+        index_offset = HEADER.size + len(self._crcs) * RECORD_SIZE
+        self._fd.write(index)
+        header = HEADER.pack(MAGIC, CORPUS_FORMAT_VERSION, HEADER.size, RECORD_SIZE, len(self._crcs), index_offset,
+                             crc32(index) & 0xffffffff, 0)
+        self._fd.seek(0)
+        self._fd.write(header[:-4] + struct.pack('<I', crc32(header[:-4]) & 0xffffffff))
+        self._fd.flush()
+        os.fsync(self._fd.fileno())
+        self._fd.close()
+        self._fd = None
+        _replace(self._temp_path, self.path)
+
+    def abort(self):
+        # removes the temporary file, whatever was at "path" stays as it was
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_corpus(path, snapshots):
+    # returns the number of snapshots written
+    with CorpusWriter(path) as writer:
+        for snapshot in snapshots:
+            writer.write(snapshot)
+        return len(writer._crcs)  # pylint: disable-msg=W0212
+
+
+class CorpusReader(object):
+    # reader[number] returns a RecordBackend, for Windows(backend=...). raises ValueError if the file is not a valid
+    # corpus; with verify=True, every record is checked against its CRC32 when it is read.
+    # the ctypes structures of the records point into the mapping, so it stays mapped as long as they are alive
+    def __init__(self, path, verify=False):
+        self.path = path
+        self.verify_records = verify
+        self._mmap = None
+        self._view = None
+        with open(path, 'rb') as fd:
+            stat = os.fstat(fd.fileno())
+            size = stat.st_size
+            # see get_reader
+            self._identity = _get_identity(stat)
+            if size < HEADER.size:
+                raise ValueError("{} is not a corpus file".format(path))
+            self._mmap = mmap.mmap(fd.fileno(), size, access=mmap.ACCESS_COPY)
+        try:
+            self._view = memoryview(self._mmap)
+            self._read_header(size)
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self, size):
+        magic, version, header_size, record_size, count, index_offset, index_crc, header_crc = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a corpus file".format(self.path))
+        if version != CORPUS_FORMAT_VERSION:
+            raise ValueError("Unsupported corpus format {} in {}".format(version, self.path))
+        if crc32(self._view[:HEADER.size - 4].tobytes()) & 0xffffffff != header_crc:
+            raise ValueError("Corrupt header in {}".format(self.path))
+        if header_size != HEADER.size or record_size != RECORD_SIZE or \
+                index_offset != header_size + count * record_size or size != index_offset + count * 4:
+            raise ValueError("Corrupt or truncated corpus {}".format(self.path))
+        self._count = count
+        self._index = array('I')
+        index = self._view[index_offset:size].tobytes()
+        if crc32(index) & 0xffffffff != index_crc:
+            raise ValueError("Corrupt index in {}".format(self.path))
+        if hasattr(self._index, 'frombytes'):
+            self._index.frombytes(index)
+        else:
+            self._index.fromstring(index)
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, number):
+        if not 0 <= number < self._count:
+            raise IndexError(number)
+        offset = HEADER.size + number * RECORD_SIZE
+        return self._view[offset:offset + RECORD_SIZE]
+
+    def verify_record(self, number):
+        if crc32(self._record(number)) & 0xffffffff != self._index[number]:
+            raise ValueError("Corrupt record {} in {}".format(number, self.path))
+
+    def verify(self):
+        for number in range(self._count):
+            self.verify_record(number)
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += self._count
+        if self.verify_records:
+            self.verify_record(number)
+        return RecordBackend(self._record(number))
+
+    def scan(self, start=0, stop=None):
+        # yields the records from "start" up to "stop", in order
+        for number in range(start, self._count if stop is None else min(stop, self._count)):
+            yield self[number]
+
+    def __iter__(self):
+        return self.scan()
+
+    def close(self):
+        if self._mmap is not None:
+            mapping, self._mmap, self._view = self._mmap, None, None
+            try:
+                mapping.close()
+            except BufferError:
+                # records that are still alive point into the mapping, it is unmapped once they are gone
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordBackend(ProbeBackend):
+    # a probe backend that replays a corpus record, like ReplayBackend replays a snapshot
+    def __init__(self, record):
+        self._record = record
+        self._tail = TAIL.unpack_from(record, SYSTEM_INFO_SIZE + VERSION_EX_SIZE)
+
+    def get_version_ex(self):
+        from .structures import OSVersionExStructure, from_buffer
+        return from_buffer(OSVersionExStructure, self._record[SYSTEM_INFO_SIZE:SYSTEM_INFO_SIZE + VERSION_EX_SIZE])
+
+    def get_system_info(self):
+        from .structures import SystemInfoStructure, SystemInfo32Structure, from_buffer
+        structure = SystemInfo32Structure if self._tail[1] & SYSTEM_INFO_32BIT else SystemInfoStructure
+        return from_buffer(structure, self._record[:SYSTEM_INFO_SIZE])
+
+    def get_product_info(self, major_version, minor_version, service_pack_major, service_pack_minor):
+        product_info, flags = self._tail[:2]
+        if not flags & PRODUCT_INFO_RECORDED:
+            raise ValueError("Record does not contain product_info")
+        return None if flags & PRODUCT_INFO_NONE else product_info
+
+    def _get_key(self, key):
+        # returns the recorded values of a key, or raises like the registry would
+        from infi.registry.errors import AccessDeniedException
+        from .backends import CURRENT_VERSION_KEY, SERVER_LEVELS_KEY
+        (_, _, _, current_state, current_present, levels_state, levels_present, version_major, version_minor,
+         release_id, major, minor, build, ubr, display_version, server_core, gui_mgmt, gui_shell) = self._tail
+        if key == CURRENT_VERSION_KEY:
+            state, present = current_state, current_present
+            values = dict(zip(CURRENT_VERSION_BITS, (release_id, major, minor, build, ubr,
+                                                     "{}.{}".format(version_major, version_minor),
+                                                     display_version.rstrip(b'\0').decode('ascii'))))
+            for name in REGISTRY_STRINGS:
+                values[name] = str(values[name])
+            names = CURRENT_VERSION_BITS
+        elif key == SERVER_LEVELS_KEY:
+            state, present = levels_state, levels_present
+            values = dict(zip(SERVER_LEVELS_VALUES, (server_core, gui_mgmt, gui_shell)))
+            names = SERVER_LEVELS_VALUES
+        else:
+            state = KEY_MISSING
+        if state == KEY_MISSING:
+            raise KeyError(key)
+        if state == KEY_ACCESS_DENIED:
+            raise AccessDeniedException(key)
+        return dict((name, values[name]) for bit, name in enumerate(names) if present & (1 << bit))
+
+    def get_registry_values(self, key, names):
+        values = self._get_key(key)
+        return dict((name, values[name]) for name in names if name in values)
+
+    def get_dism_features(self):
+        from .dism import SERVER_CORE_FEATURE
+        dism = self._tail[2]
+        if dism == DISM_NOT_RECORDED:
+            raise ValueError("Record does not contain dism")
+        if dism == DISM_TIMED_OUT:
+            return None
+        return "{} | {}\n".format(SERVER_CORE_FEATURE, "Disabled" if dism == DISM_SERVER_CORE else "Enabled")
+
+    def to_snapshot(self):
+        # the record as a snapshot. the dism output is reduced to its ServerCore-FullServer line
+        from binascii import hexlify
+        from ctypes import sizeof
+        from infi.registry.errors import AccessDeniedException
+        from .backends import SNAPSHOT_FORMAT_VERSION, CURRENT_VERSION_KEY, SERVER_LEVELS_KEY
+        from .structures import SystemInfo32Structure
+        flags, dism = self._tail[1:3]
+        version_ex = self._record[SYSTEM_INFO_SIZE:SYSTEM_INFO_SIZE + VERSION_EX_SIZE].tobytes()
+        system_info = self._record[:sizeof(SystemInfo32Structure) if flags & SYSTEM_INFO_32BIT else SYSTEM_INFO_SIZE]
+        snapshot = dict(format=SNAPSHOT_FORMAT_VERSION, version_ex=hexlify(version_ex).decode('ascii'),
+                        system_info=hexlify(system_info.tobytes()).decode('ascii'), registry={})
+        if flags & PRODUCT_INFO_RECORDED:
+            snapshot['product_info'] = self.get_product_info(0, 0, 0, 0)
+        if dism != DISM_NOT_RECORDED:
+            snapshot['dism'] = self.get_dism_features()
+        for key in (CURRENT_VERSION_KEY, SERVER_LEVELS_KEY):
+            try:
+                snapshot['registry'][key] = dict(values=self._get_key(key))
+            except KeyError:
+                pass
+            except AccessDeniedException:
+                snapshot['registry'][key] = dict(error='access_denied')
+        return snapshot
+
+
+# path -> CorpusReader, so every worker process maps a corpus once
+_readers = {}
+
+
+def _get_identity(stat):
+    return stat.st_ino, stat.st_mtime, stat.st_size
+
+
+def get_reader(path):
+    # a corpus that was written again since it was mapped is mapped again
+    reader = _readers.get(path)
+    if reader is not None and reader._identity != _get_identity(os.stat(path)):  # pylint: disable-msg=W0212
+        reader.close()
+        reader = None
+    if reader is None:
+        reader = _readers[path] = CorpusReader(path)
+    return reader
+
+
+def classify_range(path, ranges, memo=False):
+    # the classifier classify_corpus runs in the workers: "ranges" is a list of (start, stop) record numbers
+    from .batch import classify_backend
+    if memo:
+        from .memo import get_memo
+        classify_backend = get_memo().classify_backend
+    reader = get_reader(path)
+    return [classify_backend(backend) for start, stop in ranges for backend in reader.scan(start, stop)]
+
+
+def classify_corpus(path, workers=1, chunksize=4096, ordered=True, memo=False):
+    # yields the DetectionResult of every record, see batch.classify_many. the workers read the records from the file
+    # themselves, only record numbers and results go between the processes
+    from functools import partial
+    from .batch import classify_many
+    with CorpusReader(path) as reader:
+        count = len(reader)
+    ranges = ((start, start + chunksize) for start in range(0, count, chunksize))
+    for result in classify_many(ranges, workers=workers, chunksize=1, ordered=ordered,
+                                classifier=partial(classify_range, os.path.abspath(path)), memo=memo):
+        yield result
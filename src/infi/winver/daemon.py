@@ -0,0 +1,425 @@
+# a local detection daemon, for hosts on which many short-lived processes would otherwise each run the detection
+# (and dism) on their own. the daemon detects once, keeps the result, and answers requests over a Unix socket (or a
+# named pipe on Windows); clients keep a small pool of connections and detect in-process when there is no daemon.
+# the transport is multiprocessing.connection, which frames every message with its length. a request is an opcode
+# byte and its argument, a response is a status byte and its payload:
+#   R                 -> the DetectionResult, as the compact JSON of DetectionResult.to_dict()
+#   Q <requirement>   -> 1 or 0: whether the host meets the requirement expression (see requirements.py)
+#   P                 -> nothing: ping
+#   I                 -> nothing: drop the result and detect again (see DetectionServer._invalidate)
+# errors are answered with status E and the error message. the result is JSON rather than a pickle, so a client
+# never unpickles what another local user may have put behind the socket.
+# the socket lives in a directory only its user can use (see get_runtime_directory), and the daemon and its clients
+# authenticate each other with a random key kept in a file next to the socket (see get_authkey), so a daemon serves
+# the processes of its own user only. invalidations re-run the detection (and maybe dism), so they are rate limited
+import os
+import sys
+import json
+import stat
+import threading
+
+OP_RESULT = b'R'
+OP_QUERY = b'Q'
+OP_PING = b'P'
+OP_INVALIDATE = b'I'
+
+STATUS_OK = b'O'
+STATUS_ERROR = b'E'
+
+DEFAULT_POOL_SIZE = 4
+
+# seconds a client waits for a response before giving up on the daemon
+DEFAULT_TIMEOUT = 5
+
+# invalidations within this many seconds of the last detection are answered without detecting again
+DEFAULT_INVALIDATE_INTERVAL = 10
+
+AUTHKEY_SIZE = 32
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+def get_runtime_directory():
+    # a directory for the socket and the key that only this user can use: in $XDG_RUNTIME_DIR if it is set, otherwise
+    # a per-user directory in the temp directory, which must be this user's and not open to others
+    if sys.platform == 'win32':
+        path = os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~'), 'infi.winver')
+    elif os.environ.get('XDG_RUNTIME_DIR'):
+        path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'infi.winver')
+    else:
+        from tempfile import gettempdir
+        path = os.path.join(gettempdir(), 'infi.winver-{}'.format(os.geteuid()))
+    try:
+        os.mkdir(path, 0o700)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    _check_private(path, stat.S_ISDIR)
+    return path
+
+
+def get_default_address():
+    if sys.platform == 'win32':
+        import getpass
+        return r'\\.\pipe\infi.winver.{}'.format(getpass.getuser())
+    return os.path.join(get_runtime_directory(), 'daemon.sock')
+
+
+def _check_private(path, is_kind, closed=True):
+    # raises DaemonUnavailable unless "path" is of the kind is_kind checks (e.g. stat.S_ISDIR), belongs to this user
+    # and (if "closed") has no permissions for others. symbolic links are not followed. on Windows, the ACL of the
+    # directory keeps others out
+    if sys.platform == 'win32':
+        return
+    try:
+        info = os.lstat(path)
+    except OSError as error:
+        raise DaemonUnavailable("Cannot use {}: {}".format(path, error))
+    if not is_kind(info.st_mode) or info.st_uid != os.geteuid() or \
+            (closed and info.st_mode & (stat.S_IRWXG | stat.S_IRWXO)):
+        raise DaemonUnavailable("{} is not private to this user".format(path))
+
+
+def _check_private_socket(address):
+    # the socket gets the permissions of the umask, the directory it is in keeps others out
+    _check_private(address, stat.S_ISSOCK, closed=False)
+
+
+def _get_authkey_path(address):
+    if sys.platform == 'win32':
+        return os.path.join(get_runtime_directory(), address.rpartition('\\')[2] + '.key')
+    return address + '.key'
+
+
+def get_authkey(address):
+    # returns the key the daemon listening on "address" was started with. raises DaemonUnavailable if there is none,
+    # or if the key file is not private to this user
+    path = _get_authkey_path(address)
+    _check_private(path, stat.S_ISREG)
+    try:
+        with open(path, 'rb') as fd:
+            return fd.read()
+    except (IOError, OSError) as error:
+        raise DaemonUnavailable("Cannot read the key of {}: {}".format(address, error))
+
+
+def create_authkey(address):
+    # writes a new random key for a daemon about to listen on "address", readable by this user only, and returns it
+    from tempfile import mkstemp
+    from .cache import _replace
+    path = _get_authkey_path(address)
+    authkey = os.urandom(AUTHKEY_SIZE)
+    # mkstemp creates the file with mode 0600
+    fd, temp_path = mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.winver-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(authkey)
+        _replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return authkey
+
+
+def _shutdown(connection):
+    # ends a connection another thread is reading from: its thread sees the end of the stream and closes it (closing
+    # it from here could pull the file descriptor from under the read). named pipes are left to the process exit
+    import socket
+    if sys.platform == 'win32':
+        return
+    try:
+        sock = socket.fromfd(connection.fileno(), socket.AF_UNIX, socket.SOCK_STREAM)
+    except (IOError, OSError):
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except (IOError, OSError):
+        pass
+    finally:
+        sock.close()
+
+
+class DetectionServer(object):
+    def __init__(self, address=None, backend=None, invalidate_interval=DEFAULT_INVALIDATE_INTERVAL):
+        # a Unix socket must be in a directory that is private to this user (see get_runtime_directory)
+        from multiprocessing.connection import Listener
+        self.address = get_default_address() if address is None else address
+        self.invalidate_interval = invalidate_interval
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._detect_lock = threading.Lock()
+        self._result = None
+        self._encoded = None
+        self._detected_at = None
+        self._closed = False
+        self._connections = set()
+        self.accepted = 0
+        self.detections = 0
+        if sys.platform != 'win32':
+            _check_private(os.path.dirname(os.path.abspath(self.address)), stat.S_ISDIR)
+        self._detect()
+        self._remove_stale_socket()
+        self._authkey = create_authkey(self.address)
+        self._listener = Listener(self.address)
+        self._thread = None
+
+    def _remove_stale_socket(self):
+        # a Unix socket file is left behind by a daemon that did not exit cleanly. only a socket of this user that
+        # nobody listens on is removed
+        from multiprocessing.connection import Client
+        if sys.platform == 'win32' or not os.path.lexists(self.address):
+            return
+        _check_private_socket(self.address)
+        try:
+            Client(self.address).close()
+        except (IOError, OSError):
+            os.remove(self.address)
+            return
+        raise DaemonUnavailable("Another daemon is listening on {}".format(self.address))
+
+    def _detect(self):
+        from . import Windows
+        from ._compat import monotonic
+        from .result import DetectionResult
+        result = DetectionResult.from_windows(Windows(backend=self._backend).freeze())
+        encoded = json.dumps(result.to_dict(), separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self._result, self._encoded = result, encoded
+            self._detected_at = monotonic()
+            self.detections += 1
+
+    def _invalidate(self):
+        # one detection at a time; invalidations that come in while one runs, or soon after it, share its result
+        from ._compat import monotonic
+        with self._detect_lock:
+            if monotonic() - self._detected_at >= self.invalidate_interval:
+                self._detect()
+
+    def handle(self, request):
+        # returns the response to "request"
+        from . import requirement
+        opcode, argument = request[:1], request[1:]
+        try:
+            if opcode == OP_RESULT:
+                return STATUS_OK + self._encoded
+            if opcode == OP_QUERY:
+                return STATUS_OK + (b'1' if requirement(argument.decode('utf-8'))(self._result) else b'0')
+            if opcode == OP_PING:
+                return STATUS_OK
+            if opcode == OP_INVALIDATE:
+                self._invalidate()
+                return STATUS_OK
+            raise ValueError("Unknown request {!r}".format(opcode))
+        except Exception as error:  # pylint: disable-msg=W0703
+            return STATUS_ERROR + "{}: {}".format(type(error).__name__, error).encode('utf-8')
+
+    def _serve_connection(self, connection):
+        # the handshake runs here rather than in accept(), so a client that does not answer it holds up only its own
+        # connection
+        from multiprocessing.connection import deliver_challenge, answer_challenge, AuthenticationError
+        try:
+            try:
+                deliver_challenge(connection, self._authkey)
+                answer_challenge(connection, self._authkey)
+            except (AuthenticationError, EOFError):
+                return
+            while True:
+                try:
+                    request = connection.recv_bytes()
+                except (EOFError, IOError, OSError):
+                    return
+                connection.send_bytes(self.handle(request))
+        except (IOError, OSError):
+            pass
+        finally:
+            connection.close()
+            with self._lock:
+                self._connections.discard(connection)
+
+    def serve_forever(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (IOError, OSError, EOFError):
+                if self._closed:
+                    return
+                continue
+            if self._closed:
+                # the connection close() makes to wake up accept()
+                connection.close()
+                return
+            with self._lock:
+                self._connections.add(connection)
+                self.accepted += 1
+            thread = threading.Thread(target=self._serve_connection, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def start(self):
+        # serves in a background thread; returns self
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def close(self):
+        from multiprocessing.connection import Client
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            # wake up accept()
+            try:
+                Client(self.address).close()
+            except (IOError, OSError):
+                pass
+            self._thread.join()
+        self._listener.close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            _shutdown(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DetectionClient(object):
+    def __init__(self, address=None, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, fallback=True,
+                 backend=None, authkey=None):
+        # with fallback=True, requests the daemon cannot answer are answered by detecting in this process (with
+        # "backend", or get_windows() by default); otherwise they raise DaemonUnavailable.
+        # the key is read from the daemon's key file (see get_authkey) unless it is given
+        # pylint: disable-msg=R0913
+        self.address = get_default_address() if address is None else address
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.fallback = fallback
+        self._backend = backend
+        self._authkey = authkey
+        self._pool = []
+        self._lock = threading.Lock()
+        self._local = None
+        self.fallbacks = 0
+
+    def _connect(self):
+        # returns (connection, whether it came from the pool)
+        with self._lock:
+            if self._pool:
+                return self._pool.pop(), True
+        return self._open(), False
+
+    def _open(self):
+        from multiprocessing.connection import Client, AuthenticationError
+        try:
+            if sys.platform != 'win32':
+                # the daemon of this user, not a socket someone else put there
+                _check_private_socket(self.address)
+            authkey = get_authkey(self.address) if self._authkey is None else self._authkey
+            return Client(self.address, authkey=authkey)
+        except (IOError, OSError, EOFError, AuthenticationError) as error:
+            raise DaemonUnavailable("Cannot connect to {}: {}".format(self.address, error))
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(connection)
+                return
+        connection.close()
+
+    def _send(self, connection, request):
+        # returns the response, or None if the connection was lost
+        try:
+            connection.send_bytes(request)
+            if not connection.poll(self.timeout):
+                connection.close()
+                raise DaemonUnavailable("No response from {} in {} seconds".format(self.address, self.timeout))
+            return connection.recv_bytes()
+        except (IOError, OSError, EOFError):
+            connection.close()
+            return None
+
+    def request(self, opcode, argument=b''):
+        # returns the payload of the response to the request. raises DaemonUnavailable if the daemon did not answer,
+        # and ValueError with the daemon's message if it answered with an error
+        connection, pooled = self._connect()
+        response = self._send(connection, opcode + argument)
+        if response is None and pooled:
+            # the pooled connection was lost, e.g. the daemon was restarted: one more try on a new connection
+            connection = self._open()
+            response = self._send(connection, opcode + argument)
+        if response is None:
+            raise DaemonUnavailable("Lost the connection to {}".format(self.address))
+        self._release(connection)
+        status, payload = response[:1], response[1:]
+        if status != STATUS_OK:
+            raise ValueError(payload.decode('utf-8'))
+        return payload
+
+    def _get_local_windows(self):
+        from . import Windows, get_windows
+        self.fallbacks += 1
+        if self._backend is None:
+            return get_windows()
+        if self._local is None:
+            self._local = Windows(backend=self._backend).freeze()
+        return self._local
+
+    def _call(self, remote, local):
+        try:
+            return remote()
+        except DaemonUnavailable:
+            if not self.fallback:
+                raise
+        return local(self._get_local_windows())
+
+    def get_result(self):
+        # returns the DetectionResult of this host
+        from .result import DetectionResult
+        return self._call(lambda: DetectionResult.from_dict(json.loads(self.request(OP_RESULT).decode('utf-8'))),
+                          DetectionResult.from_windows)
+
+    def check(self, text):
+        # returns whether this host meets the requirement expression "text"
+        from . import requirement
+        return self._call(lambda: self.request(OP_QUERY, text.encode('utf-8')) == b'1',
+                          lambda windows: requirement(text)(windows))
+
+    def ping(self):
+        # returns whether the daemon answers
+        try:
+            self.request(OP_PING)
+        except DaemonUnavailable:
+            return False
+        return True
+
+    def invalidate(self):
+        self.request(OP_INVALIDATE)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for connection in pool:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def serve(address=None, backend=None, invalidate_interval=DEFAULT_INVALIDATE_INTERVAL):
+    # runs a daemon in this thread until it is interrupted
+    server = DetectionServer(address, backend, invalidate_interval)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,96 @@
+# a differential harness: runs the analysis of Windows and an alternative implementation (a faster parser or
+# classifier) on the same snapshots, and reports where they disagree and how their throughputs compare.
+# an implementation is a callable that takes a snapshot and returns an object with the fields of a DetectionResult
+# (or a dict of them); raising an exception counts as a result, which the other implementation must match by raising
+# an exception of the same type
+from ._compat import monotonic
+
+# mismatches kept in a report, the rest are only counted
+MAX_MISMATCHES = 100
+
+ERROR_FIELD = 'error'
+
+
+def analyze(snapshot):
+    # the reference implementation: Windows.analyze on the replayed snapshot
+    from . import Windows
+    from .backends import ReplayBackend
+    from .result import DetectionResult
+    windows = Windows(backend=ReplayBackend(snapshot))
+    windows.analyze()
+    return DetectionResult.from_windows(windows)
+
+
+class Mismatch(object):
+    __slots__ = ('index', 'snapshot', 'field', 'expected', 'actual')
+
+    def __init__(self, index, snapshot, field, expected, actual):
+        # pylint: disable-msg=R0913
+        self.index, self.snapshot, self.field, self.expected, self.actual = index, snapshot, field, expected, actual
+
+    def __repr__(self):
+        return "<Mismatch of {} in snapshot {}: expected {!r}, got {!r}>".format(self.field, self.index,
+                                                                                  self.expected, self.actual)
+
+
+class DifferentialReport(object):
+    def __init__(self, fields):
+        self.fields = fields
+        self.count = 0
+        self.mismatch_count = 0
+        # the first MAX_MISMATCHES mismatches
+        self.mismatches = []
+        self.reference_time = 0.0
+        self.alternative_time = 0.0
+
+    def get_speedup(self):
+        # the throughput of the alternative relative to the reference
+        return self.reference_time / self.alternative_time if self.alternative_time else float('inf')
+
+    def __str__(self):
+        lines = ["{} snapshots, {} mismatching; reference {:.0f}/sec, alternative {:.0f}/sec ({:.2f}x)".format(
+            self.count, self.mismatch_count, self.count / self.reference_time if self.reference_time else 0,
+            self.count / self.alternative_time if self.alternative_time else 0, self.get_speedup())]
+        lines.extend("  {!r}".format(mismatch) for mismatch in self.mismatches)
+        return "\n".join(lines)
+
+
+def _run(implementation, snapshot):
+    start = monotonic()
+    try:
+        result = implementation(snapshot)
+    except Exception as error:  # pylint: disable-msg=W0703
+        result = error
+    return result, monotonic() - start
+
+
+def _get_values(result, fields):
+    if isinstance(result, Exception):
+        return {ERROR_FIELD: type(result).__name__}
+    if isinstance(result, dict):
+        return dict((name, result.get(name)) for name in fields)
+    return dict((name, getattr(result, name, None)) for name in fields)
+
+
+def compare(alternative, snapshots, reference=analyze, fields=None):
+    # runs "reference" and "alternative" on every snapshot and returns a DifferentialReport. "fields" are the fields
+    # compared, all the fields of a DetectionResult by default
+    from .result import RESULT_FIELDS
+    fields = RESULT_FIELDS if fields is None else tuple(fields)
+    report = DifferentialReport(fields)
+    for index, snapshot in enumerate(snapshots):
+        expected, reference_time = _run(reference, snapshot)
+        actual, alternative_time = _run(alternative, snapshot)
+        report.reference_time += reference_time
+        report.alternative_time += alternative_time
+        report.count += 1
+        expected, actual = _get_values(expected, fields), _get_values(actual, fields)
+        if expected == actual:
+            continue
+        report.mismatch_count += 1
+        if len(report.mismatches) < MAX_MISMATCHES:
+            for field in sorted(set(expected) | set(actual)):
+                if expected.get(field) != actual.get(field):
+                    report.mismatches.append(Mismatch(index, snapshot, field, expected.get(field), actual.get(field)))
+                    break
+    return report
@@ -0,0 +1,119 @@
+# server core detection with dism.exe, for when the ServerLevels registry key cannot be read.
+# "dism /online /get-features" is slow, so its output is read as it is written and the process is killed as soon as
+# the ServerCore-FullServer line shows up. if dism does not get there within the timeout, the result is unknown.
+# dism's answer does not change until the next boot, so the lines it printed can also be kept in a small per-boot
+# cache file (see get_features). the cache is opt-in: its path must be in a directory only the caller can write to,
+# since whoever plants the file decides the result
+import os
+import json
+
+SERVER_CORE_FEATURE = "ServerCore-FullServer"
+
+DEFAULT_TIMEOUT = 60
+
+# no cache by default, see above
+DEFAULT_CACHE_PATH = None
+
+# see cache.BOOT_TIME_RESOLUTION
+BOOT_TIME_RESOLUTION = 60
+
+
+def get_command():
+    # http://stackoverflow.com/questions/13065479/how-to-detect-windows-2012-core-edition-c
+    dism = os.path.join(os.environ.get("SYSTEMROOT"), "System32", "dism.exe")
+    return [dism, "/online", "/get-features", "/format:table"]
+
+
+def is_server_core(output):
+    # the full server feature is disabled on server core installations
+    return any(SERVER_CORE_FEATURE in line and "Disabled" in line for line in output.splitlines())
+
+
+def read_features(command, timeout=DEFAULT_TIMEOUT):
+    # returns what the command printed up to and including the ServerCore-FullServer line (or everything, if there
+    # is no such line), or None if that took longer than "timeout" seconds
+    from subprocess import Popen, PIPE
+    from threading import Thread
+    from time import time
+    try:
+        from queue import Queue, Empty
+    except ImportError:
+        # python 2
+        from Queue import Queue, Empty
+    # pipes cannot be polled on Windows, so the lines are read in a thread and handed over through a queue
+    lines = Queue()
+
+    def reader(stdout):
+        for line in iter(stdout.readline, b''):
+            lines.put(line)
+        lines.put(None)
+    from .instrumentation import count
+    count('subprocess_spawns')
+    with open(os.devnull, 'wb') as devnull:
+        process = Popen(command, stdout=PIPE, stderr=devnull)
+    thread = Thread(target=reader, args=(process.stdout,))
+    thread.daemon = True
+    thread.start()
+    deadline = time() + timeout
+    output = []
+    try:
+        while True:
+            remaining = deadline - time()
+            if remaining <= 0:
+                return None
+            try:
+                line = lines.get(timeout=remaining)
+            except Empty:
+                return None
+            if line is None:
+                break
+            line = line.decode(errors='replace')
+            output.append(line)
+            if SERVER_CORE_FEATURE in line:
+                break
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+    return ''.join(output)
+
+
+def get_features(command=None, timeout=DEFAULT_TIMEOUT, cache_path=DEFAULT_CACHE_PATH, boot_time=None):
+    # like read_features, but returns the cached output if dism already ran since the last boot.
+    # with cache_path=None (the default) dism always runs
+    if command is None:
+        command = get_command()
+    if boot_time is None and cache_path is not None:
+        from .interface import get_boot_time
+        boot_time = get_boot_time()
+    output = load_cached_features(cache_path, boot_time)
+    if output is None:
+        output = read_features(command, timeout)
+        save_cached_features(cache_path, boot_time, output)
+    return output
+
+
+def _get_boot(boot_time):
+    return None if boot_time is None else int(boot_time // BOOT_TIME_RESOLUTION)
+
+
+def load_cached_features(cache_path, boot_time):
+    from .cache import is_trusted
+    if cache_path is None or not is_trusted(cache_path):
+        return None
+    try:
+        with open(cache_path) as fd:
+            cached = json.load(fd)
+        if cached['boot'] == _get_boot(boot_time):
+            return cached['output']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def save_cached_features(cache_path, boot_time, output):
+    from .cache import write_json_atomically
+    # an unknown result (dism timed out) is not cached
+    if output is not None and cache_path is not None:
+        write_json_atomically(cache_path, dict(boot=_get_boot(boot_time), output=output))
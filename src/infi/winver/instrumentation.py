@@ -0,0 +1,157 @@
+# instrumentation of the detection, for finding out where the time goes on a slow host.
+# * hooks: callables registered with add_hook (or, for a block of code, with the hook() context manager) are called
+#   with a ProbeEvent after every probe Windows runs: version_ex (GetVersionEx), system_info (GetSystemInfo),
+#   product_info (GetProductInfo), the registry keys (current_version, server_levels) and dism. the event has the
+#   monotonic start and end times, the outcome and the fallback path that made the probe run, if any.
+#   hooks are called in the thread that ran the probe, and exceptions they raise are not caught.
+#   with no hooks registered, a probe costs one more function call and nothing is timed
+# * counters: process-wide counts of Win32 API calls, registry key opens and subprocesses spawned, kept at all times
+#   (by LiveBackend and the functions it calls, so replayed detections do not count). see get_counters
+# record_events() collects the events and counter deltas of a block of code and summarizes them:
+#     with record_events() as recorder:
+#         Windows().analyze()
+#     recorder.get_summary()
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from ._compat import monotonic
+
+ProbeEvent = namedtuple('ProbeEvent', ('probe', 'start', 'end', 'outcome', 'fallback'))
+
+# probe -> the fallback path it is on: CurrentVersion is read because GetVersionEx is stuck at 6.2 from Windows
+# 2012 / 8, and dism runs because the ServerLevels key could not be opened
+PROBE_FALLBACKS = {
+    'current_version': 'version_from_registry',
+    'dism': 'server_core_from_dism',
+}
+
+# outcomes
+OK = 'ok'
+MISSING = 'missing'
+ACCESS_DENIED = 'access_denied'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+COUNTERS = ('api_calls', 'registry_opens', 'subprocess_spawns')
+
+# replaced, never modified, so run_probe can read it without a lock
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+_counters = dict.fromkeys(COUNTERS, 0)
+_counters_lock = threading.Lock()
+
+
+def add_hook(callback):
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (callback,)
+
+
+def remove_hook(callback):
+    # removes one registration of "callback"; raises ValueError if it is not registered
+    global _hooks
+    with _hooks_lock:
+        hooks = list(_hooks)
+        hooks.remove(callback)
+        _hooks = tuple(hooks)
+
+
+@contextmanager
+def hook(callback):
+    add_hook(callback)
+    try:
+        yield callback
+    finally:
+        remove_hook(callback)
+
+
+def _get_outcome(error):
+    from infi.registry.errors import AccessDeniedException
+    if isinstance(error, KeyError):
+        return MISSING
+    if isinstance(error, AccessDeniedException):
+        return ACCESS_DENIED
+    return ERROR
+
+
+def is_enabled():
+    return bool(_hooks)
+
+
+def report_probe(probe, start, result=None, error=None):
+    # reports a probe that started at "start" and ended now. a probe that returns None timed out (dism)
+    if error is not None:
+        outcome = _get_outcome(error)
+    else:
+        outcome = TIMEOUT if result is None else OK
+    event = ProbeEvent(probe, start, monotonic(), outcome, PROBE_FALLBACKS.get(probe))
+    for callback in _hooks:
+        callback(event)
+
+
+def run_probe(probe, function, *args):
+    # returns function(*args), reporting it to the hooks as "probe"
+    if not _hooks:
+        return function(*args)
+    start = monotonic()
+    try:
+        result = function(*args)
+    except Exception as error:
+        report_probe(probe, start, error=error)
+        raise
+    report_probe(probe, start, result)
+    return result
+
+
+def count(counter, increment=1):
+    with _counters_lock:
+        _counters[counter] += increment
+
+
+def get_counters():
+    with _counters_lock:
+        return dict(_counters)
+
+
+def reset_counters():
+    with _counters_lock:
+        for counter in COUNTERS:
+            _counters[counter] = 0
+
+
+class EventRecorder(object):
+    # a hook that keeps the events it receives
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._counters = get_counters()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def get_summary(self):
+        # returns dict(probes={probe: dict(count, total, max, outcomes, fallbacks)}, counters={counter: delta}):
+        # the times are in seconds, the counters are what changed since the recorder was created
+        probes = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            duration = event.end - event.start
+            summary = probes.setdefault(event.probe, dict(count=0, total=0.0, max=0.0, outcomes={}, fallbacks={}))
+            summary['count'] += 1
+            summary['total'] += duration
+            summary['max'] = max(summary['max'], duration)
+            summary['outcomes'][event.outcome] = summary['outcomes'].get(event.outcome, 0) + 1
+            if event.fallback is not None:
+                summary['fallbacks'][event.fallback] = summary['fallbacks'].get(event.fallback, 0) + 1
+        counters = get_counters()
+        return dict(probes=probes, counters=dict((name, counters[name] - self._counters[name]) for name in COUNTERS))
+
+
+@contextmanager
+def record_events():
+    recorder = EventRecorder()
+    with hook(recorder):
+        yield recorder
@@ -1,6 +1,7 @@
 
 from infi.cwrap import WrappedFunction, errcheck_zero, errcheck_nothing, IN, IN_OUT
-from ctypes import c_void_p, c_buffer, c_ulong, byref, create_string_buffer
+from ctypes import c_void_p, c_ulong, c_ulonglong, byref, sizeof
+from .instrumentation import count
 
 class LibraryFunction(WrappedFunction):
     @classmethod
@@ -42,22 +43,43 @@ class GetProductInfo(LibraryFunction):
                 (c_ulong, IN, "spMinorVersion"),
                 (c_void_p, IN_OUT, "returnedProductType"))
 
+class GetTickCount64(LibraryFunction):
+    return_value = c_ulonglong
+
+    @classmethod
+    def get_errcheck(cls):
+        # GetTickCount64 cannot fail, and we want the call to return its result rather than its arguments
+        def errcheck(result, func, args):
+            return result
+        return errcheck
+
+    @classmethod
+    def get_parameters(cls):
+        return ()
+
 def get_version_ex():
-    from .structures import OSVersionEx
-    instance = OSVersionEx()
-    instance.version_info_size = OSVersionEx.min_max_sizeof().max  # pylint: disable-msg=E1101
-    instance.csd_version = b'\x00' * 128
-    buff = create_string_buffer(OSVersionEx.write_to_string(instance))  # pylint: disable-msg=E1101
-    GetVersionExA(buff)
-    return OSVersionEx.create_from_string(buff.raw)  # pylint: disable-msg=E1101
+    from .structures import OSVersionExStructure
+    version_ex = OSVersionExStructure()
+    version_ex.version_info_size = sizeof(version_ex)
+    count('api_calls')
+    GetVersionExA(byref(version_ex))
+    return version_ex
 
 def get_system_info():
-    from .structures import SystemInfo
-    buff = c_buffer(SystemInfo.min_max_sizeof().max)  # pylint: disable-msg=E1101
-    GetSystemInfo(buff)
-    return SystemInfo.create_from_string(buff.raw)  # pylint: disable-msg=E1101
+    from .structures import SystemInfoStructure
+    system_info = SystemInfoStructure()
+    count('api_calls')
+    GetSystemInfo(byref(system_info))
+    return system_info
 
 def get_product_info(major_version, minor_version, service_pack_major, service_pack_minor):
     result = c_ulong()
+    count('api_calls')
     GetProductInfo(major_version, minor_version, service_pack_major, service_pack_minor, byref(result))
     return result.value
+
+def get_boot_time():
+    # seconds since the epoch, derived from the milliseconds passed since the system was started
+    from time import time
+    count('api_calls')
+    return time() - GetTickCount64() / 1000.0
@@ -0,0 +1,132 @@
+# memoization of classification results, for fleets in which many hosts have the same snapshot.
+# a snapshot is identified by a hash of everything the analysis reads from it, in a canonical form: the
+# OSVERSIONINFOEX fields (without the padding after the service pack string), the processor architecture, the product
+# info, the registry values Windows uses and the dism answer. values the analysis does not use, such as UBR, are left
+# out, so hosts that differ only in them share a result. the dism answer is only part of the key when it was recorded
+# (snapshots and corpus records); a backend that would have to run dism.exe for it is classified without the memo.
+# the memo is a bounded LRU of key -> DetectionResult. the bulk entry points (classify_many, classify_corpus and
+# winver-classify) take memo=True to use the memo of the process they run in, see get_memo
+import struct
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+
+DEFAULT_MAXSIZE = 4096
+
+# registry values that are recorded but not used by the analysis
+IGNORED_VALUES = ('UBR', 'DisplayVersion')
+
+_VERSION_EX = struct.Struct('<IIIIHHHB')
+
+
+def get_key(backend):
+    # returns the content hash of what "backend" answers, or None if it would take running dism.exe. raises whatever
+    # the backend raises for missing structures
+    from infi.registry.errors import AccessDeniedException
+    from .backends import REGISTRY_VALUES, SERVER_LEVELS_KEY, ReplayBackend
+    from .corpus import RecordBackend
+    from .dism import is_server_core
+    version_ex = backend.get_version_ex()
+    parts = [_VERSION_EX.pack(version_ex.major_version, version_ex.minor_version, version_ex.build_number,
+                              version_ex.platform_id, version_ex.service_pack_major, version_ex.service_pack_minor,
+                              version_ex.suite_mask, version_ex.product_type),
+             version_ex.csd_version, repr(backend.get_system_info().processor_architecture)]
+    try:
+        parts.append(repr(backend.get_product_info(version_ex.major_version, version_ex.minor_version,
+                                                   version_ex.service_pack_major, version_ex.service_pack_minor)))
+    except ValueError:
+        # not recorded
+        parts.append('-')
+    for key in sorted(REGISTRY_VALUES):
+        try:
+            values = backend.get_registry_values(key, REGISTRY_VALUES[key])
+        except KeyError:
+            parts.append('missing')
+            continue
+        except AccessDeniedException:
+            parts.append('access_denied')
+            if key == SERVER_LEVELS_KEY:
+                if not isinstance(backend, (ReplayBackend, RecordBackend)):
+                    return None
+                try:
+                    output = backend.get_dism_features()
+                    parts.append(repr(None if output is None else is_server_core(output)))
+                except ValueError:
+                    parts.append('-')
+            continue
+        parts.append(repr(sorted((name, value) for name, value in values.items() if name not in IGNORED_VALUES)))
+    digest = sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.digest()
+
+
+class ClassificationMemo(object):
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def get_stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, size=len(self._results),
+                    maxsize=self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def classify_backend(self, backend):
+        # returns the DetectionResult of "backend", from the memo if a snapshot with the same key was seen
+        from .batch import classify_backend
+        key = get_key(backend)
+        if key is None:
+            return classify_backend(backend)
+        with self._lock:
+            result = self._results.pop(key, None)
+            if result is not None:
+                # most recently used go last
+                self._results[key] = result
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = classify_backend(backend)
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def classify(self, snapshot):
+        from .backends import ReplayBackend
+        return self.classify_backend(ReplayBackend(snapshot))
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def get_memo():
+    # the memo of this process. worker processes of the bulk entry points have their own
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = ClassificationMemo()
+        return _memo
+
+
+def set_memo(memo):
+    # replaces the memo of this process, e.g. with a larger ClassificationMemo(maxsize); None goes back to the default
+    global _memo
+    with _memo_lock:
+        _memo = memo
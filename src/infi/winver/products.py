@@ -0,0 +1,54 @@
+# classification of the product types GetProductInfo returns (the PRODUCT_* constants).
+# the table is generated once, from the lists in constants.py, and maps every product type to its edition, whether
+# it is a server core / Hyper-V product, the PRODUCT_SUITE_* list it belongs to and its symbolic name.
+# classifying a product type is then a single dict lookup
+from collections import namedtuple
+
+ProductClassification = namedtuple('ProductClassification', ('name', 'edition', 'server_core', 'hyper_v', 'suite'))
+
+# the edition of each suite, in order of precedence. products that are in none of these are 'Client'
+EDITION_SUITES = (
+    ('Compute Cluster', 'PRODUCT_SUITE_CLUSTER'),
+    ('Datacenter', 'PRODUCT_SUITE_DATACENTER'),
+    ('Enterprise', 'PRODUCT_SUITE_ENTERPRISE'),
+    ('Storage', 'PRODUCT_SUITE_STORAGE'),
+    ('Standard', 'PRODUCT_SUITE_STANDARD'),
+    ('Small Business', 'PRODUCT_SUITE_SMALL_BUSINESS'),
+)
+
+UNKNOWN_PRODUCT = ProductClassification(None, 'Client', False, False, None)
+
+_products = None
+
+
+def _build_table():
+    from . import constants
+    from ._compat import frozen_dict
+    names = sorted(name for name in dir(constants) if name.startswith('PRODUCT_') and
+                   not name.startswith('PRODUCT_SUITE_'))
+    suites = sorted(name for name in dir(constants) if name.startswith('PRODUCT_SUITE_'))
+    table = {}
+    for name in names:
+        product_type = getattr(constants, name)
+        edition = next((edition for edition, suite in EDITION_SUITES
+                        if product_type in getattr(constants, suite)), 'Client')
+        suite = next((suite for suite in suites if product_type in getattr(constants, suite)), None)
+        table[product_type] = ProductClassification(name, edition, product_type in constants.SERVER_CORE,
+                                                    product_type in constants.HYPER_V, suite)
+    return frozen_dict(table)
+
+
+def get_product_table():
+    global _products
+    if _products is None:
+        _products = _build_table()
+    return _products
+
+
+def classify_product(product_type):
+    return get_product_table().get(product_type, UNKNOWN_PRODUCT)
+
+
+def get_product_name(product_type):
+    # e.g. "PRODUCT_DATACENTER_SERVER", or None for product types that are not in constants.py
+    return classify_product(product_type).name
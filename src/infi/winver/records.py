@@ -0,0 +1,97 @@
+# streaming classification of collected records, for the winver-classify script (see scripts.py).
+# the input is read line by line, and every record is either
+# * a snapshot (see backends.py) as a JSON object on a single line (NDJSON), or
+# * the three lines print_records prints: "OSVersionEx = ...", "SystemInfo = ..." and "ProductInfo = ...".
+#   these have no registry values, which is enough for versions before Windows Server 2012 / Windows 8
+# every record produces one output line with the fields of its DetectionResult, or {"error": ...} if it could not be
+# read or classified, in input order
+import json
+from ast import literal_eval
+from collections import OrderedDict
+from binascii import hexlify
+
+RAW_FIELDS = ('OSVersionEx', 'SystemInfo', 'ProductInfo')
+
+OUTPUT_FIELDS = ('version', 'win10_update', 'edition', 'server_core', 'hyper_v', 'service_pack', 'architecture',
+                 'version_info')
+
+
+def _to_bytes(value):
+    # print_records on python 2 printed str, on python 3 bytes
+    if not isinstance(value, bytes):
+        value = value.encode('latin-1')
+    return value
+
+
+def parse_raw_record(values):
+    # "values" is a dict of the RAW_FIELDS to the text after the "="
+    from .backends import SNAPSHOT_FORMAT_VERSION
+    return dict(format=SNAPSHOT_FORMAT_VERSION,
+                version_ex=hexlify(_to_bytes(literal_eval(values['OSVersionEx']))).decode('ascii'),
+                system_info=hexlify(_to_bytes(literal_eval(values['SystemInfo']))).decode('ascii'),
+                product_info=literal_eval(values['ProductInfo']), registry={})
+
+
+def read_records(lines):
+    # yields a snapshot, or dict(error=...), for each record in "lines"
+    raw = {}
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            if raw:
+                yield dict(error="line {}: incomplete record".format(number))
+                raw = {}
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                yield dict(error="line {}: {}".format(number, error))
+            continue
+        name, separator, value = line.partition('=')
+        name = name.strip()
+        if not separator or name not in RAW_FIELDS or name in raw:
+            yield dict(error="line {}: unexpected {!r}".format(number, line[:40]))
+            raw = {}
+            continue
+        raw[name] = value.strip()
+        if len(raw) == len(RAW_FIELDS):
+            try:
+                yield parse_raw_record(raw)
+            except (ValueError, SyntaxError) as error:
+                yield dict(error="line {}: {}".format(number, error))
+            raw = {}
+    if raw:
+        yield dict(error="incomplete record at the end of the input")
+
+
+def classify_record(record, fields=OUTPUT_FIELDS, memo=False):
+    from .batch import classify
+    if memo:
+        from .memo import get_memo
+        classify = get_memo().classify
+    if 'error' in record:
+        return dict(error=record['error'])
+    try:
+        result = classify(record).to_dict()
+    except Exception as error:  # pylint: disable-msg=W0703
+        return dict(error="{}: {}".format(type(error).__name__, error))
+    return OrderedDict((name, result[name]) for name in fields)
+
+
+def classify_lines(records, fields=OUTPUT_FIELDS, memo=False):
+    # the classifier classify_many runs on a chunk of records: returns their output lines
+    return [json.dumps(classify_record(record, fields, memo), separators=(',', ':'))
+            for record in records]
+
+
+def classify_stream(lines, output, workers=1, chunksize=256, fields=OUTPUT_FIELDS, memo=False):
+    # reads records from "lines" and writes an output line for each to "output". returns the number of records
+    from functools import partial
+    from .batch import classify_many
+    count = 0
+    for line in classify_many(read_records(lines), workers=workers, chunksize=chunksize,
+                              classifier=partial(classify_lines, fields=tuple(fields)), memo=memo):
+        output.write(line + '\n')
+        count += 1
+    return count
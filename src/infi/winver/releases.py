@@ -0,0 +1,98 @@
+# naming of Windows 10 / Windows Server 2016 and later releases.
+# these versions all report 10.0, and are told apart by the product type (workstation / server), the release id and
+# the build number (release id 2009 is the last one, see LAST_RELEASE_ID).
+# the releases are listed in releases.json. each entry names the version and update starting at its
+# (release_id, first_build), up to the next entry of the same product. the update name applies only to the entry's
+# own release id, other release ids in its range have an unknown update.
+# more releases can be added without changing the code: put them in a file of the same format and point the
+# INFI_WINVER_RELEASES environment variable to it, or call load_release_table with it. entries with the same
+# product, release_id and first_build replace the built-in ones
+import os
+import json
+from bisect import bisect_right
+
+RELEASES_FORMAT_VERSION = 1
+
+DEFAULT_RELEASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'releases.json')
+
+PRODUCTS = ('workstation', 'server')
+
+
+class ReleaseTable(object):
+    def __init__(self, releases):
+        entries = {}
+        for release in releases:
+            if release['product'] not in PRODUCTS:
+                raise ValueError("Unknown product {!r}".format(release['product']))
+            key = (release['product'], int(release['release_id']), int(release.get('first_build', 0)))
+            entries[key] = (release['version'], release.get('update'))
+        # compiled once into parallel sorted lists, so a lookup is a single bisect
+        self._keys = sorted(entries)
+        self._values = [entries[key] for key in self._keys]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, product_type, release_id, build_number):
+        # returns (version, update). the update is 'Unknown' if the release id is not listed
+        from .constants import VER_NT_WORKSTATION
+        product = 'workstation' if product_type == VER_NT_WORKSTATION else 'server'
+        index = bisect_right(self._keys, (product, release_id, build_number)) - 1
+        if index < 0 or self._keys[index][0] != product:
+            return 'Unknown', 'Unknown'
+        version, update = self._values[index]
+        if update is None or self._keys[index][1] != release_id:
+            update = 'Unknown'
+        return version, update
+
+    def get_release_key(self, product_type, release_id, build_number):
+        # returns (release_id, first_build) of the release the host is in, for ordering (see version.py).
+        # builds of a release id that is not listed are ordered by the release id alone
+        from .constants import VER_NT_WORKSTATION
+        product = 'workstation' if product_type == VER_NT_WORKSTATION else 'server'
+        index = bisect_right(self._keys, (product, release_id, build_number)) - 1
+        if index < 0 or self._keys[index][0] != product or self._keys[index][1] != release_id:
+            return release_id, 0
+        return release_id, self._keys[index][2]
+
+    def get_entries(self):
+        # returns [((product, release_id, first_build), (version, update)), ...] in lookup order
+        return list(zip(self._keys, self._values))
+
+    def get_releases(self):
+        # yields (version, release_id, first_build) of the named releases, oldest first
+        for key, (version, update) in sorted(zip(self._keys, self._values), key=lambda item: item[0][1:]):
+            if update is not None:
+                yield version, key[1], key[2]
+
+
+def read_releases(path):
+    with open(path) as fd:
+        data = json.load(fd)
+    if data.get('format') != RELEASES_FORMAT_VERSION:
+        raise ValueError("Unsupported releases format {!r} in {}".format(data.get('format'), path))
+    return data['releases']
+
+
+def load_release_table(*extra_paths):
+    releases = read_releases(DEFAULT_RELEASES_PATH)
+    for path in extra_paths:
+        releases.extend(read_releases(path))
+    return ReleaseTable(releases)
+
+
+_release_table = None
+
+
+def get_release_table():
+    global _release_table
+    if _release_table is None:
+        extra_path = os.environ.get('INFI_WINVER_RELEASES')
+        _release_table = load_release_table(*([extra_path] if extra_path else []))
+    return _release_table
+
+
+def set_release_table(table):
+    # replaces the table used by Windows, e.g. with load_release_table(path); None goes back to the default
+    global _release_table
+    _release_table = table
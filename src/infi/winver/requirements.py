@@ -0,0 +1,323 @@
+# requirement expressions: rules such as "Windows Server 2016+ and x64 and not server_core or Windows 10 >= 1809",
+# parsed once into a predicate over the attributes of a Windows instance.
+#
+#   <version>               the version is exactly <version>, e.g. "Windows Server 2012 R2"
+#   <version>+              <version> or later (see version.py for how versions are ordered)
+#   <op> <version>          compares the version, e.g. "< Windows Server 2019"
+#   <version> <op> <id>     the version is <version> and its release id compares to <id>, e.g. "Windows 10 >= 1809"
+#   x86, x64, ia64          the architecture
+#   server_core, hyper_v, cluster_aware
+#   edition <op> <name>     e.g. "edition == Datacenter", "edition != Small Business"
+#   architecture <op> <name>
+#   service_pack <op> <n>   e.g. "service_pack >= 1"
+#
+# <op> is one of ==, !=, <, <=, >, >=. clauses are combined with "not", "and" and "or" (in this order of precedence)
+# and parentheses. keywords, names and flags are case-insensitive.
+# server_core is None when it could not be detected (see dism.py). clauses are then evaluated in three-valued logic:
+# an unknown server_core makes both "server_core" and "not server_core" unknown, and a requirement is met only if it
+# is true, so a host with an unknown server_core meets neither of them.
+# a compiled requirement is a tree of closures, so evaluating it costs a few attribute reads and comparisons per
+# clause, with nothing left to parse or look up. it can also tell which clause failed (see Requirement.explain).
+# version names are resolved when the expression is compiled, so compile again after changing the release table
+import re
+import operator
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+KEYWORDS = ('and', 'or', 'not')
+
+FIELDS = ('edition', 'architecture', 'service_pack')
+
+_TOKENS = re.compile(r"\s*(?:(\(|\))|(==|!=|<=|>=|<|>)|(\+)|([^\s()=!<>+]+))")
+
+# expression -> Requirement, see requirement()
+_compiled = {}
+MAX_COMPILED = 4096
+
+
+class Requirement(object):
+    def __init__(self, text, predicate, explain):
+        self.text = text
+        self._predicate = predicate
+        self._explain = explain
+
+    def __call__(self, windows):
+        # the predicates return None for unknown, see above
+        return self._predicate(windows) is True
+
+    def explain(self, windows):
+        # returns None if "windows" meets the requirement, or a description of the clause that failed
+        return self._explain(windows)
+
+    def __repr__(self):
+        return "Requirement({!r})".format(self.text)
+
+
+def requirement(text):
+    # returns the compiled Requirement for "text". compiled expressions are cached, so calling this for every host
+    # is cheap. raises ValueError for invalid expressions
+    compiled = _compiled.get(text)
+    if compiled is None:
+        compiled = compile_requirement(text)
+        if len(_compiled) >= MAX_COMPILED:
+            _compiled.clear()
+        _compiled[text] = compiled
+    return compiled
+
+
+def compile_requirement(text):
+    parser = _Parser(text)
+    predicate, explain = parser.parse()
+    return Requirement(text, predicate, explain)
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKENS.match(text, position)
+        if match is None:
+            raise ValueError("Invalid requirement {!r} at position {}".format(text, position))
+        paren, op, plus, word = match.groups()
+        if paren:
+            tokens.append(('paren', paren))
+        elif op:
+            tokens.append(('op', op))
+        elif plus:
+            tokens.append(('plus', plus))
+        elif word.lower() in KEYWORDS:
+            tokens.append(('keyword', word.lower()))
+        else:
+            tokens.append(('word', word))
+        position = match.end()
+    return tokens
+
+
+def _get_version_names():
+    # lower case name -> name, for every version Windows can report
+    from . import version_to_name
+    from .releases import get_release_table
+    names = set(version_to_name.values())
+    names.update(version for version, _, _ in get_release_table().get_releases())
+    return dict((name.lower(), name) for name in names)
+
+
+def _leaf(text, predicate, actual):
+    # "actual" returns a description of the attributes the clause looked at, for explain
+    def explain(windows):
+        result = predicate(windows)
+        if result is True:
+            return None
+        return "{} is {} ({})".format(text, 'unknown' if result is None else 'false', actual(windows))
+    return predicate, explain
+
+
+def _version(windows):
+    return "version is {!r}".format(windows.version)
+
+
+def _version_info(windows):
+    return "version is {!r} ({})".format(windows.version, windows.version_info)
+
+
+class _Parser(object):
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.position = 0
+        self.version_names = _get_version_names()
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty requirement")
+        result = self.parse_or()
+        if self.position < len(self.tokens):
+            self.fail("unexpected {!r}".format(self.tokens[self.position][1]))
+        return result
+
+    def fail(self, message):
+        raise ValueError("Invalid requirement {!r}: {}".format(self.text, message))
+
+    def peek(self, kind, value=None):
+        if self.position >= len(self.tokens):
+            return False
+        token_kind, token_value = self.tokens[self.position]
+        return token_kind == kind and (value is None or token_value == value)
+
+    def take(self, kind, value=None):
+        if not self.peek(kind, value):
+            found = self.tokens[self.position][1] if self.position < len(self.tokens) else "end of expression"
+            self.fail("expected {}, found {!r}".format(value or kind, found))
+        self.position += 1
+        return self.tokens[self.position - 1][1]
+
+    def take_words(self):
+        words = []
+        while self.peek('word'):
+            words.append(self.take('word'))
+        if not words:
+            self.take('word')
+        return ' '.join(words)
+
+    def parse_or(self):
+        clauses = [self.parse_and()]
+        while self.peek('keyword', 'or'):
+            self.take('keyword')
+            clauses.append(self.parse_and())
+        if len(clauses) == 1:
+            return clauses[0]
+        predicates = tuple(predicate for predicate, _ in clauses)
+
+        def predicate(windows):
+            unknown = False
+            for clause in predicates:
+                result = clause(windows)
+                if result is True:
+                    return True
+                if result is None:
+                    unknown = True
+            return None if unknown else False
+
+        def explain(windows):
+            if predicate(windows) is True:
+                return None
+            return "none of: " + "; ".join(clause_explain(windows) for _, clause_explain in clauses)
+        return predicate, explain
+
+    def parse_and(self):
+        clauses = [self.parse_not()]
+        while self.peek('keyword', 'and'):
+            self.take('keyword')
+            clauses.append(self.parse_not())
+        if len(clauses) == 1:
+            return clauses[0]
+        predicates = tuple(predicate for predicate, _ in clauses)
+
+        def predicate(windows):
+            unknown = False
+            for clause in predicates:
+                result = clause(windows)
+                if result is False:
+                    return False
+                if result is None:
+                    unknown = True
+            return None if unknown else True
+
+        def explain(windows):
+            for _, clause_explain in clauses:
+                failure = clause_explain(windows)
+                if failure is not None:
+                    return failure
+            return None
+        return predicate, explain
+
+    def parse_not(self):
+        if not self.peek('keyword', 'not'):
+            return self.parse_atom()
+        start = self.position
+        self.take('keyword')
+        clause, clause_explain = self.parse_not()
+        text = self.source(start)
+
+        def predicate(windows):
+            result = clause(windows)
+            return None if result is None else not result
+
+        def explain(windows):
+            result = clause(windows)
+            if result is None:
+                return clause_explain(windows)
+            return "{} is false (the negated clause is true)".format(text) if result else None
+        return predicate, explain
+
+    def source(self, start):
+        # the text of the tokens from "start" to the current position, for explanations
+        return ' '.join(value for _, value in self.tokens[start:self.position]).replace(' +', '+')
+
+    def parse_atom(self):
+        if self.peek('paren', '('):
+            self.take('paren')
+            result = self.parse_or()
+            self.take('paren', ')')
+            return result
+        start = self.position
+        if self.peek('op'):
+            compare = OPERATORS[self.take('op')]
+            version = self.get_version(self.take_words())
+            return _leaf(self.source(start), lambda windows: compare(windows.version_info, version), _version_info)
+        words = self.take_words()
+        name = words.lower()
+        if name in FIELDS:
+            return self.parse_field(start, name)
+        if name in ('x86', 'x64', 'ia64'):
+            return _leaf(self.source(start), lambda windows: windows.architecture == name,
+                         lambda windows: "architecture is {!r}".format(windows.architecture))
+        if name == 'server_core':
+            # True, False or None (unknown)
+            return _leaf(self.source(start), lambda windows: windows.server_core,
+                         lambda windows: "server_core is {!r}".format(windows.server_core))
+        if name == 'hyper_v':
+            return _leaf(self.source(start), lambda windows: windows.hyper_v is True,
+                         lambda windows: "hyper_v is {!r}".format(windows.hyper_v))
+        if name == 'cluster_aware':
+            return _leaf(self.source(start), lambda windows: windows.edition in ('Enterprise', 'Datacenter'),
+                         lambda windows: "edition is {!r}".format(windows.edition))
+        version_name = self.get_version_name(words)
+        if self.peek('plus'):
+            self.take('plus')
+            version = self.get_version(version_name)
+            return _leaf(self.source(start), lambda windows: windows.version_info >= version, _version_info)
+        if self.peek('op'):
+            compare = OPERATORS[self.take('op')]
+            release_id = self.get_int(self.take_words())
+
+            def predicate(windows):
+                return windows.version == version_name and compare(windows.version_info.release_id, release_id)
+
+            def actual(windows):
+                return "version is {!r}, release id {}".format(windows.version, windows.version_info.release_id)
+            return _leaf(self.source(start), predicate, actual)
+        return _leaf(self.source(start), lambda windows: windows.version == version_name, _version)
+
+    def parse_field(self, start, name):
+        if not self.peek('op'):
+            self.fail("expected an operator after {}".format(name))
+        compare = OPERATORS[self.take('op')]
+        if name == 'service_pack':
+            value = self.get_int(self.take_words())
+
+            def predicate(windows):
+                return compare(windows.service_pack, value)
+        else:
+            if compare not in (operator.eq, operator.ne):
+                self.fail("{} can only be compared with == or !=".format(name))
+            value = self.take_words().lower()
+
+            def predicate(windows):
+                return compare(getattr(windows, name).lower(), value)
+        return _leaf(self.source(start), predicate,
+                     lambda windows: "{} is {!r}".format(name, getattr(windows, name)))
+
+    def get_version_name(self, words):
+        version_name = self.version_names.get(words.lower())
+        if version_name is None:
+            self.fail("unknown version or flag {!r}".format(words))
+        return version_name
+
+    def get_version(self, words):
+        from .version import WindowsVersion
+        return WindowsVersion(self.get_version_name(words))
+
+    def get_int(self, words):
+        try:
+            return int(words)
+        except ValueError:
+            self.fail("expected a number, found {!r}".format(words))
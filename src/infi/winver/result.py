@@ -0,0 +1,129 @@
+# DetectionResult is a compact, read-only copy of the fields of an analyzed Windows instance, for keeping the
+# detection results of many hosts in memory. it has no per-instance __dict__ and none of the raw probe data, the
+# strings in it are interned so all the results share one copy of e.g. 'Windows Server 2019', and version_info is
+# the interned WindowsVersion. it has the same is_* API as Windows.
+# unlike Windows, win10_update is None (rather than missing) on versions older than Windows 10.
+# the names are kept as interned strings rather than as enum codes: a slot holds one pointer either way, so codes
+# would not make a result smaller, and the strings keep the is_* checks and to_dict as they are. get_codes returns
+# the names as small integers (the same codes columnar.classify_columns uses) for code that wants them
+from collections import namedtuple
+from . import WindowsChecks, FIELDS
+
+RESULT_FIELDS = FIELDS + ('version_info',)
+
+# string -> the one copy of it kept by the results
+_strings = {}
+
+# the tuples of names the codes index, see get_names
+Names = namedtuple('Names', ('release_table', 'versions', 'updates', 'editions', 'architectures', 'codes'))
+
+_names = None
+
+
+def _intern(value):
+    if value is None:
+        return None
+    return _strings.setdefault(value, value)
+
+
+def get_names():
+    # the names of every version, update, edition and architecture Windows can report, in code order. the tuples
+    # are built from version_to_name, the release table and the product suites, so they change with the release table
+    global _names
+    from . import version_to_name
+    from .products import EDITION_SUITES
+    from .releases import get_release_table
+    release_table = get_release_table()
+    if _names is not None and _names.release_table is release_table:
+        return _names
+    entries = release_table.get_entries()
+    versions = tuple(sorted(set(version_to_name.values()) | set(value[0] for _, value in entries))) + ('Unknown',)
+    updates = (None, 'Unknown') + tuple(sorted(set(value[1] for _, value in entries if value[1] is not None)))
+    editions = tuple(sorted(set(edition for edition, _ in EDITION_SUITES) |
+                            set(['Client', 'Standard', 'BackOffice', 'Home', 'Unknown'])))
+    architectures = ('x86', 'x64', 'ia64', 'unknown')
+    # field -> (name -> code, the code of names that are not in the tuple)
+    codes = dict((field, (dict((name, code) for code, name in enumerate(names)), names.index(unknown)))
+                 for field, names, unknown in (('version', versions, 'Unknown'), ('win10_update', updates, 'Unknown'),
+                                               ('edition', editions, 'Unknown'),
+                                               ('architecture', architectures, 'unknown')))
+    _names = Names(release_table, versions, updates, editions, architectures, codes)
+    return _names
+
+
+class DetectionResult(WindowsChecks):
+    __slots__ = RESULT_FIELDS
+
+    def __init__(self, version, win10_update, edition, server_core, hyper_v, service_pack, architecture,
+                 version_info):
+        # pylint: disable-msg=R0913
+        setter = super(DetectionResult, self).__setattr__
+        setter('version', _intern(version))
+        setter('win10_update', _intern(win10_update))
+        setter('edition', _intern(edition))
+        setter('server_core', server_core)
+        setter('hyper_v', hyper_v)
+        setter('service_pack', service_pack)
+        setter('architecture', _intern(architecture))
+        setter('version_info', version_info)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DetectionResult is immutable, cannot set {}".format(name))
+
+    def __delattr__(self, name):
+        raise AttributeError("DetectionResult is immutable, cannot delete {}".format(name))
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in RESULT_FIELDS)
+
+    def __reduce__(self):
+        # a flat tuple, so pickling does not go through the generic __slots__ protocol
+        return (DetectionResult, self._values())
+
+    def __eq__(self, other):
+        if not isinstance(other, DetectionResult):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __ne__(self, other):
+        if not isinstance(other, DetectionResult):
+            return NotImplemented
+        return self._values() != other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return "DetectionResult({})".format(", ".join("{}={!r}".format(name, getattr(self, name))
+                                                      for name in RESULT_FIELDS))
+
+    def get_codes(self):
+        # {'version': ..., 'win10_update': ..., 'edition': ..., 'architecture': ...} as indexes into the tuples of
+        # get_names(). names that are not in the tuples get the code of 'Unknown'
+        codes = get_names().codes
+        result = {}
+        for name, (table, unknown) in codes.items():
+            result[name] = table.get(getattr(self, name), unknown)
+        return result
+
+    @classmethod
+    def from_windows(cls, windows):
+        # analyzes whatever "windows" did not analyze yet
+        return cls(windows.version, getattr(windows, 'win10_update', None), windows.edition, windows.server_core,
+                   windows.hyper_v, windows.service_pack, windows.architecture, windows.version_info)
+
+    def to_dict(self):
+        # JSON-friendly: version_info is a list (major, minor, release_id, build)
+        result = dict((name, getattr(self, name)) for name in FIELDS)
+        result['version_info'] = [self.version_info.major, self.version_info.minor, self.version_info.release_id,
+                                  self.version_info.build]
+        return result
+
+    @classmethod
+    def from_dict(cls, data):
+        from .version import WindowsVersion
+        missing = [name for name in RESULT_FIELDS if name not in data]
+        if missing:
+            raise ValueError("Missing fields {}".format(", ".join(missing)))
+        fields = dict((name, data[name]) for name in FIELDS)
+        return cls(version_info=WindowsVersion(tuple(data['version_info'])), **fields)
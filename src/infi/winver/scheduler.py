@@ -0,0 +1,37 @@
+# runs a dependency graph of functions on a thread pool: every function starts as soon as all of its dependencies
+# are done, so independent functions run concurrently
+
+
+def run_graph(graph, max_workers=4):
+    # graph is a dict of name -> (names of dependencies, function). the functions are called without arguments and
+    # their return values are ignored. the first exception raised by a function is raised once the graph has
+    # finished running; functions that depend on a function that failed are not called
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    for name, (dependencies, _) in graph.items():
+        for dependency in dependencies:
+            if dependency not in graph:
+                raise ValueError("{} depends on unknown {}".format(name, dependency))
+    pending = dict(graph)
+    done = set()
+    errors = []
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, (dependencies, function) in list(pending.items()):
+                if all(dependency in done for dependency in dependencies):
+                    del pending[name]
+                    running[executor.submit(function)] = name
+            if not running:
+                # whatever is still pending depends on a function that failed, or on a cycle
+                break
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is None:
+                    done.add(name)
+                else:
+                    errors.append(future.exception())
+    if errors:
+        raise errors[0]
+    if pending:
+        raise ValueError("Dependency cycle between {}".format(", ".join(sorted(pending))))
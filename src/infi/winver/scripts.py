@@ -3,7 +3,7 @@ from __future__ import print_function
 #pylint: disable-msg=E1101
 def print_records():
     from .interface import get_product_info, get_system_info, get_version_ex
-    from .structures import OSVersionEx, SystemInfo
+    from .structures import to_bytes
 
     version = get_version_ex()
     system_info = get_system_info()
@@ -13,6 +13,81 @@ def print_records():
     except:  # pylint: disable-msg=W0702
         # product_info not available on Windows 2003, XP
         product_info = None
-    print("OSVersionEx = %s" % repr(OSVersionEx.write_to_string(version)))
-    print("SystemInfo = %s" % repr(SystemInfo.write_to_string(system_info)))
+    print("OSVersionEx = %s" % repr(to_bytes(version)))
+    print("SystemInfo = %s" % repr(to_bytes(system_info)))
     print("ProductInfo = %s" % repr(product_info))
+
+def record_snapshot():
+    from sys import argv
+    from .backends import record
+    if len(argv) != 2:
+        print("usage: record_snapshot <path>")
+        raise SystemExit(1)
+    record(argv[1])
+
+def classify():
+    # winver-classify [-j N] [--fields a,b] [--chunksize N] [--memo] [file ...]: see records.py
+    import sys
+    import errno
+    from argparse import ArgumentParser
+    from itertools import chain
+    from .records import classify_stream, OUTPUT_FIELDS
+    parser = ArgumentParser(prog="winver-classify",
+                            description="classify recorded snapshots (NDJSON, or print_records output) to NDJSON")
+    parser.add_argument("files", nargs="*", default=["-"], help="input files, - for stdin (the default)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--chunksize", type=int, default=256, help="records per chunk sent to a worker")
+    parser.add_argument("--fields", default=",".join(OUTPUT_FIELDS),
+                        help="comma separated fields to output (default: %(default)s)")
+    parser.add_argument("--memo", action="store_true",
+                        help="classify identical snapshots once (for inputs with many duplicate hosts)")
+    args = parser.parse_args()
+    fields = [field for field in args.fields.split(",") if field]
+    unknown = [field for field in fields if field not in OUTPUT_FIELDS]
+    if unknown or not fields:
+        parser.error("unknown fields: {}".format(", ".join(unknown)) if unknown else "no fields")
+
+    def read(path):
+        if path == "-":
+            for line in sys.stdin:
+                yield line
+            return
+        with open(path) as fd:
+            for line in fd:
+                yield line
+    try:
+        classify_stream(chain.from_iterable(read(path) for path in args.files), sys.stdout, workers=args.jobs,
+                        chunksize=args.chunksize, fields=fields, memo=args.memo)
+        sys.stdout.flush()
+    except IOError as error:
+        # the reader went away, e.g. "winver-classify ... | head"
+        if error.errno != errno.EPIPE:
+            raise
+        _discard_stdout()
+        sys.exit(1)
+
+
+def _discard_stdout():
+    # python flushes stdout once more on exit, which would fail on the broken pipe again
+    import os
+    import sys
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+
+
+def daemon():
+    # winver-daemon [--address path] [--snapshot path]: see daemon.py
+    from argparse import ArgumentParser
+    from .daemon import serve, DEFAULT_INVALIDATE_INTERVAL
+    from .backends import ReplayBackend
+    parser = ArgumentParser(prog="winver-daemon", description="serve the detection result to local processes")
+    parser.add_argument("--address", help="Unix socket path (in a directory only you can use) or named pipe "
+                                          "(default: daemon.sock in the per-user runtime directory)")
+    parser.add_argument("--snapshot", help="serve the detection of a recorded snapshot instead of this host")
+    parser.add_argument("--invalidate-interval", type=float, default=DEFAULT_INVALIDATE_INTERVAL,
+                        help="seconds after a detection in which invalidations do not detect again "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    serve(args.address, None if args.snapshot is None else ReplayBackend.load(args.snapshot),
+          args.invalidate_interval)
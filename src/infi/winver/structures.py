@@ -1,43 +1,87 @@
+from ctypes import Structure, c_uint8, c_uint16, c_uint32, c_size_t, c_char, sizeof, addressof, string_at
+import sys
 
-from infi.instruct import Struct, ULInt32, FixedSizeString, ULInt16, ULInt8, ULInt64
+# OSVersionEx and SystemInfo, the infi.instruct versions of the structures, are imported from instruct_structures.py
+# when first used, so the detection does not load infi.instruct
+if sys.version_info < (3, 7):
+    from .instruct_structures import OSVersionEx, SystemInfo  # pylint: disable-msg=W0611
+else:
+    def __getattr__(name):
+        if name in ('OSVersionEx', 'SystemInfo'):
+            from . import instruct_structures
+            return getattr(instruct_structures, name)
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
-def _is_64bit():
-    from sys import maxsize
-    return maxsize > 2 ** 32
 
-DWORD = ULInt32
-TCHAR = FixedSizeString
-WORD = ULInt16
-BYTE = ULInt8
-LPVOID = ULInt64 if _is_64bit() else ULInt32
-BOOL = DWORD
+# the same structures as ctypes structures: the API fills them in place, and recorded bytes can be read with
+# from_buffer without going through a generic field-by-field parser.
+# unlike the infi.instruct SystemInfo, SystemInfoStructure follows the native SYSTEM_INFO layout, in which
+# dwActiveProcessorMask is a DWORD_PTR
 
-class OSVersionEx(Struct):
+
+class OSVersionExStructure(Structure):
+    _fields_ = [
+        ("version_info_size", c_uint32),
+        ("major_version", c_uint32),
+        ("minor_version", c_uint32),
+        ("build_number", c_uint32),
+        ("platform_id", c_uint32),
+        ("csd_version", c_char * 128),
+        ("service_pack_major", c_uint16),
+        ("service_pack_minor", c_uint16),
+        ("suite_mask", c_uint16),
+        ("product_type", c_uint8),
+        ("reserved", c_uint8),
+        ]
+
+
+class SystemInfoStructure(Structure):
     _fields_ = [
-        DWORD("version_info_size", 0),
-        DWORD("major_version", 0),
-        DWORD("minor_version", 0),
-        DWORD("build_number", 0),
-        DWORD("platform_id", 0),
-        TCHAR("csd_version", 128),
-        WORD("service_pack_major", 0),
-        WORD("service_pack_minor", 0),
-        WORD("suite_mask", 0),
-        BYTE("product_type", 0),
-        BYTE("reserved", 0)
+        ("processor_architecture", c_uint16),
+        ("reserved", c_uint16),
+        ("page_Size", c_uint32),
+        ("minimum_application_address", c_size_t),
+        ("maximum_application_address", c_size_t),
+        ("active_processor_mask", c_size_t),
+        ("number_of_processors", c_uint32),
+        ("processor_type", c_uint32),
+        ("allocation_granularity", c_uint32),
+        ("processor_level", c_uint16),
+        ("processor_revision", c_uint16),
         ]
 
-class SystemInfo(Struct):
+
+class SystemInfo32Structure(Structure):
+    # SYSTEM_INFO as recorded by 32-bit processes, see get_system_info_structure
     _fields_ = [
-        WORD("processor_architecture"),
-        WORD("reserved"),
-        DWORD("page_Size"),
-        LPVOID("minimum_application_address"),
-        LPVOID("maximum_application_address"),
-        DWORD("active_processor_mask"),
-        DWORD("number_of_processors"),
-        DWORD("processor_type"),
-        DWORD("allocation_granularity"),
-        WORD("processor_level"),
-        WORD("processor_revision")
+        ("processor_architecture", c_uint16),
+        ("reserved", c_uint16),
+        ("page_Size", c_uint32),
+        ("minimum_application_address", c_uint32),
+        ("maximum_application_address", c_uint32),
+        ("active_processor_mask", c_uint32),
+        ("number_of_processors", c_uint32),
+        ("processor_type", c_uint32),
+        ("allocation_granularity", c_uint32),
+        ("processor_level", c_uint16),
+        ("processor_revision", c_uint16),
         ]
+
+
+def get_system_info_structure(size):
+    # the layout of "size" recorded bytes of SYSTEM_INFO: recordings made by 32-bit processes are too short for the
+    # native layout of a 64-bit process
+    return SystemInfoStructure if size >= sizeof(SystemInfoStructure) else SystemInfo32Structure
+
+
+def from_buffer(structure_class, buffer, offset=0):
+    # writable buffers (bytearray, mmap, ctypes arrays) are used in place, without copying.
+    # read-only buffers (bytes) cannot back a ctypes structure, so their bytes are copied once
+    try:
+        return structure_class.from_buffer(buffer, offset)
+    except TypeError:
+        return structure_class.from_buffer_copy(buffer, offset)
+
+
+def to_bytes(structure):
+    return string_at(addressof(structure), sizeof(structure))
@@ -0,0 +1,151 @@
+# synthetic snapshots (see backends.py for the format), for testing and load testing parsers and classifiers on more
+# hosts than were ever recorded. generate_snapshots streams random, valid snapshots across the whole parameter space:
+# * every major.minor version Windows knows (5.0 - 6.3 and 10.0) and every product type (workstation, domain
+#   controller, server). from 6.2 on, GetVersionEx reports 6.2 and the real version is in the registry, as on a
+#   host without a manifest
+# * every PRODUCT_* constant as the product info (from Vista on), and random suite masks out of the VER_SUITE_* bits
+# * every processor architecture, in the native or the 32-bit SYSTEM_INFO layout
+# * every release id of releases.json, with builds anywhere between the first build of a release and the next one,
+#   UBRs and display versions
+# * the ServerLevels key of Windows Server 2012 / 2012 R2 present (with any subset of the features), missing or
+#   access denied, with dism reporting a core or full server, or timing out
+# the structures are packed with struct rather than built as ctypes structures, so the snapshots come out at hundreds
+# of thousands per minute
+import struct
+from binascii import hexlify
+from ctypes import c_size_t, sizeof
+
+VERSIONS = ((5, 0), (5, 1), (5, 2), (6, 0), (6, 1), (6, 2), (6, 3), (10, 0))
+
+# major.minor -> typical build number and service pack
+BUILDS = {(5, 0): (2195, 4), (5, 1): (2600, 3), (5, 2): (3790, 2), (6, 0): (6002, 2), (6, 1): (7601, 1),
+          (6, 2): (9200, 0), (6, 3): (9600, 0)}
+
+# the last build of a release whose next release in releases.json does not say where it starts
+LAST_BUILD = 30000
+
+SERVER_LEVELS_FEATURES = ('ServerCore', 'Server-Gui-Mgmt', 'Server-Gui-Shell')
+
+DISM_OUTPUT = "Feature Name | State\n{} | {}\n"
+
+_VERSION_EX = struct.Struct('<IIIII128sHHHBB')
+_SYSTEM_INFO = struct.Struct('<HHI{0}{0}{0}IIIHH'.format('Q' if sizeof(c_size_t) == 8 else 'I'))
+_SYSTEM_INFO_32 = struct.Struct('<HHIIIIIIIHH')
+
+
+def _get_constants(prefix):
+    from . import constants
+    return sorted(set(value for name, value in vars(constants).items()
+                      if name.startswith(prefix) and isinstance(value, int)))
+
+
+def _get_releases():
+    # (release id, first build, last build) of every release in releases.json
+    from .releases import get_release_table
+    releases = sorted(set((release_id, max(first_build, 10240))
+                          for _, release_id, first_build in get_release_table().get_releases()))
+    ranges = []
+    for index, (release_id, first_build) in enumerate(releases):
+        later = [build for _, build in releases[index + 1:] if build > first_build]
+        ranges.append((release_id, first_build, min(later) - 1 if later else LAST_BUILD))
+    return ranges
+
+
+def _hex(data):
+    return hexlify(data).decode('ascii')
+
+
+def pack_version_ex(major_version, minor_version, build_number, product_type, service_pack_major=0,
+                    service_pack_minor=0, suite_mask=0):
+    # the bytes of an OSVERSIONINFOEX
+    # pylint: disable-msg=R0913
+    csd_version = "Service Pack {}".format(service_pack_major).encode('ascii') if service_pack_major else b''
+    return _VERSION_EX.pack(_VERSION_EX.size, major_version, minor_version, build_number, 2, csd_version,
+                            service_pack_major, service_pack_minor, suite_mask, product_type, 0)
+
+
+def pack_system_info(processor_architecture, number_of_processors=1, native=True):
+    # the bytes of a SYSTEM_INFO, in the layout of this process or (native=False) of a 32-bit one
+    layout = _SYSTEM_INFO if native else _SYSTEM_INFO_32
+    return layout.pack(processor_architecture, 0, 4096, 0x10000, 0x7ffeffff, (1 << number_of_processors) - 1,
+                       number_of_processors, 8664, 0x10000, 6, 0x2c02)
+
+
+class SnapshotGenerator(object):
+    def __init__(self, seed=0):
+        import random
+        self._random = random.Random(seed)
+        self.products = _get_constants('PRODUCT_')
+        self.suites = _get_constants('VER_SUITE_')
+        self.architectures = _get_constants('PROCESSOR_ARCHITECTURE_')
+        self.product_types = _get_constants('VER_NT_')
+        self.releases = _get_releases()
+
+    def _registry(self, major_version, minor_version, build_number, product_type):
+        from .backends import CURRENT_VERSION_KEY, SERVER_LEVELS_KEY
+        from .constants import VER_NT_WORKSTATION
+        rng = self._random
+        registry = {}
+        values = dict(CurrentVersion='{}.{}'.format(major_version, minor_version),
+                      CurrentBuildNumber=str(build_number))
+        if major_version == 10:
+            release_id, first_build, last_build = rng.choice(self.releases)
+            build_number = rng.randint(first_build, last_build)
+            values.update(CurrentMajorVersionNumber=10, CurrentMinorVersionNumber=0, CurrentVersion='6.3',
+                          CurrentBuildNumber=str(build_number), ReleaseId=str(release_id), UBR=rng.randrange(5000))
+            if release_id == 2009:
+                values['DisplayVersion'] = rng.choice(('20H2', '21H1', '21H2', '22H2', '23H2', '24H2'))
+        registry[CURRENT_VERSION_KEY] = dict(values=values)
+        if major_version == 6 and product_type != VER_NT_WORKSTATION:
+            choice = rng.random()
+            if choice < 0.1:
+                registry[SERVER_LEVELS_KEY] = dict(error='missing')
+            elif choice < 0.3:
+                registry[SERVER_LEVELS_KEY] = dict(error='access_denied')
+            else:
+                registry[SERVER_LEVELS_KEY] = dict(values=dict((name, 1) for name in SERVER_LEVELS_FEATURES
+                                                               if rng.random() < 0.7))
+        return registry
+
+    def generate(self):
+        # returns a random snapshot
+        from .backends import SERVER_LEVELS_KEY
+        from .dism import SERVER_CORE_FEATURE
+        rng = self._random
+        major_version, minor_version = rng.choice(VERSIONS)
+        product_type = rng.choice(self.product_types)
+        build_number, service_pack = BUILDS.get((major_version, minor_version), (10240, 0))
+        service_pack = rng.randint(0, service_pack)
+        suite_mask = 0
+        for suite in self.suites:
+            if rng.random() < 0.1:
+                suite_mask |= suite
+        snapshot = dict(format=1, registry={})
+        if (major_version, minor_version) >= (6, 2):
+            registry = self._registry(major_version, minor_version, build_number, product_type)
+            snapshot['registry'] = registry
+            if registry.get(SERVER_LEVELS_KEY, {}).get('error') == 'access_denied':
+                state = rng.choice(('Disabled', 'Enabled', None))
+                snapshot['dism'] = None if state is None else DISM_OUTPUT.format(SERVER_CORE_FEATURE, state)
+            # GetVersionEx is stuck at 6.2
+            version_ex = pack_version_ex(6, 2, 9200, product_type, 0, 0, suite_mask)
+        else:
+            version_ex = pack_version_ex(major_version, minor_version, build_number, product_type, service_pack, 0,
+                                         suite_mask)
+        snapshot['version_ex'] = _hex(version_ex)
+        snapshot['system_info'] = _hex(pack_system_info(rng.choice(self.architectures), rng.choice((1, 2, 4, 8)),
+                                                        rng.random() < 0.9))
+        if major_version >= 6:
+            snapshot['product_info'] = rng.choice(self.products)
+        return snapshot
+
+    def __iter__(self):
+        while True:
+            yield self.generate()
+
+
+def generate_snapshots(count=None, seed=0):
+    # yields "count" random snapshots (forever if count is None); the same seed yields the same snapshots
+    from itertools import islice
+    generator = iter(SnapshotGenerator(seed))
+    return generator if count is None else islice(generator, count)
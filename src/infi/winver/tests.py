@@ -25,17 +25,1998 @@ from contextlib import contextmanager
 from . import Windows
 
 class WindowsTestCase(unittest.TestCase):
+    @unittest.parameters.iterate("example", [(0, 'Windows Server 2008 R2', 'x64', 1), (1, 'Windows XP', 'x86', 3)])
+    def test_init(self, example):
+        # Windows() is lazy, so the whole detection runs on freeze
+        from .structures import OSVersionExStructure, get_system_info_structure, from_buffer
+        index, version, architecture, service_pack = example
+        record = EXAMPLES[index]
+        version_ex = from_buffer(OSVersionExStructure, _to_bytes(record["OSVersionEx"]))
+        system_info_bytes = _to_bytes(record["SystemInfo"])
+        system_info = from_buffer(get_system_info_structure(len(system_info_bytes)), system_info_bytes)
+        with mock.patch("infi.winver.interface.get_version_ex", return_value=version_ex), \
+             mock.patch("infi.winver.interface.get_system_info", return_value=system_info), \
+             mock.patch("infi.winver.interface.get_product_info", return_value=record["ProductInfo"]):
+            windows = Windows().freeze()
+        self.assertEqual((windows.version, windows.architecture, windows.service_pack),
+                         (version, architecture, service_pack))
+
+    def test_is_x64_probes_only_system_info(self):
+        from .constants import PROCESSOR_ARCHITECTURE_AMD64
+        system_info = mock.Mock(processor_architecture=PROCESSOR_ARCHITECTURE_AMD64)
+        with mock.patch("infi.winver.interface.get_system_info", return_value=system_info) as get_system_info, \
+             mock.patch("infi.winver.interface.get_version_ex") as get_version_ex, \
+             mock.patch("infi.winver.interface.get_product_info") as get_product_info, \
+             mock.patch("infi.registry.LocalComputer") as local_computer, \
+             mock.patch("infi.execute.execute") as execute:
+            windows = Windows()
+            self.assertTrue(windows.is_x64())
+            self.assertTrue(windows.is_x64())
+        self.assertEqual(get_system_info.call_count, 1)
+        self.assertFalse(get_version_ex.called)
+        self.assertFalse(get_product_info.called)
+        self.assertFalse(local_computer.called)
+        self.assertFalse(execute.called)
+
+    def test_fields(self):
+        version_ex = mock.Mock(major_version=6, minor_version=1, build_number=7601, product_type=1,
+                               service_pack_major=1, service_pack_minor=0, suite_mask=0)
+        with mock.patch("infi.winver.interface.get_version_ex", return_value=version_ex) as get_version_ex, \
+             mock.patch("infi.winver.interface.get_system_info") as get_system_info, \
+             mock.patch("infi.winver.interface.get_product_info") as get_product_info:
+            windows = Windows(fields=["version", "service_pack"])
+            self.assertEqual(get_version_ex.call_count, 1)
+            self.assertFalse(get_system_info.called)
+            self.assertFalse(get_product_info.called)
+            self.assertTrue(windows.is_windows_7())
+            self.assertEqual(windows.service_pack, 1)
+        self.assertRaises(AttributeError, getattr, windows, "win10_update")
+        self.assertRaises(ValueError, Windows, fields=["no_such_field"])
+
+
+def _windows_7_version_ex():
+    return mock.Mock(major_version=6, minor_version=1, build_number=7601, product_type=1,
+                     service_pack_major=1, service_pack_minor=0, suite_mask=0)
+
+
+class SharedWindowsTestCase(unittest.TestCase):
+    def setUp(self):
+        from . import invalidate
+        invalidate()
+        self.addCleanup(invalidate)
+
     @contextmanager
-    def _mocked_interface(self, record):
-        with mock.patch("infi.winver.interface.GetVersionExA") as get_version, \
-             mock.patch("infi.winver.interface.GetSystemInfo") as get_system, \
-             mock.patch("infi.winver.interface.GetProductInfo") as get_product:
-            get_version.return_value = record["OSVersionEx"]
-            get_system.return_value = record["SystemInfo"]
-            get_product.return_value = record["ProductInfo"]
-            yield
+    def _slow_probes(self, delay=0.05):
+        from time import sleep
+        from .constants import PROCESSOR_ARCHITECTURE_AMD64, PRODUCT_ULTIMATE
+
+        def slow_version_ex():
+            sleep(delay)
+            return _windows_7_version_ex()
+        with mock.patch("infi.winver.interface.get_version_ex", side_effect=slow_version_ex) as get_version_ex, \
+             mock.patch("infi.winver.interface.get_system_info") as get_system_info, \
+             mock.patch("infi.winver.interface.get_product_info", return_value=PRODUCT_ULTIMATE) as get_product_info:
+            get_system_info.return_value.processor_architecture = PROCESSOR_ARCHITECTURE_AMD64
+            yield get_version_ex, get_system_info, get_product_info
+
+    def test_single_flight(self):
+        from threading import Thread, Barrier
+        from . import get_windows
+        thread_count = 32
+        barrier = Barrier(thread_count)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(get_windows())
+        with self._slow_probes() as probes:
+            threads = [Thread(target=worker) for _ in range(thread_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(results), thread_count)
+        self.assertTrue(all(result is results[0] for result in results))
+        for probe in probes:
+            self.assertEqual(probe.call_count, 1)
+        self.assertTrue(results[0].is_windows_7())
+        self.assertTrue(results[0].is_x64())
+
+    def test_frozen(self):
+        from . import get_windows
+        with self._slow_probes(0):
+            windows = get_windows()
+        self.assertRaises(AttributeError, setattr, windows, "version", "Windows 10")
+        self.assertEqual(windows.version, "Windows 7")
+
+    def test_frozen_win10_update(self):
+        from .backends import ReplayBackend
+        windows = Windows(backend=ReplayBackend(SNAPSHOTS[3]['snapshot'])).freeze()
+        self.assertTrue(windows.is_windows_7())
+        with self.assertRaises(AttributeError) as context:
+            windows.win10_update  # pylint: disable-msg=W0104
+        self.assertEqual(context.exception.args, ('win10_update',))
+        self.assertIsNone(getattr(windows, 'win10_update', None))
+
+    def test_invalidate(self):
+        from . import get_windows, invalidate
+        with self._slow_probes(0) as (get_version_ex, _, _):
+            first = get_windows()
+            self.assertIs(get_windows(), first)
+            invalidate()
+            second = get_windows()
+        self.assertIsNot(first, second)
+        self.assertEqual(get_version_ex.call_count, 2)
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import path
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        self.path = path.join(directory, "winver.json")
+
+    @contextmanager
+    def _probes(self, fingerprint=(7601, None, 12345)):
+        from .constants import PROCESSOR_ARCHITECTURE_AMD64, PRODUCT_ULTIMATE
+        with mock.patch("infi.winver.cache.get_fingerprint", return_value=list(fingerprint)), \
+             mock.patch("infi.winver.interface.get_version_ex", side_effect=_windows_7_version_ex) as get_version_ex, \
+             mock.patch("infi.winver.interface.get_system_info") as get_system_info, \
+             mock.patch("infi.winver.interface.get_product_info", return_value=PRODUCT_ULTIMATE):
+            get_system_info.return_value.processor_architecture = PROCESSOR_ARCHITECTURE_AMD64
+            yield get_version_ex
+
+    def _assert_windows_7(self, windows):
+        self.assertTrue(windows.is_windows_7())
+        self.assertTrue(windows.is_x64())
+        self.assertEqual(windows.service_pack, 1)
+        self.assertTrue(windows.greater_than("Windows Vista"))
+
+    def test_hit(self):
+        from .cache import get_cached_windows
+        with self._probes() as get_version_ex:
+            self._assert_windows_7(get_cached_windows(self.path))
+            self.assertEqual(get_version_ex.call_count, 1)
+        with self._probes() as get_version_ex, \
+             mock.patch("infi.winver.interface.get_system_info") as get_system_info, \
+             mock.patch("infi.winver.interface.get_product_info") as get_product_info:
+            windows = get_cached_windows(self.path)
+            self._assert_windows_7(windows)
+            self.assertFalse(get_version_ex.called)
+            self.assertFalse(get_system_info.called)
+            self.assertFalse(get_product_info.called)
+        self.assertRaises(AttributeError, setattr, windows, "version", "Windows 10")
+
+    def test_fingerprint_mismatch(self):
+        from .cache import get_cached_windows
+        with self._probes():
+            get_cached_windows(self.path)
+        with self._probes(fingerprint=(7601, None, 12346)) as get_version_ex:
+            self._assert_windows_7(get_cached_windows(self.path))
+            self.assertEqual(get_version_ex.call_count, 1)
+
+    def test_corrupt_file(self):
+        from .cache import get_cached_windows
+        with open(self.path, "w") as fd:
+            fd.write('{"format": 1, "fingerp')
+        with self._probes() as get_version_ex:
+            self._assert_windows_7(get_cached_windows(self.path))
+            self.assertEqual(get_version_ex.call_count, 1)
+            self._assert_windows_7(get_cached_windows(self.path))
+            self.assertEqual(get_version_ex.call_count, 1)
+
+    def test_format_version_mismatch(self):
+        import json
+        from .cache import get_cached_windows
+        with self._probes():
+            get_cached_windows(self.path)
+        with open(self.path) as fd:
+            data = json.load(fd)
+        data["format"] += 1
+        with open(self.path, "w") as fd:
+            json.dump(data, fd)
+        with self._probes() as get_version_ex:
+            self._assert_windows_7(get_cached_windows(self.path))
+            self.assertEqual(get_version_ex.call_count, 1)
+
+    def test_untrusted_file_is_ignored(self):
+        import os
+        from .cache import get_cached_windows
+        if not hasattr(os, 'geteuid'):
+            raise unittest.SkipTest("posix only")
+        with self._probes():
+            get_cached_windows(self.path)
+        os.chmod(self.path, 0o666)
+        with self._probes() as get_version_ex:
+            self._assert_windows_7(get_cached_windows(self.path))
+            self.assertEqual(get_version_ex.call_count, 1)
+            # the file written in its place is private again
+            self._assert_windows_7(get_cached_windows(self.path))
+            self.assertEqual(get_version_ex.call_count, 1)
+
+    def test_fingerprint_opens_one_key(self):
+        from .cache import get_fingerprint, BOOT_TIME_RESOLUTION
+        from .backends import LiveBackend
+        values = {"CurrentBuildNumber": mock.Mock(**{"to_python_object.return_value": "19045"}),
+                  "UBR": mock.Mock(**{"to_python_object.return_value": 3693})}
+        with mock.patch("infi.registry.LocalComputer") as local_computer, \
+             mock.patch("infi.winver.interface.get_boot_time", return_value=BOOT_TIME_RESOLUTION * 10.5):
+            local_machine = local_computer.return_value.local_machine
+            local_machine.__getitem__.return_value.values_store = values
+            self.assertEqual(get_fingerprint(LiveBackend()), ["19045", 3693, 10])
+        self.assertEqual(local_machine.__getitem__.call_count, 1)
+
+
+def _version_ex_hex(major_version, minor_version, build_number, product_type, service_pack_major=0, suite_mask=0):
+    from binascii import hexlify
+    from .structures import OSVersionExStructure, to_bytes
+    version_ex = OSVersionExStructure(version_info_size=156, major_version=major_version,
+                                      minor_version=minor_version, build_number=build_number, platform_id=2,
+                                      service_pack_major=service_pack_major, suite_mask=suite_mask,
+                                      product_type=product_type)
+    return hexlify(to_bytes(version_ex)).decode('ascii')
+
+
+def _system_info_hex(processor_architecture):
+    from binascii import hexlify
+    from .structures import SystemInfoStructure, to_bytes
+    system_info = SystemInfoStructure(processor_architecture=processor_architecture, page_Size=4096,
+                                      minimum_application_address=0x10000,
+                                      maximum_application_address=0x7ffeffff, active_processor_mask=1,
+                                      number_of_processors=1, processor_type=8664, allocation_granularity=0x10000,
+                                      processor_level=6, processor_revision=0x2c02)
+    return hexlify(to_bytes(system_info)).decode('ascii')
+
+
+DISM_SERVER_CORE_OUTPUT = """
+Deployment Image Servicing and Management tool
+
+------------------------------------------- | --------
+Feature Name                                | State
+------------------------------------------- | --------
+Server-Gui-Mgmt                             | Disabled
+ServerCore-FullServer                       | Disabled
+Printing-XPSServices-Features               | Enabled
+
+The operation completed successfully.
+"""
+
+SNAPSHOTS = [
+    dict(name='Windows Server 2012 R2 core, registry access denied',
+         expected=dict(version='Windows Server 2012 R2', edition='Datacenter', server_core=True, hyper_v=False,
+                       architecture='x64', service_pack=0),
+         snapshot=dict(format=1, version_ex=_version_ex_hex(6, 2, 9200, 3), system_info=_system_info_hex(9),
+                       product_info=0x8, dism=DISM_SERVER_CORE_OUTPUT,
+                       registry={r'Software\Microsoft\Windows NT\CurrentVersion':
+                                 dict(values=dict(CurrentVersion='6.3', CurrentBuildNumber='9600')),
+                                 r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Server\ServerLevels':
+                                 dict(error='access_denied')})),
+    dict(name='Windows Server 2012',
+         expected=dict(version='Windows Server 2012', edition='Standard', server_core=False, hyper_v=False,
+                       architecture='x64', service_pack=0),
+         snapshot=dict(format=1, version_ex=_version_ex_hex(6, 2, 9200, 3), system_info=_system_info_hex(9),
+                       product_info=0x7,
+                       registry={r'Software\Microsoft\Windows NT\CurrentVersion':
+                                 dict(values=dict(CurrentVersion='6.2', CurrentBuildNumber='9200')),
+                                 r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Server\ServerLevels':
+                                 dict(values={"ServerCore": 1})})),
+    dict(name='Windows Server 2019',
+         expected=dict(version='Windows Server 2019', edition='Datacenter', server_core=False, hyper_v=False,
+                       architecture='x64', service_pack=0, win10_update='RTM'),
+         snapshot=dict(format=1, version_ex=_version_ex_hex(6, 2, 9200, 3), system_info=_system_info_hex(9),
+                       product_info=0x8,
+                       registry={r'Software\Microsoft\Windows NT\CurrentVersion':
+                                 dict(values=dict(CurrentMajorVersionNumber=10, CurrentMinorVersionNumber=0,
+                                                  CurrentVersion='6.3', CurrentBuildNumber='17763',
+                                                  ReleaseId='1809'))})),
+    dict(name='Windows 7 x86',
+         expected=dict(version='Windows 7', edition='Client', server_core=False, hyper_v=False,
+                       architecture='x86', service_pack=1),
+         snapshot=dict(format=1, version_ex=_version_ex_hex(6, 1, 7601, 1, service_pack_major=1),
+                       system_info=_system_info_hex(0), product_info=0x1, registry={})),
+    dict(name='Windows Server 2003 Enterprise',
+         expected=dict(version='Windows Server 2003', edition='Enterprise', server_core=False, hyper_v=False,
+                       architecture='x86', service_pack=2),
+         snapshot=dict(format=1, version_ex=_version_ex_hex(5, 2, 3790, 3, service_pack_major=2, suite_mask=0x2),
+                       system_info=_system_info_hex(0), registry={})),
+]
+
+
+class BackendTestCase(unittest.TestCase):
+    def _assert_expected(self, windows, expected):
+        for name, value in expected.items():
+            self.assertEqual(getattr(windows, name), value, name)
+
+    @unittest.parameters.iterate("record", SNAPSHOTS)
+    def test_replay(self, record):
+        from .backends import ReplayBackend
+        self._assert_expected(Windows(backend=ReplayBackend(record['snapshot'])), record['expected'])
+
+    @unittest.parameters.iterate("record", SNAPSHOTS)
+    def test_record_and_replay(self, record):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import path
+        from .backends import ReplayBackend, record as record_snapshot
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        snapshot_path = path.join(directory, "snapshot.json")
+        record_snapshot(snapshot_path, ReplayBackend(record['snapshot']))
+        self._assert_expected(Windows(backend=ReplayBackend.load(snapshot_path)), record['expected'])
+
+    def test_unsupported_format(self):
+        from .backends import ReplayBackend
+        self.assertRaises(ValueError, ReplayBackend, dict(format=0))
+
+    @unittest.parameters.iterate("suite", [(0, 'Standard'), (0x2, 'Enterprise'), (0x80, 'Datacenter'),
+                                           (0x82, 'Datacenter'), (0x4000, 'Compute Cluster'), (0x2000, 'Storage'),
+                                           (0x10, 'Standard')])
+    def test_windows5_suite_mask(self, suite):
+        # the Windows 5 edition comes from wSuiteMask; wProductType of a server (3) has the VER_SUITE_ENTERPRISE bit
+        from .backends import ReplayBackend
+        suite_mask, edition = suite
+        version_ex = _version_ex_hex(5, 2, 3790, 3, service_pack_major=2, suite_mask=suite_mask)
+        snapshot = dict(format=1, version_ex=version_ex, system_info=_system_info_hex(0), registry={})
+        self.assertEqual(Windows(backend=ReplayBackend(snapshot)).edition, edition)
+
+
+def _to_bytes(string):
+    # the recorded EXAMPLES are native strings
+    return string if isinstance(string, bytes) else string.encode('latin-1')
+
+
+class StructuresTestCase(unittest.TestCase):
+    @unittest.parameters.iterate("record", EXAMPLES)
+    def test_version_ex_equivalence(self, record):
+        from .structures import OSVersionEx, OSVersionExStructure, from_buffer, to_bytes
+        data = _to_bytes(record["OSVersionEx"])
+        instruct_version_ex = OSVersionEx.create_from_string(data)  # pylint: disable-msg=E1101
+        version_ex = from_buffer(OSVersionExStructure, data)
+        for name, _ in OSVersionExStructure._fields_:  # pylint: disable-msg=W0212
+            self.assertEqual(getattr(version_ex, name), getattr(instruct_version_ex, name), name)
+        self.assertEqual(to_bytes(version_ex), data)
+        self.assertEqual(to_bytes(version_ex), OSVersionEx.write_to_string(instruct_version_ex))  # pylint: disable-msg=E1101
 
     @unittest.parameters.iterate("record", EXAMPLES)
-    def test_init(self, record):
-        with self._mocked_interface(record):
-            Windows()
+    def test_system_info_equivalence(self, record):
+        from ctypes import sizeof
+        from .structures import SystemInfo, SystemInfoStructure, from_buffer, to_bytes
+        data = _to_bytes(record["SystemInfo"])
+        if len(data) != sizeof(SystemInfoStructure):
+            raise unittest.SkipTest("recorded on a platform with a different pointer size")
+        instruct_system_info = SystemInfo.create_from_string(data)  # pylint: disable-msg=E1101
+        system_info = from_buffer(SystemInfoStructure, data)
+        # the infi.instruct structure treats active_processor_mask as a DWORD, so only the fields before it match
+        for name in ("processor_architecture", "reserved", "page_Size", "minimum_application_address",
+                     "maximum_application_address"):
+            self.assertEqual(getattr(system_info, name), getattr(instruct_system_info, name), name)
+        self.assertEqual(to_bytes(system_info), data)
+
+    def test_32bit_system_info(self):
+        from .structures import get_system_info_structure, from_buffer
+        data = _to_bytes(EXAMPLES[1]["SystemInfo"])
+        system_info = from_buffer(get_system_info_structure(len(data)), data)
+        self.assertEqual((system_info.processor_architecture, system_info.number_of_processors), (0, 1))
+
+    def test_from_buffer_does_not_copy(self):
+        from .structures import OSVersionExStructure, from_buffer
+        buff = bytearray(_to_bytes(EXAMPLES[0]["OSVersionEx"]) * 2)
+        version_ex = from_buffer(OSVersionExStructure, buff, 156)
+        self.assertEqual(version_ex.major_version, 6)
+        buff[156 + 4] = 10
+        self.assertEqual(version_ex.major_version, 10)
+
+
+class RegistrySnapshotTestCase(unittest.TestCase):
+    @contextmanager
+    def _registry(self, keys):
+        # "keys" maps a key to a dict of values, or to an exception raised when the key is opened
+        def open_key(key):
+            values = keys.get(key, KeyError(key))
+            if isinstance(values, Exception):
+                raise values
+            values_store = {name: mock.Mock(**{"to_python_object.return_value": value})
+                            for name, value in values.items()}
+            return mock.Mock(values_store=values_store)
+        with mock.patch("infi.registry.LocalComputer") as local_computer:
+            local_machine = local_computer.return_value.local_machine
+            local_machine.__getitem__.side_effect = open_key
+            yield local_machine.__getitem__
+
+    def _windows(self, record):
+        from .backends import LiveBackend, ReplayBackend
+        replay = ReplayBackend(record['snapshot'])
+        backend = LiveBackend()
+        for name in ("get_version_ex", "get_system_info", "get_product_info", "get_dism_features"):
+            setattr(backend, name, getattr(replay, name))
+        return Windows(backend=backend)
+
+    def _keys(self, record):
+        from infi.registry.errors import AccessDeniedException
+        keys = {}
+        for key, recorded in record['snapshot']['registry'].items():
+            if recorded.get('error') == 'access_denied':
+                keys[key] = AccessDeniedException(key)
+            elif 'values' in recorded:
+                keys[key] = recorded['values']
+        return keys
+
+    @unittest.parameters.iterate("record", SNAPSHOTS)
+    def test_each_key_opened_once(self, record):
+        with self._registry(self._keys(record)) as open_key:
+            windows = self._windows(record)
+            windows.analyze()
+            windows.analyze()
+        for name, value in record['expected'].items():
+            self.assertEqual(getattr(windows, name), value, name)
+        opened = [call[0][0] for call in open_key.call_args_list]
+        self.assertEqual(sorted(opened), sorted(set(opened)))
+        self.assertEqual(set(opened), set(record['snapshot']['registry']))
+
+    def test_server_2019_opens_one_key(self):
+        from .backends import CURRENT_VERSION_KEY
+        record = SNAPSHOTS[2]
+        with self._registry(self._keys(record)) as open_key:
+            windows = self._windows(record)
+            self.assertEqual(windows.version, 'Windows Server 2019')
+            self.assertEqual(windows.win10_update, 'RTM')
+            self.assertTrue(windows.greater_than('Windows Server 2016'))
+        open_key.assert_called_once_with(CURRENT_VERSION_KEY)
+
+    def test_values_are_immutable(self):
+        import operator
+        from .backends import CURRENT_VERSION_KEY
+        record = SNAPSHOTS[2]
+        with self._registry(self._keys(record)):
+            values = self._windows(record).get_registry_values(CURRENT_VERSION_KEY)
+        self.assertEqual(values['CurrentBuildNumber'], '17763')
+        self.assertNotIn('UBR', values)
+        self.assertRaises(TypeError, operator.setitem, values, 'UBR', 1)
+
+
+# prints a dism-like feature table of "lines" lines, one line every "delay" seconds,
+# with ServerCore-FullServer at line "feature_at"
+FAKE_DISM = r"""
+import sys, time
+lines, feature_at, delay, state = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]), sys.argv[4]
+sys.stdout.write("Feature Name                                | State\n")
+for index in range(lines):
+    name = "ServerCore-FullServer" if index == feature_at else "Feature-%d" % index
+    sys.stdout.write("%-44s| %s\n" % (name, state if index == feature_at else "Enabled"))
+    sys.stdout.flush()
+    time.sleep(delay)
+"""
+
+
+def fake_dism_command(directory, lines, feature_at, delay, state="Disabled"):
+    from os import path
+    from sys import executable
+    script = path.join(directory, "fake_dism.py")
+    with open(script, "w") as fd:
+        fd.write(FAKE_DISM)
+    return [executable, script, str(lines), str(feature_at), str(delay), state]
+
+
+class DismTestCase(unittest.TestCase):
+    def setUp(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+    def test_stops_at_feature_line(self):
+        from time import time
+        from .dism import read_features, is_server_core
+        command = fake_dism_command(self.directory, lines=10000, feature_at=5, delay=0.01)
+        start = time()
+        output = read_features(command, timeout=30)
+        self.assertLess(time() - start, 10)
+        self.assertTrue(output.splitlines()[-1].startswith("ServerCore-FullServer"))
+        self.assertEqual(len(output.splitlines()), 7)
+        self.assertTrue(is_server_core(output))
+
+    def test_full_server(self):
+        from .dism import read_features, is_server_core
+        command = fake_dism_command(self.directory, lines=50, feature_at=40, delay=0, state="Enabled")
+        self.assertFalse(is_server_core(read_features(command, timeout=30)))
+
+    def test_no_feature_line(self):
+        from .dism import read_features, is_server_core
+        command = fake_dism_command(self.directory, lines=50, feature_at=-1, delay=0)
+        output = read_features(command, timeout=30)
+        self.assertEqual(len(output.splitlines()), 51)
+        self.assertFalse(is_server_core(output))
+
+    def test_timeout(self):
+        from time import time
+        from .dism import read_features
+        command = fake_dism_command(self.directory, lines=1000, feature_at=900, delay=0.01)
+        start = time()
+        self.assertIsNone(read_features(command, timeout=0.5))
+        self.assertLess(time() - start, 5)
+
+    def test_per_boot_cache(self):
+        from os import path
+        from sys import executable
+        from .dism import get_features
+        cache_path = path.join(self.directory, "dism.json")
+        command = fake_dism_command(self.directory, lines=50, feature_at=3, delay=0)
+        failing_command = [executable, "-c", "import sys; sys.exit(1)"]
+        output = get_features(command, 30, cache_path, boot_time=6000)
+        self.assertEqual(get_features(failing_command, 30, cache_path, boot_time=6010), output)
+        self.assertEqual(get_features(failing_command, 30, cache_path, boot_time=9000), "")
+
+    def test_cache_is_opt_in(self):
+        from .backends import LiveBackend
+        self.assertIsNone(LiveBackend().get_dism_cache_path())
+
+    def test_untrusted_cache_is_ignored(self):
+        import os
+        from .dism import load_cached_features, save_cached_features
+        if not hasattr(os, 'geteuid'):
+            raise unittest.SkipTest("posix only")
+        cache_path = os.path.join(self.directory, "dism.json")
+        save_cached_features(cache_path, 6000, "output")
+        self.assertEqual(load_cached_features(cache_path, 6000), "output")
+        os.chmod(cache_path, 0o666)
+        self.assertIsNone(load_cached_features(cache_path, 6000))
+
+    def _windows(self, dism_command, dism_timeout):
+        from .backends import LiveBackend, ReplayBackend
+        replay = ReplayBackend(SNAPSHOTS[0]['snapshot'])
+        backend = LiveBackend(dism_timeout=dism_timeout, dism_cache_path='', dism_command=dism_command)
+        for name in ("get_version_ex", "get_system_info", "get_product_info", "get_registry_values"):
+            setattr(backend, name, getattr(replay, name))
+        return Windows(backend=backend)
+
+    def test_windows_server_core(self):
+        command = fake_dism_command(self.directory, lines=10000, feature_at=5, delay=0.01)
+        self.assertTrue(self._windows(command, 30).is_server_core())
+
+    def test_windows_unknown_server_core(self):
+        command = fake_dism_command(self.directory, lines=1000, feature_at=900, delay=0.01)
+        windows = self._windows(command, 0.5)
+        self.assertIsNone(windows.server_core)
+        self.assertFalse(windows.is_server_core())
+
+
+class DelayedBackend(object):
+    # wraps a backend and sleeps before every probe, to simulate slow hosts
+    def __init__(self, backend, delays):
+        self._backend = backend
+        self._delays = delays
+
+    def __getattr__(self, name):
+        from time import sleep
+        method = getattr(self._backend, name)
+
+        def delayed(*args, **kwargs):
+            sleep(self._delays.get(name, 0))
+            return method(*args, **kwargs)
+        return delayed
+
+
+SLOW_PROBES = dict(get_version_ex=0.01, get_system_info=0.1, get_product_info=0.1, get_registry_values=0.1,
+                   get_dism_features=0.1)
+
+
+class ConcurrentAnalysisTestCase(unittest.TestCase):
+    ATTRIBUTES = ('version', 'edition', 'server_core', 'hyper_v', 'service_pack', 'architecture',
+                  '_major_version', '_minor_version', '_build_number', '_product_type')
+
+    def _attributes(self, windows):
+        return {name: getattr(windows, name) for name in self.ATTRIBUTES + ('win10_update', '_release_id')
+                if name in self.ATTRIBUTES or name in windows.__dict__}
+
+    @unittest.parameters.iterate("record", SNAPSHOTS)
+    def test_same_result_as_serial(self, record):
+        from .backends import ReplayBackend
+        serial = Windows(backend=ReplayBackend(record['snapshot']))
+        serial.analyze()
+        concurrent = Windows(backend=ReplayBackend(record['snapshot']))
+        concurrent.analyze(concurrent=True)
+        self.assertEqual(self._attributes(concurrent), self._attributes(serial))
+
+    def test_latency(self):
+        from time import time
+        from .backends import ReplayBackend
+        timings = []
+        for concurrent in (False, True):
+            windows = Windows(backend=DelayedBackend(ReplayBackend(SNAPSHOTS[0]['snapshot']), SLOW_PROBES))
+            start = time()
+            windows.analyze(concurrent=concurrent)
+            timings.append(time() - start)
+            self.assertTrue(windows.is_server_core())
+        serial, concurrent = timings
+        # serial is the sum of all probes (~0.51s), concurrent is version_ex + one probe + dism (~0.21s)
+        self.assertLess(concurrent, serial * 0.7)
+
+    def test_errors_are_raised_by_the_analysis(self):
+        from .backends import ReplayBackend
+        snapshot = dict(SNAPSHOTS[0]['snapshot'], registry={})
+        for concurrent in (False, True):
+            windows = Windows(backend=ReplayBackend(snapshot))
+            self.assertRaises(KeyError, windows.analyze, concurrent=concurrent)
+
+    def test_failed_probes_do_not_run_again(self):
+        from .backends import ReplayBackend
+        calls = []
+
+        class FailingDismBackend(ReplayBackend):
+            def get_dism_features(self):
+                calls.append('dism')
+                raise OSError("dism failed")
+        windows = Windows(backend=FailingDismBackend(SNAPSHOTS[0]['snapshot']))
+        self.assertRaises(OSError, windows.analyze, concurrent=True)
+        self.assertEqual(calls, ['dism'])
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def test_dependencies_run_first(self):
+        from threading import Lock
+        from .scheduler import run_graph
+        order = []
+        lock = Lock()
+
+        def task(name):
+            def function():
+                with lock:
+                    order.append(name)
+            return function
+        run_graph(dict(a=((), task('a')), b=(('a',), task('b')), c=(('a',), task('c')), d=(('b', 'c'), task('d'))))
+        self.assertEqual(order[0], 'a')
+        self.assertEqual(sorted(order[1:3]), ['b', 'c'])
+        self.assertEqual(order[3], 'd')
+
+    def test_error(self):
+        from .scheduler import run_graph
+        called = []
+
+        def fail():
+            raise KeyError('a')
+        self.assertRaises(KeyError, run_graph, dict(a=((), fail), b=(('a',), lambda: called.append('b'))))
+        self.assertEqual(called, [])
+
+    def test_invalid_graph(self):
+        from .scheduler import run_graph
+        self.assertRaises(ValueError, run_graph, dict(a=(('b',), lambda: None)))
+        self.assertRaises(ValueError, run_graph, dict(a=(('b',), lambda: None), b=(('a',), lambda: None)))
+
+
+class CountingBackend(object):
+    # wraps a backend and counts the calls to each probe
+    def __init__(self, backend):
+        from collections import Counter
+        self._backend = backend
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        method = getattr(self._backend, name)
+
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return method(*args, **kwargs)
+        return counted
+
+
+class AsyncTestCase(unittest.TestCase):
+    def setUp(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from . import invalidate
+        invalidate()
+        self.addCleanup(invalidate)
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+    def _run(self, coroutine):
+        import asyncio
+        return asyncio.run(coroutine)
+
+    def _backend(self, dism_command, dism_timeout=30):
+        from .backends import LiveBackend, ReplayBackend
+        replay = DelayedBackend(ReplayBackend(SNAPSHOTS[0]['snapshot']), SLOW_PROBES)
+        backend = LiveBackend(dism_timeout=dism_timeout, dism_cache_path='', dism_command=dism_command)
+        for name in ("get_version_ex", "get_system_info", "get_product_info", "get_registry_values"):
+            setattr(backend, name, getattr(replay, name))
+        return backend
+
+    def test_event_loop_stays_responsive(self):
+        import asyncio
+        from time import time
+        from . import detect_windows
+        command = fake_dism_command(self.directory, lines=100, feature_at=30, delay=0.005)
+        ticks = []
+
+        async def ticker(done):
+            while not done.is_set():
+                ticks.append(time())
+                await asyncio.sleep(0.01)
+
+        async def main():
+            done = asyncio.Event()
+            ticker_task = asyncio.ensure_future(ticker(done))
+            windows = await detect_windows(self._backend(command))
+            done.set()
+            await ticker_task
+            return windows
+        windows = self._run(main())
+        self.assertTrue(windows.is_server_core())
+        self.assertEqual(windows.version, 'Windows Server 2012 R2')
+        # the probes block for ~0.6 seconds altogether, the ticker must keep ticking throughout
+        self.assertGreater(len(ticks), 20)
+        self.assertLess(max(later - earlier for earlier, later in zip(ticks, ticks[1:])), 0.09)
+
+    def test_concurrent_awaiters_share_a_detection(self):
+        import asyncio
+        from . import detect_windows, get_windows
+        command = fake_dism_command(self.directory, lines=100, feature_at=30, delay=0)
+        backend = self._backend(command)
+        # only the results of live backends are shared, so the calls are counted inside the LiveBackend
+        counting = CountingBackend(backend)
+        for name in ("get_version_ex", "get_system_info", "get_registry_values"):
+            setattr(backend, name, getattr(counting, name))
+
+        async def main():
+            return await asyncio.gather(*[detect_windows(backend) for _ in range(20)])
+        results = self._run(main())
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertIs(get_windows(), results[0])
+        self.assertEqual(counting.calls['get_version_ex'], 1)
+        self.assertEqual(counting.calls['get_system_info'], 1)
+        self.assertEqual(counting.calls['get_registry_values'], 2)
+        self.assertRaises(AttributeError, setattr, results[0], "version", "Windows 10")
+
+    def test_dism_timeout(self):
+        from . import detect_windows
+        command = fake_dism_command(self.directory, lines=1000, feature_at=900, delay=0.01)
+        windows = self._run(detect_windows(self._backend(command, dism_timeout=0.3)))
+        self.assertIsNone(windows.server_core)
+
+    def test_replay_backend(self):
+        from . import detect_windows
+        from .backends import ReplayBackend
+        windows = self._run(detect_windows(ReplayBackend(SNAPSHOTS[0]['snapshot'])))
+        self.assertTrue(windows.is_server_core())
+
+    def test_replay_backend_is_not_shared(self):
+        from . import detect_windows, _share_windows
+        from .backends import ReplayBackend
+        shared = object()
+        self.assertIs(_share_windows(shared), shared)
+        windows = self._run(detect_windows(ReplayBackend(SNAPSHOTS[3]['snapshot'])))
+        self.assertIsNot(windows, shared)
+        self.assertEqual(windows.version, SNAPSHOTS[3]['expected']['version'])
+        self.assertIs(_share_windows(windows), shared)
+
+
+class ReleaseTableTestCase(unittest.TestCase):
+    WORKSTATION, SERVER = 1, 3
+
+    def _lookup(self, product_type, release_id, build_number):
+        from .releases import get_release_table
+        return get_release_table().lookup(product_type, release_id, build_number)
+
+    def test_existing_workstation_mappings(self):
+        from . import win10_release_id_to_update
+        for release_id, update in win10_release_id_to_update.items():
+            self.assertEqual(self._lookup(self.WORKSTATION, release_id, 10240), ('Windows 10', update))
+
+    def test_existing_server_mappings(self):
+        from . import win10_server_release_id_to_update, FIRST_WIN_SERVER_2019_RELEASE_ID
+        for release_id, update in win10_server_release_id_to_update.items():
+            version = 'Windows Server 2016' if release_id < FIRST_WIN_SERVER_2019_RELEASE_ID else 'Windows Server 2019'
+            self.assertEqual(self._lookup(self.SERVER, release_id, 14393), (version, update))
+
+    def test_existing_thresholds(self):
+        from . import LAST_RELEASE_ID, FIRST_WIN_2022_SRVER_BUILD_NUMBER, FIRST_WIN_SERVER_2019_RELEASE_ID
+        self.assertEqual(self._lookup(self.SERVER, FIRST_WIN_SERVER_2019_RELEASE_ID - 1, 17134),
+                         ('Windows Server 2016', 'Unknown'))
+        self.assertEqual(self._lookup(self.SERVER, 1903, 18362), ('Windows Server 2019', 'Unknown'))
+        self.assertEqual(self._lookup(self.SERVER, LAST_RELEASE_ID, FIRST_WIN_2022_SRVER_BUILD_NUMBER - 1),
+                         ('Windows Server 2019', 'Unknown'))
+        self.assertEqual(self._lookup(self.SERVER, LAST_RELEASE_ID, FIRST_WIN_2022_SRVER_BUILD_NUMBER)[0],
+                         'Windows Server 2022')
+        self.assertEqual(self._lookup(2, LAST_RELEASE_ID, 20348)[0], 'Windows Server 2022')
+
+    def test_new_releases(self):
+        self.assertEqual(self._lookup(self.WORKSTATION, 2009, 19045), ('Windows 10', '2022 Update'))
+        self.assertEqual(self._lookup(self.WORKSTATION, 2009, 22000), ('Windows 11', 'Gold'))
+        self.assertEqual(self._lookup(self.WORKSTATION, 2009, 22631), ('Windows 11', '2023 Update'))
+        self.assertEqual(self._lookup(self.WORKSTATION, 2009, 22635), ('Windows 11', '2023 Update'))
+        self.assertEqual(self._lookup(self.SERVER, 2009, 20348), ('Windows Server 2022', 'RTM'))
+        self.assertEqual(self._lookup(self.SERVER, 2009, 26100), ('Windows Server 2025', 'RTM'))
+
+    def test_unknown_release_ids(self):
+        self.assertEqual(self._lookup(self.WORKSTATION, 1500, 10000), ('Windows 10', 'Unknown'))
+        self.assertEqual(self._lookup(self.WORKSTATION, 1610, 14393), ('Windows 10', 'Unknown'))
+        self.assertEqual(self._lookup(self.SERVER, 1000, 10000), ('Windows Server 2016', 'Unknown'))
+
+    def test_extend_from_file(self):
+        import json
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import path
+        from .releases import load_release_table
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        releases_path = path.join(directory, "releases.json")
+        with open(releases_path, "w") as fd:
+            json.dump(dict(format=1, releases=[
+                dict(product="server", release_id=2009, first_build=30000, version="Windows Server 2028", update="RTM"),
+                dict(product="server", release_id=1607, first_build=0, version="Windows Server 2016", update="GA"),
+            ]), fd)
+        table = load_release_table(releases_path)
+        self.assertEqual(table.lookup(self.SERVER, 2009, 30001), ('Windows Server 2028', 'RTM'))
+        self.assertEqual(table.lookup(self.SERVER, 1607, 14393), ('Windows Server 2016', 'GA'))
+        self.assertEqual(table.lookup(self.SERVER, 2009, 26100), ('Windows Server 2025', 'RTM'))
+
+    def test_windows_11(self):
+        from .backends import ReplayBackend
+        snapshot = dict(format=1, version_ex=_version_ex_hex(6, 2, 9200, 1), system_info=_system_info_hex(9),
+                        product_info=0x30,
+                        registry={r'Software\Microsoft\Windows NT\CurrentVersion':
+                                  dict(values=dict(CurrentMajorVersionNumber=10, CurrentMinorVersionNumber=0,
+                                                   CurrentVersion='6.3', CurrentBuildNumber='22631',
+                                                   ReleaseId='2009', DisplayVersion='23H2', UBR=4169))})
+        windows = Windows(backend=ReplayBackend(snapshot))
+        self.assertTrue(windows.is_windows_11())
+        self.assertEqual(windows.win10_update, '2023 Update')
+        self.assertEqual(windows.edition, 'Client')
+
+
+def _branch_windows6_edition(product_type):
+    # the if/elif chain analyze_windows6_edition used before the product table, as a reference
+    from .constants import PRODUCT_SUITE_CLUSTER, PRODUCT_SUITE_DATACENTER, PRODUCT_SUITE_ENTERPRISE
+    from .constants import PRODUCT_SUITE_STORAGE, PRODUCT_SUITE_STANDARD, PRODUCT_SUITE_SMALL_BUSINESS
+    from .constants import SERVER_CORE, HYPER_V
+    edition = None
+    if product_type in PRODUCT_SUITE_CLUSTER:
+        edition = 'Compute Cluster'
+    if product_type in PRODUCT_SUITE_DATACENTER:
+        edition = 'Datacenter'
+    elif product_type in PRODUCT_SUITE_ENTERPRISE:
+        edition = 'Enterprise'
+    elif product_type in PRODUCT_SUITE_STORAGE:
+        edition = 'Storage'
+    elif product_type in PRODUCT_SUITE_STANDARD:
+        edition = 'Standard'
+    elif product_type in PRODUCT_SUITE_SMALL_BUSINESS:
+        edition = 'Small Business'
+    else:
+        edition = 'Client'
+    return edition, product_type in SERVER_CORE, product_type in HYPER_V
+
+
+def _product_constants():
+    from . import constants
+    return [(name, getattr(constants, name)) for name in dir(constants)
+            if name.startswith('PRODUCT_') and not name.startswith('PRODUCT_SUITE_')]
+
+
+class ProductTableTestCase(unittest.TestCase):
+    def test_parity_with_branch_logic(self):
+        from .constants import PRODUCT_SUITE_CLUSTER
+        from .products import classify_product
+        for name, product_type in _product_constants() + [(None, 0xabcdef), (None, -1)]:
+            product = classify_product(product_type)
+            edition, server_core, hyper_v = _branch_windows6_edition(product_type)
+            if product_type in PRODUCT_SUITE_CLUSTER:
+                # the chain fell through from 'Compute Cluster' to 'Client'
+                self.assertEqual(edition, 'Client')
+                edition = 'Compute Cluster'
+            self.assertEqual((product.edition, product.server_core, product.hyper_v), (edition, server_core, hyper_v),
+                             name)
+
+    def test_names(self):
+        from .products import get_product_name, get_product_table
+        for name, product_type in _product_constants():
+            self.assertEqual(get_product_name(product_type), name)
+        self.assertIsNone(get_product_name(0xabcdef))
+        self.assertEqual(len(get_product_table()), len(_product_constants()))
+
+    def test_suite(self):
+        from .constants import PRODUCT_DATACENTER_SERVER_CORE, PRODUCT_PROFESSIONAL, PRODUCT_HYPERV
+        from .products import classify_product
+        self.assertEqual(classify_product(PRODUCT_DATACENTER_SERVER_CORE),
+                         ('PRODUCT_DATACENTER_SERVER_CORE', 'Datacenter', True, False, 'PRODUCT_SUITE_DATACENTER'))
+        self.assertEqual(classify_product(PRODUCT_PROFESSIONAL).suite, 'PRODUCT_SUITE_PROFESSIONAL')
+        self.assertIsNone(classify_product(PRODUCT_HYPERV).suite)
+
+    def test_immutable(self):
+        import operator
+        from .products import get_product_table
+        self.assertRaises(TypeError, operator.setitem, get_product_table(), 1, None)
+
+
+def _tuple_greater_than(windows, os_name):
+    # Windows.greater_than before WindowsVersion, as a reference
+    from . import name_to_version
+    if windows._major_version == 10:  # pylint: disable-msg=W0212
+        actual_version = (windows._major_version, windows._minor_version, windows._release_id)  # pylint: disable-msg=W0212
+    else:
+        actual_version = (windows._major_version, windows._minor_version)  # pylint: disable-msg=W0212
+    compared_version = name_to_version[os_name]
+    if compared_version[0] < 10:
+        compared_version = compared_version[:2]
+    return actual_version > compared_version
+
+
+def _hosts():
+    # Windows instances of every version in version_to_name and every release id in releases.json
+    from . import version_to_name
+    from .constants import VER_NT_WORKSTATION, VER_NT_SERVER
+    from .releases import get_release_table
+    hosts = []
+    for version in version_to_name:
+        if version[0] < 10:
+            hosts.append((version[0], version[1], version[2] if len(version) > 2 else VER_NT_SERVER, 0, 0))
+    for _, release_id, first_build in get_release_table().get_releases():
+        for product_type in (VER_NT_WORKSTATION, VER_NT_SERVER):
+            hosts.append((10, 0, product_type, release_id, max(first_build, 10240)))
+    for major_version, minor_version, product_type, release_id, build_number in hosts:
+        windows = Windows()
+        windows._major_version, windows._minor_version = major_version, minor_version  # pylint: disable-msg=W0201,W0212
+        windows._product_type, windows._release_id = product_type, release_id  # pylint: disable-msg=W0201,W0212
+        windows._build_number = build_number  # pylint: disable-msg=W0201,W0212
+        yield windows
+
+
+class WindowsVersionTestCase(unittest.TestCase):
+    def test_parity_with_greater_than(self):
+        from . import name_to_version
+        for windows in _hosts():
+            for name in name_to_version:
+                self.assertEqual(windows.greater_than(name), _tuple_greater_than(windows, name),
+                                 (windows.version_info, name))
+
+    def test_interned(self):
+        from .version import WindowsVersion
+        self.assertIs(WindowsVersion('Windows Server 2019'), WindowsVersion((10, 0, 1809)))
+        self.assertIs(WindowsVersion((6, 1)), WindowsVersion('Windows 7'))
+        self.assertIs(WindowsVersion((6, 1)), WindowsVersion('Windows Server 2008 R2'))
+        self.assertEqual(len(set([WindowsVersion((6, 1)), WindowsVersion((6, 1, 0, 0))])), 1)
+
+    def test_order(self):
+        from .version import WindowsVersion
+        names = ['Windows 2000', 'Windows XP', 'Windows Server 2003', 'Windows Vista', 'Windows 7', 'Windows 8',
+                 'Windows 8.1', 'Windows 10', 'Windows Server 2016', 'Windows Server 2019', 'Windows Server 2022',
+                 'Windows 11', 'Windows Server 2025']
+        versions = [WindowsVersion(name) for name in names]
+        self.assertEqual(sorted(reversed(versions)), versions)
+        # releases that share release id 2009 are ordered by build, Server 2022 (20348) came before Windows 11 (22000)
+        self.assertTrue(WindowsVersion('Windows Server 2022') <= WindowsVersion((10, 0, 2009, 20285)) <
+                        WindowsVersion('Windows 11'))
+        self.assertTrue(WindowsVersion('Windows XP') != WindowsVersion('Windows 7'))
+        self.assertEqual(WindowsVersion('Windows Server 2022').build, 20285)
+
+    def test_invalid(self):
+        from .version import WindowsVersion
+        self.assertRaises(ValueError, WindowsVersion, 'Windows 95')
+        self.assertRaises(ValueError, WindowsVersion, (10,))
+        self.assertRaises(AttributeError, setattr, WindowsVersion((10, 0)), 'major', 11)
+        with self.assertRaises(TypeError):
+            WindowsVersion((10, 0)) < (10, 0)  # pylint: disable-msg=W0106
+
+    def test_pickle(self):
+        import pickle
+        from .version import WindowsVersion
+        version = WindowsVersion('Windows Server 2022')
+        self.assertIs(pickle.loads(pickle.dumps(version)), version)
+
+    def test_version_info(self):
+        from .backends import ReplayBackend
+        from .version import WindowsVersion
+        for record in SNAPSHOTS:
+            windows = Windows(backend=ReplayBackend(record['snapshot'])).freeze()
+            self.assertEqual(windows.version_info, WindowsVersion(record['expected']['version']), record['name'])
+            self.assertFalse(windows.greater_than(windows.version_info))
+            self.assertFalse(windows.less_than(record['expected']['version']))
+
+    def test_windows_11_and_2022(self):
+        from .backends import ReplayBackend, CURRENT_VERSION_KEY
+        from .constants import VER_NT_SERVER
+        snapshot = dict(SNAPSHOTS[2]['snapshot'])
+        snapshot['version_ex'] = _version_ex_hex(6, 2, 9200, VER_NT_SERVER)
+        snapshot['registry'] = {CURRENT_VERSION_KEY: dict(values=dict(
+            CurrentMajorVersionNumber=10, CurrentMinorVersionNumber=0, CurrentBuildNumber='20348', ReleaseId='2009'))}
+        windows = Windows(backend=ReplayBackend(snapshot))
+        self.assertEqual(windows.version, 'Windows Server 2022')
+        self.assertTrue(windows.greater_than('Windows Server 2019'))
+        self.assertTrue(windows.less_than('Windows 11'))
+        self.assertTrue(windows.less_than('Windows Server 2025'))
+
+
+def _release_snapshots():
+    # a snapshot of a Windows 10 / Server 2016 and later host for every release in releases.json
+    from .backends import CURRENT_VERSION_KEY
+    from .constants import VER_NT_WORKSTATION, VER_NT_SERVER, PRODUCT_PROFESSIONAL, PRODUCT_DATACENTER_SERVER
+    from .releases import get_release_table
+    snapshots = []
+    for version, release_id, first_build in get_release_table().get_releases():
+        server = 'Server' in version
+        build_number = max(first_build, 14393 if server else 10240)
+        values = dict(CurrentMajorVersionNumber=10, CurrentMinorVersionNumber=0, CurrentVersion='6.3',
+                      CurrentBuildNumber=str(build_number), ReleaseId=str(release_id))
+        snapshots.append(dict(format=1, version_ex=_version_ex_hex(6, 2, 9200,
+                                                                   VER_NT_SERVER if server else VER_NT_WORKSTATION),
+                              system_info=_system_info_hex(9),
+                              product_info=PRODUCT_DATACENTER_SERVER if server else PRODUCT_PROFESSIONAL,
+                              registry={CURRENT_VERSION_KEY: dict(values=values)}))
+    return snapshots
+
+
+def _recorded_hosts():
+    # frozen Windows instances of SNAPSHOTS and _release_snapshots
+    from .backends import ReplayBackend
+    snapshots = [record['snapshot'] for record in SNAPSHOTS] + _release_snapshots()
+    return [Windows(backend=ReplayBackend(snapshot)).freeze() for snapshot in snapshots]
+
+
+def _chained_rule(windows):
+    # "Windows Server 2016+ and x64 and not server_core or Windows 10 >= 1809" with the is_* methods
+    return (not windows.less_than('Windows Server 2016') and windows.is_x64() and not windows.is_server_core()) or \
+        (windows.is_windows_10() and windows.version_info.release_id >= 1809)
+
+
+class RequirementTestCase(unittest.TestCase):
+    RULE = "Windows Server 2016+ and x64 and not server_core or Windows 10 >= 1809"
+
+    def test_parity_with_chained_calls(self):
+        from . import requirement
+        rule = requirement(self.RULE)
+        hosts = _recorded_hosts()
+        self.assertEqual([rule(windows) for windows in hosts], [_chained_rule(windows) for windows in hosts])
+        self.assertIn(True, [rule(windows) for windows in hosts])
+        self.assertIn(False, [rule(windows) for windows in hosts])
+
+    def test_cached(self):
+        from . import requirement
+        self.assertIs(requirement(self.RULE), requirement(self.RULE))
+
+    def test_clauses(self):
+        from .requirements import compile_requirement
+        hosts = dict((windows.version, windows) for windows in _recorded_hosts())
+        server_2019, windows_7, server_2003 = hosts['Windows Server 2019'], hosts['Windows 7'], hosts['Windows Server 2003']
+        cases = [("windows 7", windows_7, True),
+                 ("Windows 7", server_2019, False),
+                 ("Windows 7+", server_2019, True),
+                 ("< Windows Server 2008 and x86", server_2003, True),
+                 ("Windows Server 2019 == 1809 and edition == datacenter", server_2019, True),
+                 ("edition != Enterprise", server_2003, False),
+                 ("cluster_aware and service_pack >= 2", server_2003, True),
+                 ("architecture == X86 and (hyper_v or NOT server_core)", windows_7, True),
+                 ("ia64 or Windows 11+", windows_7, False)]
+        for text, windows, expected in cases:
+            self.assertEqual(compile_requirement(text)(windows), expected, text)
+
+    def test_explain(self):
+        from .requirements import compile_requirement
+        windows_7 = _recorded_hosts()[3]
+        self.assertIsNone(compile_requirement("Windows 7 and x86").explain(windows_7))
+        self.assertEqual(compile_requirement("Windows 7 and x64").explain(windows_7),
+                         "x64 is false (architecture is 'x86')")
+        self.assertEqual(compile_requirement("Windows 10 >= 1809 or not Windows 7").explain(windows_7),
+                         "none of: Windows 10 >= 1809 is false (version is 'Windows 7', release id 0); "
+                         "not Windows 7 is false (the negated clause is true)")
+        self.assertEqual(compile_requirement("Windows Server 2016+").explain(windows_7),
+                         "Windows Server 2016+ is false (version is 'Windows 7' (6.1.0.0))")
+
+    def test_unknown_server_core(self):
+        from .requirements import compile_requirement
+        from .result import DetectionResult
+        windows = DetectionResult.from_dict(dict(DetectionResult.from_windows(_recorded_hosts()[0]).to_dict(),
+                                                 server_core=None))
+        for text in ("server_core", "not server_core", "not not server_core", "x64 and not server_core",
+                     "not (server_core or x86)"):
+            self.assertFalse(compile_requirement(text)(windows), text)
+        self.assertTrue(compile_requirement("not server_core or x64")(windows))
+        self.assertTrue(compile_requirement("not (server_core and x86)")(windows))
+        self.assertEqual(compile_requirement("x64 and not server_core").explain(windows),
+                         "server_core is unknown (server_core is None)")
+
+    def test_invalid(self):
+        from .requirements import compile_requirement
+        for text in ("", "Windows 95", "x64 and", "(x64", "x64)", "Windows 10 >= 18O9", "edition > Standard",
+                     "service_pack", "x64 or or x86", "Windows 10 = 1809"):
+            self.assertRaises(ValueError, compile_requirement, text)
+
+
+class DetectionResultTestCase(unittest.TestCase):
+    def _results(self):
+        from .result import DetectionResult
+        return [DetectionResult.from_windows(windows) for windows in _recorded_hosts()]
+
+    def test_same_as_windows(self):
+        from . import FIELDS
+        from .requirements import compile_requirement
+        checks = [name for name in dir(Windows) if name.startswith('is_')]
+        rule = compile_requirement(RequirementTestCase.RULE)
+        for windows, result in zip(_recorded_hosts(), self._results()):
+            for name in FIELDS + ('version_info',):
+                self.assertEqual(getattr(result, name), getattr(windows, name, None), name)
+            for name in checks:
+                self.assertEqual(getattr(result, name)(), getattr(windows, name)(), name)
+            self.assertEqual(result.greater_than('Windows 7'), windows.greater_than('Windows 7'))
+            self.assertEqual(rule(result), rule(windows))
+            self.assertEqual(str(result), str(windows))
+
+    def test_compact(self):
+        results = self._results()
+        self.assertFalse(hasattr(results[0], '__dict__'))
+        self.assertRaises(AttributeError, setattr, results[0], 'version', 'Windows 95')
+        self.assertRaises(AttributeError, delattr, results[0], 'version')
+        copy = type(results[0]).from_dict(dict(results[0].to_dict(), version=''.join(results[0].version)))
+        self.assertIs(copy.version, results[0].version)
+        self.assertIs(copy.version_info, results[0].version_info)
+
+    def test_dict_and_pickle(self):
+        import json
+        import pickle
+        from .result import DetectionResult
+        results = self._results()
+        for result in results:
+            self.assertEqual(DetectionResult.from_dict(json.loads(json.dumps(result.to_dict()))), result)
+        self.assertEqual(pickle.loads(pickle.dumps(results, pickle.HIGHEST_PROTOCOL)), results)
+        self.assertEqual(len(set(results + results)), len(set(results)))
+        self.assertRaises(ValueError, DetectionResult.from_dict, dict(version='Windows 7'))
+
+    def test_codes(self):
+        from .result import DetectionResult, get_names
+        names = get_names()
+        fields = dict(version=names.versions, win10_update=names.updates, edition=names.editions,
+                      architecture=names.architectures)
+        for result in self._results():
+            for name, code in result.get_codes().items():
+                self.assertEqual(fields[name][code], getattr(result, name), name)
+        unknown = DetectionResult.from_dict(dict(self._results()[0].to_dict(), edition='Ultimate Plus'))
+        self.assertEqual(names.editions[unknown.get_codes()['edition']], 'Unknown')
+
+
+def _corpus():
+    return [record['snapshot'] for record in SNAPSHOTS] + _release_snapshots()
+
+
+class BatchTestCase(unittest.TestCase):
+    def _expected(self, snapshots):
+        from .result import DetectionResult
+        from .backends import ReplayBackend
+        return [DetectionResult.from_windows(Windows(backend=ReplayBackend(snapshot))) for snapshot in snapshots]
+
+    def test_serial(self):
+        from . import classify_many
+        snapshots = _corpus()
+        self.assertEqual(list(classify_many(snapshots, chunksize=4)), self._expected(snapshots))
+
+    def test_ordered(self):
+        from . import classify_many
+        snapshots = _corpus() * 3
+        self.assertEqual(list(classify_many(iter(snapshots), workers=2, chunksize=5)), self._expected(snapshots))
+
+    def test_unordered(self):
+        from . import classify_many
+        snapshots = _corpus() * 3
+        results = list(classify_many(snapshots, workers=2, chunksize=1, ordered=False))
+        self.assertEqual(sorted(results, key=repr), sorted(self._expected(snapshots), key=repr))
+
+    def test_lazy(self):
+        from itertools import cycle, islice
+        from . import classify_many
+        snapshots = _corpus()
+        results = list(islice(classify_many(cycle(snapshots), workers=2, chunksize=3), len(snapshots)))
+        self.assertEqual(results, self._expected(snapshots))
+
+    def test_errors(self):
+        from . import classify_many
+        self.assertRaises(ValueError, list, classify_many(_corpus() + [dict(format=0)], workers=2, chunksize=4))
+        self.assertRaises(ValueError, list, classify_many(_corpus(), chunksize=0))
+
+
+def _columnar_rows(count, seed=0):
+    # random (major, minor, build, product_type, release_id, product_info, processor_architecture, suite_mask) rows,
+    # drawn from the values the lookup tables know about and a few they do not
+    import random
+    from .constants import VER_NT_WORKSTATION, VER_NT_DOMAIN_CONTROLLER, VER_NT_SERVER
+    from .releases import get_release_table
+    rng = random.Random(seed)
+    versions = [(4, 0), (5, 0), (5, 1), (5, 2), (6, 0), (6, 1), (6, 2), (6, 3), (6, 4), (10, 0), (10, 0), (10, 0)]
+    release_ids = sorted(set(key[1] for key, _ in get_release_table().get_entries())) + [1000, 1905, 2100]
+    builds = sorted(set(key[2] for key, _ in get_release_table().get_entries())) + [10240, 17763, 20348, 30000]
+    product_infos = [product_type for _, product_type in _product_constants()] + [0, 0xabcd]
+    rows = []
+    for _ in range(count):
+        major, minor = rng.choice(versions)
+        build = rng.choice(builds) + rng.choice([0, 0, 1, 100])
+        rows.append((major, minor, build, rng.choice([VER_NT_WORKSTATION, VER_NT_DOMAIN_CONTROLLER, VER_NT_SERVER]),
+                     rng.choice(release_ids), rng.choice(product_infos), rng.choice([0, 5, 6, 9, 12, 0xffff]),
+                     rng.getrandbits(16)))
+    return rows
+
+
+def _scalar_classify(row):
+    # the analyze_* methods of Windows on a row of _columnar_rows, leaving out the registry based server core check
+    major, minor, build, product_type, release_id, product_info, processor_architecture, suite_mask = row
+    windows = Windows()
+    windows._major_version, windows._minor_version, windows._build_number = major, minor, build  # pylint: disable-msg=W0201,W0212
+    windows._product_type, windows._release_id = product_type, release_id  # pylint: disable-msg=W0201,W0212
+    windows._product_info = product_info  # pylint: disable-msg=W0201,W0212
+    windows._version_ex = mock.Mock(suite_mask=suite_mask, product_type=product_type)  # pylint: disable-msg=W0201,W0212
+    windows._system_info = mock.Mock(processor_architecture=processor_architecture)  # pylint: disable-msg=W0201,W0212
+    windows.analyze_version()
+    windows.server_core = windows.hyper_v = False
+    windows.edition = 'Standard'
+    if major == 5:
+        windows.analyze_windows5_edition()
+    elif major in (6, 10):
+        windows._edition = windows.get_windows6_edition()  # pylint: disable-msg=W0201,W0212
+        windows.analyze_windows6_edition()
+    else:
+        windows.edition = 'Unknown'
+    windows.analyze_windows_architecture()
+    return windows
+
+
+class ColumnarTestCase(unittest.TestCase):
+    def setUp(self):
+        try:
+            import numpy  # pylint: disable-msg=W0612
+        except ImportError:
+            raise unittest.SkipTest("numpy is not installed")
+
+    def _classify(self, rows):
+        from .columnar import classify_columns
+        return classify_columns(*zip(*rows))
+
+    def test_differential(self):
+        rows = _columnar_rows(5000)
+        result = self._classify(rows)
+        fields = dict((name, result.decode(name)) for name in ('version', 'win10_update', 'edition', 'architecture'))
+        for index, row in enumerate(rows):
+            windows = _scalar_classify(row)
+            for name, values in fields.items():
+                self.assertEqual(values[index], getattr(windows, name, None), (name, row))
+            self.assertEqual(bool(result.server_core[index]), windows.server_core, row)
+            self.assertEqual(bool(result.hyper_v[index]), windows.hyper_v, row)
+
+    def test_greater_than(self):
+        from . import name_to_version
+        rows = _columnar_rows(2000, seed=1)
+        result = self._classify(rows)
+        hosts = [_scalar_classify(row) for row in rows]
+        for name in list(name_to_version) + ['Windows 11', 'Windows Server 2022', 'Windows Server 2025']:
+            self.assertEqual(result.greater_than(name).tolist(), [windows.greater_than(name) for windows in hosts],
+                             name)
+            self.assertEqual(result.less_than(name).tolist(), [windows.less_than(name) for windows in hosts], name)
+
+    def test_counts(self):
+        import numpy
+        result = self._classify(_columnar_rows(100))
+        counts = numpy.bincount(result.version, minlength=len(result.versions))
+        self.assertEqual(counts.sum(), len(result))
+        self.assertEqual(counts[result.version_code('Windows 7')], result.decode('version').count('Windows 7'))
+
+
+def _raw_record_lines(example):
+    # the lines print_records prints for one of the EXAMPLES
+    return ["OSVersionEx = %r\n" % _to_bytes(example['OSVersionEx']),
+            "SystemInfo = %r\n" % _to_bytes(example['SystemInfo']),
+            "ProductInfo = %r\n" % example['ProductInfo']]
+
+
+class RecordsTestCase(unittest.TestCase):
+    def _lines(self):
+        import json
+        lines = []
+        for index, snapshot in enumerate(_corpus()):
+            lines.append(json.dumps(snapshot) + '\n')
+            lines.extend(_raw_record_lines(EXAMPLES[(index + 1) % len(EXAMPLES)]))
+        return lines
+
+    def _classify(self, lines, **kwargs):
+        import json
+        from io import StringIO
+        from .records import classify_stream
+        output = StringIO()
+        count = classify_stream(iter(lines), output, **kwargs)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(count, len(results))
+        return results
+
+    def test_ndjson_and_raw(self):
+        results = self._classify(self._lines())
+        self.assertEqual(len(results), 2 * len(_corpus()))
+        self.assertEqual(results[0]['version'], SNAPSHOTS[0]['expected']['version'])
+        self.assertEqual([result['version'] for result in results[1::2][:2]], ['Windows XP', 'Windows Server 2008 R2'])
+        self.assertEqual(results[1]['architecture'], 'x86')
+        self.assertEqual(results[3]['architecture'], 'x64')
+        self.assertEqual(results[3]['version_info'], [6, 1, 0, 0])
+
+    def test_workers_keep_order(self):
+        lines = self._lines() * 3
+        self.assertEqual(self._classify(lines, workers=2, chunksize=7), self._classify(lines))
+
+    def test_fields(self):
+        results = self._classify(self._lines()[:1], fields=['architecture', 'version'])
+        self.assertEqual(list(results[0].keys()), ['architecture', 'version'])
+
+    def test_errors(self):
+        lines = ['{"format": 1\n', 'OSVersionEx = 1\n', '\n', '{"format": 0}\n', 'hello\n'] + \
+            _raw_record_lines(EXAMPLES[0])[:2]
+        results = self._classify(lines)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(list(result) == ['error'] for result in results))
+        self.assertTrue(results[1]['error'].startswith('line 4: incomplete'))
+
+    def test_script(self):
+        import json
+        from io import StringIO
+        from .scripts import classify
+        with mock.patch("sys.argv", ["winver-classify", "-j", "2", "--fields", "version"]), \
+             mock.patch("sys.stdin", StringIO(''.join(self._lines()[:4]))), \
+             mock.patch("sys.stdout", new_callable=StringIO) as stdout:
+            classify()
+        self.assertEqual([json.loads(line) for line in stdout.getvalue().splitlines()],
+                         [dict(version=SNAPSHOTS[0]['expected']['version']), dict(version='Windows XP')])
+        with mock.patch("sys.argv", ["winver-classify", "--fields", "version,bogus"]), \
+             mock.patch("sys.stderr", new_callable=StringIO):
+            self.assertRaises(SystemExit, classify)
+
+    def test_script_closed_pipe(self):
+        # e.g. "winver-classify | head -1"
+        import sys
+        from threading import Thread
+        from subprocess import Popen, PIPE
+        process = Popen([sys.executable, "-c", "from infi.winver.scripts import classify; classify()"],
+                        stdin=PIPE, stdout=PIPE, stderr=PIPE)
+
+        def write():
+            # the script stops reading once its output is gone
+            try:
+                process.stdin.write(''.join(self._lines()[:4] * 5000).encode('ascii'))
+                process.stdin.close()
+            except (IOError, OSError):
+                pass
+        writer = Thread(target=write)
+        writer.daemon = True
+        writer.start()
+        process.stdout.readline()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.wait()
+        process.stderr.close()
+        self.assertEqual(stderr, b'')
+
+
+class CorpusTestCase(unittest.TestCase):
+    def setUp(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import path
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        self.path = path.join(directory, "corpus.bin")
+
+    def _snapshots(self):
+        from .records import parse_raw_record
+        raw = [parse_raw_record(dict((name, line.partition('=')[2].strip())
+                                     for name, line in zip(('OSVersionEx', 'SystemInfo', 'ProductInfo'),
+                                                           _raw_record_lines(example))))
+               for example in EXAMPLES]
+        timed_out = dict(SNAPSHOTS[0]['snapshot'], dism=None)
+        return _corpus() + raw + [timed_out]
+
+    def test_round_trip(self):
+        from .backends import ReplayBackend
+        from .batch import classify, classify_backend
+        from .corpus import write_corpus, CorpusReader
+        snapshots = self._snapshots()
+        self.assertEqual(write_corpus(self.path, iter(snapshots)), len(snapshots))
+        with CorpusReader(self.path, verify=True) as reader:
+            self.assertEqual(len(reader), len(snapshots))
+            for snapshot, backend in zip(snapshots, reader):
+                self.assertEqual(classify_backend(backend), classify(snapshot))
+                self.assertEqual(classify(backend.to_snapshot()), classify(snapshot))
+                registry = backend.to_snapshot()['registry']
+                self.assertEqual(registry, snapshot['registry'])
+            self.assertEqual(classify_backend(reader[-1]).server_core, None)
+            self.assertEqual(reader[3].get_version_ex().build_number,
+                             ReplayBackend(snapshots[3]).get_version_ex().build_number)
+            self.assertRaises(IndexError, reader.__getitem__, len(snapshots))
+
+    def test_zero_copy(self):
+        from .corpus import write_corpus, CorpusReader
+        write_corpus(self.path, _corpus())
+        reader = CorpusReader(self.path)
+        version_ex = reader[2].get_version_ex()
+        reader._mmap[40 + 2 * 256 + 48 + 4] = 11  # pylint: disable-msg=W0212
+        self.assertEqual(version_ex.major_version, 11)
+        reader.close()
+        self.assertEqual(version_ex.major_version, 11)
+
+    def test_scan_and_workers(self):
+        from .corpus import write_corpus, classify_corpus
+        from .batch import classify
+        snapshots = self._snapshots() * 5
+        write_corpus(self.path, snapshots)
+        expected = [classify(snapshot) for snapshot in snapshots]
+        self.assertEqual(list(classify_corpus(self.path, chunksize=7)), expected)
+        self.assertEqual(list(classify_corpus(self.path, workers=2, chunksize=7)), expected)
+
+    def _corrupt(self, offset, value=b'\xff'):
+        with open(self.path, 'r+b') as fd:
+            fd.seek(offset)
+            fd.write(value)
+
+    def test_corruption(self):
+        import os
+        from .corpus import write_corpus, CorpusReader, CorpusWriter, HEADER, RECORD_SIZE
+        write_corpus(self.path, _corpus())
+        self._corrupt(HEADER.size + RECORD_SIZE + 10)
+        with CorpusReader(self.path) as reader:
+            reader.verify_record(0)
+            self.assertRaises(ValueError, reader.verify_record, 1)
+            self.assertRaises(ValueError, reader.verify)
+        with CorpusReader(self.path, verify=True) as reader:
+            self.assertRaises(ValueError, reader.__getitem__, 1)
+        for offset in (0, 12, os.path.getsize(self.path) - 1):
+            write_corpus(self.path, _corpus())
+            self._corrupt(offset)
+            self.assertRaises(ValueError, CorpusReader, self.path)
+        with open(self.path, 'r+b') as fd:
+            fd.truncate(100)
+        self.assertRaises(ValueError, CorpusReader, self.path)
+        with CorpusWriter(self.path) as writer:
+            writer.write(_corpus()[0])
+            writer.abort()
+        self.assertRaises(ValueError, CorpusReader, self.path)
+
+    def test_rewritten_corpus(self):
+        import os
+        from .corpus import write_corpus, get_reader, _readers
+        self.addCleanup(_readers.pop, self.path, None)
+        snapshots = _corpus()
+        write_corpus(self.path, snapshots)
+        reader = get_reader(self.path)
+        self.assertIs(get_reader(self.path), reader)
+        version_ex = reader[2].get_version_ex()
+        major_version = version_ex.major_version
+        write_corpus(self.path, snapshots[:2])
+        # the old records stay mapped, the next get_reader maps the new file
+        self.assertEqual(version_ex.major_version, major_version)
+        self.assertEqual(len(get_reader(self.path)), 2)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['corpus.bin'])
+
+    def test_unsupported_values(self):
+        from .backends import CURRENT_VERSION_KEY
+        from .corpus import encode_record
+        snapshot = dict(_corpus()[2])
+        snapshot['registry'] = {CURRENT_VERSION_KEY: dict(values=dict(ReleaseId='21H2'))}
+        self.assertRaises(ValueError, encode_record, snapshot)
+        snapshot['registry'] = {'Software\\Other': dict(values={})}
+        self.assertRaises(ValueError, encode_record, snapshot)
+
+
+class MemoTestCase(unittest.TestCase):
+    def _variant(self, snapshot, **values):
+        from .backends import CURRENT_VERSION_KEY
+        registry = dict(snapshot['registry'])
+        registry[CURRENT_VERSION_KEY] = dict(values=dict(registry[CURRENT_VERSION_KEY]['values'], **values))
+        return dict(snapshot, registry=registry)
+
+    def test_same_results(self):
+        from .batch import classify
+        from .memo import ClassificationMemo
+        memo = ClassificationMemo()
+        snapshots = _corpus() * 2
+        self.assertEqual([memo.classify(snapshot) for snapshot in snapshots],
+                         [classify(snapshot) for snapshot in snapshots])
+        self.assertEqual(memo.get_stats(), dict(hits=len(_corpus()), misses=len(_corpus()), evictions=0,
+                                                size=len(_corpus()), maxsize=4096))
+
+    def test_key(self):
+        from .backends import ReplayBackend
+        from .memo import get_key
+        snapshot = _release_snapshots()[-1]
+        key = get_key(ReplayBackend(snapshot))
+        self.assertEqual(get_key(ReplayBackend(self._variant(snapshot, UBR=4169, DisplayVersion='23H2'))), key)
+        self.assertNotEqual(get_key(ReplayBackend(self._variant(snapshot, CurrentBuildNumber='99999'))), key)
+        self.assertNotEqual(get_key(ReplayBackend(dict(snapshot, product_info=0x1))), key)
+        self.assertEqual(len(set(get_key(ReplayBackend(snapshot)) for snapshot in _corpus())), len(_corpus()))
+
+    def test_live_dism_is_not_run_for_the_key(self):
+        from .backends import LiveBackend, ReplayBackend
+        from .batch import classify_backend
+        from .memo import ClassificationMemo, get_key
+        # the registry of SNAPSHOTS[0] denies access to the ServerLevels key, so server core comes from dism
+        replay = ReplayBackend(SNAPSHOTS[0]['snapshot'])
+        backend = LiveBackend(dism_cache_path='')
+        for name in ("get_version_ex", "get_system_info", "get_product_info", "get_registry_values"):
+            setattr(backend, name, getattr(replay, name))
+        backend.get_dism_features = dism = mock.Mock(side_effect=replay.get_dism_features)
+        memo = ClassificationMemo()
+        self.assertIsNone(get_key(backend))
+        self.assertFalse(dism.called)
+        self.assertEqual(memo.classify_backend(backend), classify_backend(replay))
+        self.assertEqual(dism.call_count, 1)
+        self.assertEqual(memo.get_stats(), dict(hits=0, misses=0, evictions=0, size=0, maxsize=4096))
+        self.assertIsNotNone(get_key(replay))
+
+    def test_lru(self):
+        from .memo import ClassificationMemo
+        memo = ClassificationMemo(maxsize=2)
+        first, second, third = _corpus()[:3]
+        for snapshot in (first, second, first, third, first, second):
+            memo.classify(snapshot)
+        # "second" was the least recently used when "third" came in
+        self.assertEqual(memo.get_stats(), dict(hits=2, misses=4, evictions=2, size=2, maxsize=2))
+        memo.clear()
+        self.assertEqual((len(memo), memo.hits), (0, 0))
+        self.assertRaises(ValueError, ClassificationMemo, 0)
+
+    def test_bulk_entry_points(self):
+        import json
+        from io import StringIO
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import path
+        from . import classify_many
+        from .batch import classify
+        from .corpus import write_corpus, classify_corpus
+        from .memo import ClassificationMemo, get_memo, set_memo
+        from .records import classify_stream
+        set_memo(ClassificationMemo())
+        self.addCleanup(set_memo, None)
+        snapshots = _corpus() * 3
+        expected = [classify(snapshot) for snapshot in snapshots]
+        self.assertEqual(list(classify_many(snapshots, chunksize=5, memo=True)), expected)
+        self.assertEqual(get_memo().misses, len(_corpus()))
+        self.assertEqual(list(classify_many(snapshots, workers=2, chunksize=5, memo=True)), expected)
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        corpus = path.join(directory, "corpus.bin")
+        write_corpus(corpus, snapshots)
+        self.assertEqual(list(classify_corpus(corpus, chunksize=7, memo=True)), expected)
+        output = StringIO()
+        classify_stream([json.dumps(snapshot) for snapshot in snapshots], output, memo=True)
+        self.assertEqual([json.loads(line)['version'] for line in output.getvalue().splitlines()],
+                         [result.version for result in expected])
+
+
+class AggregateTestCase(unittest.TestCase):
+    def _results(self):
+        from .batch import classify
+        return [classify(snapshot) for snapshot in _corpus()] * 3
+
+    def test_counts(self):
+        from collections import Counter
+        from .aggregate import aggregate, AGGREGATE_FIELDS
+        results = self._results()
+        fleet = aggregate(iter(results))
+        self.assertEqual(fleet.total, len(results))
+        self.assertEqual(fleet.group_by(), Counter(tuple(getattr(result, name) for name in AGGREGATE_FIELDS)
+                                                   for result in results))
+        self.assertEqual(fleet.group_by('version'), Counter(result.version for result in results))
+        self.assertEqual(fleet.group_by('edition', 'architecture'),
+                         Counter((result.edition, result.architecture) for result in results))
+        self.assertEqual(fleet.top_k(1, 'version'), [('Windows 10', 42)])
+        self.assertEqual(fleet.top_k(2, 'architecture'), [('x64', 87), ('x86', 6)])
+        self.assertRaises(ValueError, fleet.group_by, 'service_pack')
+        self.assertRaises(ValueError, aggregate, results, ['bogus'])
+
+    def test_windows(self):
+        from .aggregate import FleetAggregate
+        from .backends import ReplayBackend
+        from .batch import classify
+        snapshot = SNAPSHOTS[3]['snapshot']
+        fleet = FleetAggregate()
+        fleet.add(Windows(backend=ReplayBackend(snapshot)).freeze())
+        fleet.update([Windows(backend=ReplayBackend(snapshot))])
+        self.assertEqual(fleet.group_by(), FleetAggregate().update([classify(snapshot)] * 2).group_by())
+        self.assertEqual(fleet.group_by('win10_update'), {None: 2})
+
+    def test_merge_order(self):
+        import json
+        import random
+        from functools import reduce
+        from operator import add
+        from .aggregate import aggregate, FleetAggregate
+        results = self._results()
+        expected = aggregate(results)
+        rng = random.Random(0)
+        for _ in range(10):
+            shuffled = list(results)
+            rng.shuffle(shuffled)
+            cuts = sorted(rng.sample(range(1, len(shuffled)), 5))
+            parts = [aggregate(shuffled[start:stop]) for start, stop in zip([0] + cuts, cuts + [None])]
+            rng.shuffle(parts)
+            # through JSON, as parts from other machines would arrive
+            parts = [FleetAggregate.from_dict(json.loads(json.dumps(part.to_dict()))) for part in parts]
+            self.assertEqual(reduce(add, parts), expected)
+            self.assertEqual(reduce(lambda left, right: right + left, parts), expected)
+            self.assertEqual(parts[0] + (parts[1] + parts[2]), (parts[0] + parts[1]) + parts[2])
+            merged = reduce(add, parts)
+            self.assertEqual(merged.to_dict(), expected.to_dict())
+            self.assertEqual(merged.top_k(3, 'version'), expected.top_k(3, 'version'))
+        self.assertEqual(FleetAggregate() + expected, expected)
+
+    def test_serialization(self):
+        import pickle
+        from .aggregate import aggregate, FleetAggregate
+        fleet = aggregate(self._results(), fields=['version', 'server_core'])
+        self.assertEqual(pickle.loads(pickle.dumps(fleet)), fleet)
+        self.assertEqual(FleetAggregate.from_dict(fleet.to_dict()).group_by('server_core'),
+                         fleet.group_by('server_core'))
+        self.assertRaises(ValueError, fleet.merge, FleetAggregate())
+        data = fleet.to_dict()
+        self.assertRaises(ValueError, FleetAggregate.from_dict, dict(data, total=1))
+        self.assertRaises(ValueError, FleetAggregate.from_dict, dict(data, format=0))
+
+    def test_aggregate_many(self):
+        from .aggregate import aggregate, aggregate_many
+        snapshots = _corpus() * 3
+        expected = aggregate(self._results())
+        self.assertEqual(aggregate_many(snapshots, chunksize=7), expected)
+        self.assertEqual(aggregate_many(iter(snapshots), workers=2, chunksize=7), expected)
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def test_events(self):
+        from .backends import ReplayBackend
+        from .instrumentation import record_events
+        with record_events() as recorder:
+            Windows(backend=ReplayBackend(SNAPSHOTS[0]['snapshot'])).freeze()
+        events = dict((event.probe, event) for event in recorder.events)
+        self.assertEqual(len(events), len(recorder.events))
+        self.assertEqual(dict((probe, (event.outcome, event.fallback)) for probe, event in events.items()),
+                         dict(version_ex=('ok', None), system_info=('ok', None), product_info=('ok', None),
+                              current_version=('ok', 'version_from_registry'),
+                              server_levels=('access_denied', None), dism=('ok', 'server_core_from_dism')))
+        self.assertTrue(all(event.start <= event.end for event in recorder.events))
+        summary = recorder.get_summary()
+        self.assertEqual(summary['probes']['dism']['count'], 1)
+        self.assertEqual(summary['probes']['dism']['fallbacks'], dict(server_core_from_dism=1))
+        self.assertEqual(summary['counters'], dict(api_calls=0, registry_opens=0, subprocess_spawns=0))
+
+    def test_outcomes(self):
+        from .backends import ReplayBackend, SERVER_LEVELS_KEY
+        from .instrumentation import record_events
+        snapshot = dict(SNAPSHOTS[0]['snapshot'], dism=None)
+        snapshot['registry'] = dict(snapshot['registry'])
+        with record_events() as recorder:
+            self.assertIsNone(Windows(backend=ReplayBackend(snapshot)).server_core)
+        event = recorder.events[-1]
+        self.assertEqual((event.probe, event.outcome, event.fallback), ('dism', 'timeout', 'server_core_from_dism'))
+        snapshot['registry'][SERVER_LEVELS_KEY] = dict(error='missing')
+        with record_events() as recorder:
+            Windows(backend=ReplayBackend(snapshot)).freeze()
+        self.assertEqual([event.outcome for event in recorder.events if event.probe == 'server_levels'], ['missing'])
+        with record_events() as recorder:
+            self.assertRaises(ValueError, Windows(backend=ReplayBackend(dict(snapshot, version_ex='00'))).freeze)
+        self.assertEqual([(event.probe, event.outcome) for event in recorder.events], [('version_ex', 'error')])
+
+    def test_hooks(self):
+        from .backends import ReplayBackend
+        from .instrumentation import add_hook, remove_hook, hook, is_enabled
+        events = []
+        with hook(events.append):
+            self.assertTrue(is_enabled())
+            Windows(backend=ReplayBackend(SNAPSHOTS[3]['snapshot'])).freeze()
+        self.assertFalse(is_enabled())
+        count = len(events)
+        self.assertEqual([event.probe for event in events], ['version_ex', 'product_info', 'system_info'])
+        Windows(backend=ReplayBackend(SNAPSHOTS[3]['snapshot'])).freeze()
+        self.assertEqual(len(events), count)
+        self.assertRaises(ValueError, remove_hook, events.append)
+        add_hook(events.append)
+        remove_hook(events.append)
+        self.assertFalse(is_enabled())
+
+    def test_counters(self):
+        from .backends import LiveBackend, CURRENT_VERSION_KEY
+        from .dism import read_features
+        from .instrumentation import get_counters, record_events
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        before = get_counters()
+        with record_events() as recorder, mock.patch("infi.registry.LocalComputer"):
+            LiveBackend().get_registry_values(CURRENT_VERSION_KEY, ())
+            read_features(fake_dism_command(directory, lines=3, feature_at=1, delay=0), timeout=30)
+        expected = dict(api_calls=0, registry_opens=1, subprocess_spawns=1)
+        self.assertEqual(recorder.get_summary()['counters'], expected)
+        self.assertEqual(get_counters(), dict((name, before[name] + expected[name]) for name in expected))
+
+
+# modules "import infi.winver" must not load, they are imported where they are needed
+LAZY_MODULES = ('pkg_resources', 'infi.cwrap', 'infi.instruct', 'infi.registry', 'infi.execute',
+                'infi.winver.constants')
+
+# the time "import infi.winver" (the infi namespace package included) may add to the startup of a new interpreter, as a
+# fraction of the startup time of a bare interpreter measured in the same run. see benchmarks/bench_import.py
+IMPORT_TIME_BUDGET = 1.0
+
+# runs first in the interpreters of the import tests: the infi namespace package of this source tree is imported
+# instead of whatever the -nspkg.pth files of installed infi.* packages set up at startup
+_IMPORT_SETUP = ("import sys; sys.path.insert(0, {!r}); "
+                 "[sys.modules.pop(name) for name in list(sys.modules) if name.split('.')[0] == 'infi']")
+
+
+def _get_source_directory():
+    # the directory the infi package of this file is in
+    from os import path
+    return path.dirname(path.dirname(path.dirname(path.realpath(__file__))))
+
+
+def _imported_modules(statement="import infi.winver"):
+    # runs "statement" in a new interpreter and returns the modules it imported, the infi namespace package included
+    import sys
+    import json
+    import subprocess
+    script = (_IMPORT_SETUP.format(_get_source_directory()) + "; import json; before = set(sys.modules); {}; "
+              "print(json.dumps(sorted(set(sys.modules) - before)))")
+    output = subprocess.check_output([sys.executable, '-c', script.format(statement)])
+    return json.loads(output.decode('utf-8'))
+
+
+def _startup_times(statement="import infi.winver", repeat=7):
+    # returns (best time of a new interpreter running "statement", best time of one running nothing), in seconds.
+    # the bytecode is written to a temporary directory by a first run, so the times do not include compiling
+    import os
+    import sys
+    import subprocess
+    from time import time
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    directory = mkdtemp()
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    setup = _IMPORT_SETUP.format(_get_source_directory())
+    scripts = (setup + "; " + statement, setup)
+    best = [None, None]
+    try:
+        for run in range(repeat + 1):
+            for index, script in enumerate(scripts):
+                start = time()
+                subprocess.check_call([sys.executable, '-X', 'pycache_prefix=' + directory, '-c', script], env=env)
+                elapsed = time() - start
+                if run > 0 and (best[index] is None or elapsed < best[index]):
+                    best[index] = elapsed
+    finally:
+        rmtree(directory)
+    return tuple(best)
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_lazy_dependencies(self):
+        modules = _imported_modules()
+        self.assertIn('infi', modules)
+        self.assertIn('infi.winver', modules)
+        self.assertEqual([name for name in modules if name.startswith(LAZY_MODULES)], [])
+
+    def test_budget(self):
+        import sys
+        if sys.version_info < (3, 8):
+            raise unittest.SkipTest("pycache_prefix needs python 3.8")
+        with_import, bare = _startup_times()
+        self.assertLess(with_import - bare, bare * IMPORT_TIME_BUDGET)
+
+
+class SyntheticTestCase(unittest.TestCase):
+    def test_deterministic(self):
+        from .synthetic import generate_snapshots
+        self.assertEqual(list(generate_snapshots(50, seed=3)), list(generate_snapshots(50, seed=3)))
+        self.assertNotEqual(list(generate_snapshots(50, seed=3)), list(generate_snapshots(50, seed=4)))
+
+    def test_coverage(self):
+        from . import version_to_name
+        from .backends import CURRENT_VERSION_KEY, ReplayBackend
+        from .batch import classify
+        from .synthetic import SnapshotGenerator, generate_snapshots
+        snapshots = list(generate_snapshots(3000))
+        results = [classify(snapshot) for snapshot in snapshots]
+        versions = set(result.version for result in results)
+        self.assertLessEqual(set(version_to_name.values()) | set(['Windows 11', 'Windows Server 2022']), versions)
+        self.assertNotIn('Unknown', versions)
+        generator = SnapshotGenerator()
+        self.assertEqual(set(snapshot['product_info'] for snapshot in snapshots if 'product_info' in snapshot),
+                         set(generator.products))
+        backends = [ReplayBackend(snapshot) for snapshot in snapshots]
+        self.assertEqual(set(backend.get_system_info().processor_architecture for backend in backends),
+                         set(generator.architectures))
+        self.assertEqual(set(backend.get_version_ex().product_type for backend in backends),
+                         set(generator.product_types))
+        release_ids = set(int(snapshot['registry'][CURRENT_VERSION_KEY]['values']['ReleaseId'])
+                          for snapshot in snapshots
+                          if 'ReleaseId' in snapshot['registry'].get(CURRENT_VERSION_KEY, {}).get('values', {}))
+        self.assertEqual(release_ids, set(release_id for release_id, _, _ in generator.releases))
+        self.assertEqual(set(result.server_core for result in results), set([True, False, None]))
+
+
+class DifferentialTestCase(unittest.TestCase):
+    def test_agreement(self):
+        from .batch import classify
+        from .differential import compare
+        from .synthetic import generate_snapshots
+        report = compare(classify, generate_snapshots(500))
+        self.assertEqual((report.count, report.mismatch_count, report.mismatches), (500, 0, []))
+        self.assertGreater(report.get_speedup(), 0)
+
+    def test_mismatches(self):
+        from .batch import classify
+        from .differential import compare, MAX_MISMATCHES
+        from .synthetic import generate_snapshots
+
+        def wrong_architecture(snapshot):
+            result = classify(snapshot).to_dict()
+            if result['architecture'] == 'x86':
+                result['architecture'] = 'x64'
+            return result
+
+        def wrong_errors(snapshot):
+            raise KeyError(snapshot['format'])
+        snapshots = list(generate_snapshots(300))
+        report = compare(wrong_architecture, snapshots, fields=['architecture', 'version'])
+        expected = [index for index, snapshot in enumerate(snapshots) if classify(snapshot).architecture == 'x86']
+        self.assertEqual(report.mismatch_count, len(expected))
+        self.assertEqual([mismatch.index for mismatch in report.mismatches], expected[:MAX_MISMATCHES])
+        self.assertEqual((report.mismatches[0].expected, report.mismatches[0].actual), ('x86', 'x64'))
+        report = compare(wrong_errors, snapshots[:5] + [dict(format=0)])
+        self.assertEqual(report.mismatch_count, 6)
+        self.assertEqual(report.mismatches[-1].field, 'error')
+        self.assertEqual((report.mismatches[-1].expected, report.mismatches[-1].actual), ('ValueError', 'KeyError'))
+        self.assertIn("6 mismatching", str(report))
+
+
+class DaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        import sys
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import path
+        from .backends import ReplayBackend
+        if sys.platform == 'win32':
+            raise unittest.SkipTest("the tests use a Unix socket")
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        self.address = path.join(directory, "winver.sock")
+        self.backend = ReplayBackend(SNAPSHOTS[0]['snapshot'])
+
+    def _server(self, **kwargs):
+        from .daemon import DetectionServer
+        server = DetectionServer(self.address, self.backend, **kwargs).start()
+        self.addCleanup(server.close)
+        return server
+
+    def _client(self, **kwargs):
+        from .daemon import DetectionClient
+        client = DetectionClient(self.address, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_requests(self):
+        from .batch import classify
+        self._server()
+        client = self._client()
+        self.assertTrue(client.ping())
+        self.assertEqual(client.get_result(), classify(SNAPSHOTS[0]['snapshot']))
+        self.assertTrue(client.check("Windows Server 2012+ and server_core"))
+        self.assertFalse(client.check("x86"))
+        self.assertRaises(ValueError, client.check, "Windows 95")
+        self.assertRaises(ValueError, client.request, b'X')
+        client.invalidate()
+        self.assertEqual(client.get_result().version, 'Windows Server 2012 R2')
+        self.assertEqual(client.fallbacks, 0)
+
+    def test_pool(self):
+        import threading
+        server = self._server()
+        client = self._client(pool_size=2)
+        for _ in range(20):
+            client.get_result()
+        self.assertEqual(server.accepted, 1)
+        # four requests at the same time: the pooled connection and three new ones, two of which are kept
+        connections = [client._connect()[0] for _ in range(4)]  # pylint: disable-msg=W0212
+        for connection in connections:
+            client._release(connection)  # pylint: disable-msg=W0212
+        self.assertEqual(len(client._pool), 2)  # pylint: disable-msg=W0212
+        self.assertEqual(server.accepted, 4)
+        for _ in range(20):
+            client.get_result()
+        self.assertEqual(server.accepted, 4)
+        errors = []
+
+        def work():
+            try:
+                for _ in range(50):
+                    self.assertEqual(client.get_result().edition, 'Datacenter')
+            except Exception as error:  # pylint: disable-msg=W0703
+                errors.append(error)
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(client._pool), 2)  # pylint: disable-msg=W0212
+
+    def test_restarted_daemon(self):
+        # the pooled connection to the first daemon is dead, the request is sent again on a new one
+        server = self._server()
+        client = self._client(fallback=False)
+        client.get_result()
+        self.assertEqual(len(client._pool), 1)  # pylint: disable-msg=W0212
+        server.close()
+        server = self._server()
+        client.get_result()
+        self.assertEqual((server.accepted, client.fallbacks), (1, 0))
+
+    def test_authentication(self):
+        import os
+        from .daemon import get_authkey
+        self._server()
+        self.assertEqual(os.stat(self.address + '.key').st_mode & 0o777, 0o600)
+        self.assertEqual(len(get_authkey(self.address)), 32)
+        self.assertFalse(self._client(authkey=b'not the key').ping())
+        self.assertTrue(self._client(authkey=get_authkey(self.address)).ping())
+        os.chmod(self.address + '.key', 0o644)
+        self.assertFalse(self._client().ping())
+
+    def test_invalidate_interval(self):
+        server = self._server()
+        client = self._client()
+        client.invalidate()
+        client.invalidate()
+        self.assertEqual(server.detections, 1)
+        server.invalidate_interval = 0
+        client.invalidate()
+        self.assertEqual(server.detections, 2)
+
+    def test_default_address(self):
+        import os
+        from os import path
+        from .daemon import get_default_address, DaemonUnavailable, DetectionServer
+        runtime = path.dirname(self.address)
+        with mock.patch.dict(os.environ, XDG_RUNTIME_DIR=runtime):
+            self.assertEqual(get_default_address(), path.join(runtime, 'infi.winver', 'daemon.sock'))
+            self.assertEqual(os.stat(path.join(runtime, 'infi.winver')).st_mode & 0o777, 0o700)
+            os.chmod(path.join(runtime, 'infi.winver'), 0o777)
+            self.assertRaises(DaemonUnavailable, get_default_address)
+        os.chmod(runtime, 0o755)
+        self.assertRaises(DaemonUnavailable, DetectionServer, self.address, self.backend)
+
+    def test_fallback(self):
+        from .batch import classify
+        from .daemon import DaemonUnavailable
+        client = self._client(backend=self.backend)
+        self.assertFalse(client.ping())
+        self.assertEqual(client.get_result(), classify(SNAPSHOTS[0]['snapshot']))
+        self.assertTrue(client.check("server_core"))
+        self.assertEqual(client.fallbacks, 2)
+        self.assertRaises(DaemonUnavailable, self._client(fallback=False).get_result)
+        server = self._server()
+        self.assertTrue(client.check("server_core"))
+        self.assertEqual(client.fallbacks, 2)
+        server.close()
+        self.assertEqual(client.get_result().version, 'Windows Server 2012 R2')
+        self.assertEqual(client.fallbacks, 3)
+
+    def test_stale_socket(self):
+        import socket
+        from .daemon import DaemonUnavailable, DetectionServer
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.address)
+        stale.close()
+        self._server()
+        self.assertTrue(self._client().ping())
+        self.assertRaises(DaemonUnavailable, DetectionServer, self.address, self.backend)
+
+    def test_not_a_socket(self):
+        from .daemon import DaemonUnavailable, DetectionServer
+        with open(self.address, 'w') as fd:
+            fd.write('data')
+        self.assertRaises(DaemonUnavailable, DetectionServer, self.address, self.backend)
+        with open(self.address) as fd:
+            self.assertEqual(fd.read(), 'data')
@@ -0,0 +1,132 @@
+# WindowsVersion is a comparable, hashable value for Windows versions, ordered the way greater_than orders them:
+# * versions before Windows 10 are ordered by (major, minor). workstation and server versions that share the same
+#   major/minor (e.g. Windows 7 and Windows Server 2008 R2) are equal
+# * Windows 10 / Server 2016 and later are 10.0, and are ordered by release id and then by the first build of their
+#   release in the release table (see releases.py), which tells the releases that share release id 2009 apart
+# instances are interned: equal versions are the same object, so they are cheap to keep in large collections
+from . import releases
+
+_interned = {}
+
+# name -> instance, for names that were already looked up. cleared when the release table changes
+_by_name = {}
+
+# (release table, names that are not in name_to_version: name -> key), computed from the release table on first use
+_release_names = (None, None)
+
+
+class WindowsVersion(object):
+    __slots__ = ('_key', '__weakref__')
+
+    def __new__(cls, version):
+        # "version" is a name (e.g. "Windows Server 2019"), or a tuple (major, minor[, release_id[, build]])
+        if not isinstance(version, tuple):
+            _get_release_names()
+            instance = _by_name.get(version)
+            if instance is not None:
+                return instance
+        key = _get_key(version)
+        instance = _interned.get(key)
+        if instance is None:
+            instance = object.__new__(cls)
+            object.__setattr__(instance, '_key', key)
+            instance = _interned.setdefault(key, instance)
+        if not isinstance(version, tuple):
+            _by_name[version] = instance
+        return instance
+
+    def __setattr__(self, name, value):
+        raise AttributeError("WindowsVersion is immutable")
+
+    def __reduce__(self):
+        return (WindowsVersion, (self._key,))
+
+    @property
+    def major(self):
+        return self._key[0]
+
+    @property
+    def minor(self):
+        return self._key[1]
+
+    @property
+    def release_id(self):
+        return self._key[2]
+
+    @property
+    def build(self):
+        return self._key[3]
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        if not isinstance(other, WindowsVersion):
+            return NotImplemented
+        return self._key == other._key
+
+    def __ne__(self, other):
+        if not isinstance(other, WindowsVersion):
+            return NotImplemented
+        return self._key != other._key
+
+    def __lt__(self, other):
+        if not isinstance(other, WindowsVersion):
+            return NotImplemented
+        return self._key < other._key
+
+    def __le__(self, other):
+        if not isinstance(other, WindowsVersion):
+            return NotImplemented
+        return self._key <= other._key
+
+    def __gt__(self, other):
+        if not isinstance(other, WindowsVersion):
+            return NotImplemented
+        return self._key > other._key
+
+    def __ge__(self, other):
+        if not isinstance(other, WindowsVersion):
+            return NotImplemented
+        return self._key >= other._key
+
+    def __repr__(self):
+        return "WindowsVersion({!r})".format(self._key)
+
+    def __str__(self):
+        return ".".join(str(item) for item in self._key)
+
+
+def _get_key(version):
+    if isinstance(version, tuple):
+        if not 2 <= len(version) <= 4:
+            raise ValueError("Invalid Windows version {!r}".format(version))
+        return tuple(int(item) for item in version) + (0,) * (4 - len(version))
+    from . import name_to_version
+    if version in name_to_version:
+        compared_version = name_to_version[version]
+        if compared_version[0] < 10:
+            # values before Windows 10 may have the product type in position 2, it is not part of the version
+            compared_version = compared_version[:2]
+        return _get_key(compared_version)
+    key = _get_release_names().get(version)
+    if key is None:
+        raise ValueError("Could not find OS name {}".format(version))
+    return key
+
+
+def _get_release_names():
+    global _release_names
+    table, names = _release_names
+    if table is not releases.get_release_table():
+        _by_name.clear()
+        table, names = releases.get_release_table(), {}
+        for version, release_id, first_build in table.get_releases():
+            names.setdefault(version, (10, 0, release_id, first_build))
+        _release_names = table, names
+    return names
+
+
+def get_windows10_version(product_type, release_id, build_number):
+    # the version of a Windows 10 / Server 2016 and later host
+    return WindowsVersion((10, 0) + releases.get_release_table().get_release_key(product_type, release_id, build_number))
@@ -21,10 +21,13 @@ class TestWinver(unittest.TestCase):
         self.assertIsInstance(windows.is_windows_7(), bool)
         self.assertIsInstance(windows.is_windows_8(), bool)
         self.assertIsInstance(windows.is_windows_10(), bool)
+        self.assertIsInstance(windows.is_windows_11(), bool)
         self.assertIsInstance(windows.is_windows_2012(), bool)
         self.assertIsInstance(windows.is_windows_2012_r2(), bool)
         self.assertIsInstance(windows.is_windows_2016(), bool)
         self.assertIsInstance(windows.is_windows_2019(), bool)
+        self.assertIsInstance(windows.is_windows_2022(), bool)
+        self.assertIsInstance(windows.is_windows_2025(), bool)
         self.assertIsInstance(windows.is_x86(), bool)
         self.assertIsInstance(windows.is_x64(), bool)
         self.assertIsInstance(windows.is_ia64(), bool)